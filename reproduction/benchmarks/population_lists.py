@@ -0,0 +1,154 @@
+'''
+Benchmark of population list operations
+
+Replays the population list operations made as patients progress through
+COVID infection (negative -> positive -> inpatient -> recovered/died), as in
+Patient.patient_virus_progress and AllocatePatients.remove_patient, for a
+population scaled up from data/patients.csv. Compares plain Python lists with
+the PatientList used by Population.
+
+Run from the reproduction/ folder:
+
+    python -m benchmarks.population_lists
+'''
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from sim.model import PatientList
+
+
+class SyntheticPatient:
+    '''Minimal stand-in for Patient (holds the patient data row only)'''
+
+    def __init__(self, patient_id, location, site):
+        self.patient_id = patient_id
+        self.location = location
+        self.site = site
+
+
+def synthetic_population(number_of_patients, random_seed=0):
+    '''
+    Create synthetic patients by sampling (with replacement) rows of
+    data/patients.csv and assigning new patient IDs.
+
+    Parameters
+    ----------
+    number_of_patients : int
+        Number of patients to create.
+    random_seed : int, optional
+        Seed for row sampling. The default is 0.
+
+    Returns
+    -------
+    list
+        List of SyntheticPatient objects.
+    '''
+    patient_data = pd.read_csv('data/patients.csv')
+    rng = np.random.default_rng(random_seed)
+    rows = rng.integers(0, len(patient_data), size=number_of_patients)
+    locations = patient_data['Postcode sector'].values[rows]
+    sites = patient_data['Site'].values[rows]
+    return [SyntheticPatient(i, locations[i], sites[i])
+            for i in range(number_of_patients)]
+
+
+def replay_progression(patients, container, random_seed=0):
+    '''
+    Replay population list operations for progression of 80% of patients
+    through infection (60% of positives needing inpatient care, 15% dying).
+
+    Parameters
+    ----------
+    patients : list
+        Patients to load.
+    container : class
+        Collection type for population lists (list or PatientList).
+    random_seed : int, optional
+        Seed for order of infection and outcomes. The default is 0.
+
+    Returns
+    -------
+    float
+        Run time (seconds).
+    '''
+    rng = np.random.default_rng(random_seed)
+    infected = rng.permutation(len(patients))[:int(0.8 * len(patients))]
+    inpatient = rng.uniform(size=len(infected)) < 0.6
+    died = rng.uniform(size=len(infected)) < 0.15
+
+    start = time.perf_counter()
+
+    negative = container()
+    positive = container()
+    recovered = container()
+    died_patients = container()
+    inpatients = container()
+    unallocated = container()
+    displaced = container()
+
+    # Initial load (1 in 10 patients displaced)
+    for patient in patients:
+        negative.append(patient)
+        if patient.patient_id % 10 == 0:
+            displaced.append(patient)
+
+    # Patients become positive
+    for index in infected:
+        patient = patients[index]
+        negative.remove(patient)
+        if patient in displaced:
+            displaced.remove(patient)
+        if patient in unallocated:
+            unallocated.remove(patient)
+        positive.append(patient)
+
+    # End of positive period (and inpatient stay)
+    for number, index in enumerate(infected):
+        patient = patients[index]
+        positive.remove(patient)
+        if patient in unallocated:
+            unallocated.remove(patient)
+        if inpatient[number]:
+            inpatients.append(patient)
+            inpatients.remove(patient)
+        if died[number]:
+            died_patients.append(patient)
+        else:
+            recovered.append(patient)
+
+    return time.perf_counter() - start
+
+
+def run_benchmark(population_sizes=(521, 5000, 20000, 50000)):
+    '''
+    Time replayed population list operations using lists and PatientList.
+
+    Parameters
+    ----------
+    population_sizes : tuple, optional
+        Numbers of patients to benchmark.
+
+    Returns
+    -------
+    results : DataFrame
+        Run time (seconds) by population size and container.
+    '''
+    results = []
+    for number_of_patients in population_sizes:
+        patients = synthetic_population(number_of_patients)
+        list_time = replay_progression(patients, list)
+        indexed_time = replay_progression(patients, PatientList)
+        results.append({'patients': number_of_patients,
+                        'list': list_time,
+                        'PatientList': indexed_time,
+                        'speed_up': list_time / indexed_time})
+        print(f'{number_of_patients} patients: list {list_time:.3f}s, '
+              f'PatientList {indexed_time:.3f}s')
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,111 @@
+'''
+Benchmark of weekly reallocation modes
+
+Runs the model with full (remove and re-allocate all patients),
+incremental (only displaced patients and sessions they could move back into)
+and optimal (min-cost assignment of COVID negative patients) weekly
+reallocation, for the same random number sets. Compares time spent in
+weekly reallocation and total run time, and displaced patient outcomes
+(number of displaced patients and additional travel time, averaged over days).
+
+Run from the reproduction/ folder:
+
+    python -m benchmarks.reallocation
+'''
+
+import time
+
+import pandas as pd
+
+from sim.inputs import ModelInputs
+from sim.model import DialysisSim
+from sim.parameters import Scenario
+
+
+# DialysisSim method called for weekly reallocation in each mode
+REALLOCATION_METHODS = {'full': 'rebuild_allocation',
+                        'incremental': 'reallocate_displaced_patients',
+                        'optimal': 'optimise_allocation'}
+
+
+def timed(method, timings):
+    '''Wrap method so that the run time of each call is added to timings'''
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+        return result
+
+    return wrapper
+
+
+def run_model(reallocation_mode, random_number_set, inputs, run_length=150):
+    '''
+    Run model with given reallocation mode.
+
+    Parameters
+    ----------
+    reallocation_mode : str
+        'full', 'incremental' or 'optimal'.
+    random_number_set : int
+        Random number set for run.
+    inputs : ModelInputs
+        Model input data.
+    run_length : int, optional
+        Run length (days). The default is 150.
+
+    Returns
+    -------
+    dict
+        Run times and displaced patient outcomes.
+    '''
+    scenario = Scenario(run_length=run_length, reallocation_mode=reallocation_mode,
+                        proportion_pos_requiring_inpatient=0.6)
+    scenario.set_random_no_set(random_number_set)
+
+    start = time.perf_counter()
+    model = DialysisSim(scenario, inputs)
+    timings = []
+    method = REALLOCATION_METHODS[reallocation_mode]
+    setattr(model, method, timed(getattr(model, method), timings))
+    model.run()
+    run_time = time.perf_counter() - start
+
+    displaced = model.audit.displaced_audit
+    return {'mode': reallocation_mode,
+            'random_number_set': random_number_set,
+            'reallocations': len(timings),
+            'reallocation_time': sum(timings),
+            'run_time': run_time,
+            'displaced_mean': displaced['number'].mean(),
+            'add_time_total_mean': displaced['add_time_total'].fillna(0).mean()}
+
+
+def run_benchmark(random_number_sets=range(2700, 2710)):
+    '''
+    Run model with each reallocation mode for each random number set.
+
+    Parameters
+    ----------
+    random_number_sets : iterable, optional
+        Random number sets to run. The default is 2700-2709.
+
+    Returns
+    -------
+    summary : DataFrame
+        Mean run times and displaced patient outcomes by reallocation mode.
+    '''
+    inputs = ModelInputs.load()
+    results = []
+    for random_number_set in random_number_sets:
+        for mode in REALLOCATION_METHODS:
+            results.append(run_model(mode, random_number_set, inputs))
+    results = pd.DataFrame(results)
+    summary = results.groupby('mode').mean().drop(columns='random_number_set')
+    print(summary.to_string())
+    return summary
+
+
+if __name__ == '__main__':
+    run_benchmark()
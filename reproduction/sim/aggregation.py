@@ -0,0 +1,588 @@
+'''
+Contains functions to aggregate audits across replications. Audits are
+reshaped into dense NumPy arrays (replications x days [x units] x metrics),
+and summary statistics across replications are single reductions over the
+replication axis. Summaries have the same shape as pivot tables of audits
+(index day [and master unit], columns (statistic, metric)).
+
+Summaries may also be kept online, adding each replication as it completes
+(ReplicationSummary, using RunningStatistics and QuantileSketch).
+'''
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+# Summary statistics across replications (named as in pivot tables using
+# np.median, np.min and np.max). NaN-ignoring versions are used if any audit
+# results are missing (NaN), as these are slower.
+SUMMARY_FUNCTIONS = {'median': np.median, 'amin': np.min, 'amax': np.max}
+NAN_SUMMARY_FUNCTIONS = {'median': np.nanmedian, 'amin': np.nanmin, 'amax': np.nanmax}
+
+# Metrics summarised for each audit (audits in order returned by a model run)
+SUMMARY_METRICS = {
+    'patient': ['negative','positive', 'recovered', 'inpatient', 'died', 'unallocated'],
+    'unit': ['negative','positive', 'recovered','neg+rec', 'total'],
+    'displaced': ['number','add_time_min', 'add_time_1Q', 'add_time_median', 'add_time_3Q',
+                  'add_time_max', 'add_time_total'],
+    'inpatient': ['inpatients']}
+
+
+def dense_audit(audit, keys, metrics):
+    """
+    Reshape audit into a dense array, with one axis for each key column (in
+    sorted order of key values) and a last axis for metrics. Key combinations
+    not in the audit are NaN.
+
+    Parameters
+    ----------
+    audit : DataFrame
+        Audit (one row per combination of keys).
+    keys : list
+        Key columns, e.g. [replication, 'day', 'subunit'].
+    metrics : list
+        Metric columns.
+
+    Returns
+    -------
+    array : NumPy array (float64)
+        Dense array of metrics (keys x metrics).
+    labels : list of pandas Index
+        Sorted values of each key (labels of each key axis).
+    """
+
+    codes = []
+    labels = []
+    for key in keys:
+        key_codes, uniques = pd.factorize(audit[key], sort=True)
+        codes.append(key_codes)
+        # Index from list (infers integer index from nullable integers)
+        labels.append(pd.Index(list(uniques)))
+
+    array = np.full([len(label) for label in labels] + [len(metrics)], np.nan)
+    array[tuple(codes)] = audit[metrics].astype('float').to_numpy()
+
+    return array, labels
+
+
+def sum_by_master_unit(array, subunits, audit):
+    """
+    Sum dense unit audit array over subunits of each master unit.
+
+    Parameters
+    ----------
+    array : NumPy array
+        Dense array (replications x days x subunits x metrics).
+    subunits : pandas Index
+        Subunit of each position on subunit axis.
+    audit : DataFrame
+        Audit with subunit and master_unit columns.
+
+    Returns
+    -------
+    summed : NumPy array
+        Dense array (replications x days x master units x metrics). NaN where
+        no subunits of a master unit are in the audit.
+    master_units : pandas Index
+        Master units (sorted).
+    """
+
+    # Master unit of each subunit
+    lookup = audit[['subunit', 'master_unit']].drop_duplicates('subunit')
+    master_unit_of_subunit = lookup.set_index('subunit')['master_unit'].reindex(subunits)
+    master_unit_codes, master_units = pd.factorize(master_unit_of_subunit, sort=True)
+    one_hot = np.zeros((len(subunits), len(master_units)))
+    one_hot[np.arange(len(subunits)), master_unit_codes] = 1
+
+    # Sum with matrix product over subunit axis (moved to last axis)
+    present = ~np.isnan(array)
+    complete = present.all()
+    values = array if complete else np.where(present, array, 0)
+    summed = np.matmul(np.swapaxes(values, 2, 3), one_hot).swapaxes(2, 3)
+
+    # Restore NaN where there was nothing to sum (sum ignores NaN)
+    if not complete:
+        count = np.matmul(np.swapaxes(present, 2, 3).astype(np.float64), one_hot)
+        summed[count.swapaxes(2, 3) == 0] = np.nan
+
+    return np.ascontiguousarray(summed), pd.Index(list(master_units))
+
+
+def summarise_replications(array, labels, names, metrics):
+    """
+    Summarise dense array across replications (first axis), giving median,
+    minimum and maximum of each metric for each combination of other keys.
+
+    Parameters
+    ----------
+    array : NumPy array
+        Dense array (replications x keys x metrics).
+    labels : list of pandas Index
+        Labels of key axes (after replications).
+    names : list
+        Names of key axes (after replications).
+    metrics : list
+        Metric names (last axis).
+
+    Returns
+    -------
+    DataFrame
+        Summary with index of keys, and columns of (statistic, metric), metrics
+        in sorted order (as pivot_table). Rows with no results are dropped.
+    """
+
+    # Reorder metrics to sorted order
+    order = np.argsort(metrics, kind='stable')
+    array = array[..., order]
+    metrics = [metrics[i] for i in order]
+
+    # Reduce over replications (ignoring NaN; all-NaN results are dropped below)
+    if np.isnan(array).any():
+        functions = NAN_SUMMARY_FUNCTIONS
+    else:
+        functions = SUMMARY_FUNCTIONS
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        results = [function(array, axis=0).reshape(-1, len(metrics))
+                   for function in functions.values()]
+
+    if len(labels) == 1:
+        index = labels[0].rename(names[0])
+    else:
+        index = pd.MultiIndex.from_product(labels, names=names)
+    columns = pd.MultiIndex.from_product([list(SUMMARY_FUNCTIONS), metrics])
+    summary = pd.DataFrame(np.concatenate(results, axis=1), index=index, columns=columns)
+
+    return summary.dropna(how='all')
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch for arrays of values, where each cell of the
+    array receives one value per replication (e.g. one value per day and
+    metric). Values are held in levels: items at level h each stand for 2**h
+    values. When a level reaches capacity its items are sorted (separately for
+    each cell) and every other item is promoted to the next level, so memory is
+    at most capacity items per level (levels grow with log2 of replications /
+    capacity). All cells are compacted together, so each operation is a single
+    array operation. Quantiles are exact until capacity replications are added.
+
+    Object attributes
+    -----------------
+
+    capacity: number of items held at each level before compaction (even)
+    count: number of arrays added
+    levels: list of arrays (items x cell shape), level h items have weight 2**h
+    shape: shape of arrays added
+
+    Methods
+    -------
+
+    add:
+        Add an array of values (one value per cell)
+
+    merge:
+        Add all values from another sketch
+
+    quantile:
+        Estimate quantile of values in each cell
+    """
+
+    def __init__(self, shape, capacity=128):
+        """
+        Constructor for empty sketch.
+
+        Parameters
+        ----------
+        shape : tuple
+            Shape of arrays to be added.
+        capacity : int, optional
+            Items held at each level before compaction. The default is 128.
+        """
+
+        self.shape = tuple(shape)
+        self.capacity = capacity + capacity % 2
+        self.count = 0
+        self.levels = []
+        self._compactions = 0
+
+    def _insert(self, level, items):
+        """Add items (items x cell shape) to level, compacting if full"""
+
+        while len(self.levels) <= level:
+            self.levels.append(np.empty((0,) + self.shape))
+        self.levels[level] = np.concatenate([self.levels[level], items])
+
+        if len(self.levels[level]) >= self.capacity:
+            # Sort items in each cell; keep largest item if odd number of items
+            items = np.sort(self.levels[level], axis=0)
+            kept = len(items) % 2
+            self.levels[level] = items[len(items) - kept:]
+            # Promote every other item (alternating offset to avoid bias)
+            offset = self._compactions % 2
+            self._compactions += 1
+            self._insert(level + 1, items[offset:len(items) - kept:2])
+
+    def add(self, values):
+        """
+        Add an array of values (one value per cell).
+
+        Parameters
+        ----------
+        values : NumPy array
+            Values (sketch shape).
+        """
+
+        self._insert(0, np.asarray(values, dtype=np.float64)[np.newaxis])
+        self.count += 1
+
+    def merge(self, other):
+        """
+        Add all values from another sketch (of the same shape).
+
+        Parameters
+        ----------
+        other : QuantileSketch
+            Sketch to merge.
+        """
+
+        for level, items in enumerate(other.levels):
+            if len(items) > 0:
+                self._insert(level, items)
+        self.count += other.count
+
+    def quantile(self, q):
+        """
+        Estimate quantile of values in each cell. Exact (as numpy.quantile) if
+        no compaction has occurred; otherwise the smallest held item with at
+        least q of the total weight at or below it.
+
+        Parameters
+        ----------
+        q : float
+            Quantile (0-1).
+
+        Returns
+        -------
+        NumPy array
+            Quantile of each cell (sketch shape).
+
+        Raises
+        ------
+        ValueError
+            If no values have been added to sketch.
+        """
+
+        if self.count == 0:
+            raise ValueError('Cannot estimate quantile of empty sketch')
+
+        if len(self.levels) <= 1:
+            return np.quantile(self.levels[0], q, axis=0)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, axis=0)
+        sorted_items = np.take_along_axis(items, order, axis=0)
+        cumulative_weights = np.cumsum(weights[order], axis=0)
+        position = (cumulative_weights < q * weights.sum()).sum(axis=0, keepdims=True)
+        position = np.minimum(position, len(items) - 1)
+
+        return np.take_along_axis(sorted_items, position, axis=0)[0]
+
+
+class RunningStatistics:
+    """
+    Running statistics of arrays of values, where each cell of the array
+    receives one value per replication: mean and variance (Welford's algorithm),
+    minimum, maximum and quantiles (QuantileSketch). Statistics from separate
+    sets of replications may be merged.
+
+    Object attributes
+    -----------------
+
+    count: number of arrays added
+    maximum: maximum of each cell
+    mean: mean of each cell
+    minimum: minimum of each cell
+    sketch: QuantileSketch of values
+    sum_squares: sum of squared differences from mean of each cell
+
+    Methods
+    -------
+
+    add:
+        Add an array of values (one value per cell)
+
+    merge:
+        Add statistics from another RunningStatistics object
+
+    quantile:
+        Estimate quantile of each cell
+
+    std:
+        Sample standard deviation of each cell
+
+    variance:
+        Sample variance of each cell
+    """
+
+    def __init__(self, shape, capacity=128):
+        """
+        Constructor for empty statistics.
+
+        Parameters
+        ----------
+        shape : tuple
+            Shape of arrays to be added.
+        capacity : int, optional
+            Capacity of each level of quantile sketch. The default is 128.
+        """
+
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.sum_squares = np.zeros(shape)
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+        self.sketch = QuantileSketch(shape, capacity)
+
+    def add(self, values):
+        """
+        Add an array of values (one value per cell).
+
+        Parameters
+        ----------
+        values : NumPy array
+            Values (shape of statistics).
+        """
+
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.sum_squares += delta * (values - self.mean)
+        np.minimum(self.minimum, values, out=self.minimum)
+        np.maximum(self.maximum, values, out=self.maximum)
+        self.sketch.add(values)
+
+    def merge(self, other):
+        """
+        Add statistics from another RunningStatistics object (Chan et al.
+        parallel update of mean and variance).
+
+        Parameters
+        ----------
+        other : RunningStatistics
+            Statistics to merge.
+        """
+
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.sum_squares += other.sum_squares + delta ** 2 * self.count * other.count / count
+        self.count = count
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.sketch.merge(other.sketch)
+
+    def quantile(self, q):
+        """Estimate quantile (0-1) of each cell (see QuantileSketch)"""
+
+        return self.sketch.quantile(q)
+
+    def std(self):
+        """Sample standard deviation of each cell (NaN if fewer than 2 values)"""
+
+        return np.sqrt(self.variance())
+
+    def variance(self):
+        """Sample variance of each cell (NaN if fewer than 2 values)"""
+
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        return self.sum_squares / (self.count - 1)
+
+
+class ReplicationSummary:
+    """
+    Online summary of replication audits for a scenario. Each replication's
+    audits are added as it completes (or read from a ReplicationStore), keeping
+    running statistics for each audit by day (and master unit for unit and
+    inpatient audits), so memory does not grow with number of replications
+    (except for the slow growth of quantile sketches). Summaries from separate
+    sets of replications (e.g. from worker processes) may be merged, and
+    summaries may be inspected at any time.
+
+    Object attributes
+    -----------------
+
+    capacity: capacity of each level of quantile sketches
+    labels: dictionary of labels (days [and master units]) for each audit
+    quantiles: quantiles included in summaries (other than median)
+    replications: set of replication numbers added
+    statistics: dictionary of RunningStatistics for each audit
+
+    Methods
+    -------
+
+    add_replication:
+        Add audits of one replication
+
+    empty_like:
+        New empty summary with same settings
+
+    merge:
+        Add replications from another summary
+
+    summary:
+        DataFrame of summary statistics for an audit
+
+    update_from_store:
+        Add replications in a ReplicationStore not already added
+    """
+
+    def __init__(self, quantiles=(0.05, 0.25, 0.75, 0.95), capacity=128):
+        """
+        Constructor for empty summary.
+
+        Parameters
+        ----------
+        quantiles : tuple, optional
+            Quantiles to include in summaries (median is always included). The
+            default is (0.05, 0.25, 0.75, 0.95).
+        capacity : int, optional
+            Capacity of each level of quantile sketches. The default is 128.
+        """
+
+        self.quantiles = tuple(quantiles)
+        self.capacity = capacity
+        self.labels = dict()
+        self.replications = set()
+        self.statistics = dict()
+
+    def _dense_replication_audit(self, audit_name, audit):
+        """Dense array (days [x master units] x metrics) and labels of one audit"""
+
+        metrics = SUMMARY_METRICS[audit_name]
+        if audit_name in ['unit', 'inpatient']:
+            array, labels = dense_audit(audit, ['day', 'subunit'], metrics)
+            array, master_units = sum_by_master_unit(array[np.newaxis], labels[1], audit)
+            return array[0], [labels[0], master_units]
+        array, labels = dense_audit(audit, ['day'], metrics)
+        return array, labels
+
+    def add_replication(self, audits, rep=None):
+        """
+        Add audits of one replication.
+
+        Parameters
+        ----------
+        audits : tuple of DataFrame
+            Patient, unit, displaced and inpatient audits of replication (as
+            produced by a model run).
+        rep : int, optional
+            Replication number (recorded so that replications in a store are
+            only added once). The default is None.
+        """
+
+        for audit_name, audit in zip(SUMMARY_METRICS, audits):
+            array, labels = self._dense_replication_audit(audit_name, audit)
+            if audit_name not in self.statistics:
+                self.labels[audit_name] = labels
+                self.statistics[audit_name] = RunningStatistics(array.shape, self.capacity)
+            elif not all(label.equals(other) for label, other in
+                         zip(labels, self.labels[audit_name])):
+                raise ValueError(
+                    f'{audit_name} audit days/units differ from previous replications')
+            self.statistics[audit_name].add(array)
+        if rep is not None:
+            self.replications.add(rep)
+
+    def empty_like(self):
+        """New empty summary with same quantiles and sketch capacity"""
+
+        return ReplicationSummary(self.quantiles, self.capacity)
+
+    def merge(self, other):
+        """
+        Add replications from another summary (with same days and units).
+
+        Parameters
+        ----------
+        other : ReplicationSummary
+            Summary to merge.
+        """
+
+        for audit_name, statistics in other.statistics.items():
+            if audit_name not in self.statistics:
+                self.labels[audit_name] = other.labels[audit_name]
+                self.statistics[audit_name] = RunningStatistics(
+                    statistics.mean.shape, self.capacity)
+            self.statistics[audit_name].merge(statistics)
+        self.replications |= other.replications
+
+    def summary(self, audit_name):
+        """
+        DataFrame of summary statistics for an audit, with the same shape as
+        pivots of EndTrialAnalysis: index of day (and master_unit for unit and
+        inpatient audits), columns of (statistic, metric). Statistics are
+        count, mean, std, median, amin, amax, and quantiles (e.g. 'q0.05').
+
+        Parameters
+        ----------
+        audit_name : str
+            'patient', 'unit', 'displaced' or 'inpatient'.
+
+        Returns
+        -------
+        DataFrame
+            Summary statistics.
+        """
+
+        statistics = self.statistics[audit_name]
+        labels = self.labels[audit_name]
+        results = {'count': np.full(statistics.mean.shape, statistics.count, dtype=np.float64),
+                   'mean': statistics.mean,
+                   'std': statistics.std(),
+                   'median': statistics.quantile(0.5),
+                   'amin': statistics.minimum,
+                   'amax': statistics.maximum}
+        for q in self.quantiles:
+            results[f'q{q:g}'] = statistics.quantile(q)
+
+        metrics = SUMMARY_METRICS[audit_name]
+        if len(labels) == 1:
+            index = labels[0].rename('day')
+        else:
+            index = pd.MultiIndex.from_product(labels, names=['day', 'master_unit'])
+        columns = pd.MultiIndex.from_product([list(results), metrics])
+        values = np.concatenate(
+            [result.reshape(-1, len(metrics)) for result in results.values()], axis=1)
+
+        return pd.DataFrame(values, index=index, columns=columns)
+
+    def update_from_store(self, store):
+        """
+        Add replications in a ReplicationStore that have not already been added
+        (e.g. to inspect progress while replications are running).
+
+        Parameters
+        ----------
+        store : ReplicationStore
+            Store of replication audits.
+
+        Returns
+        -------
+        int
+            Number of replications added.
+        """
+
+        added = 0
+        for rep in store.replications():
+            if rep not in self.replications:
+                self.add_replication(store.load_replication(rep), rep)
+                added += 1
+
+        return added
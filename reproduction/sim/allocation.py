@@ -1,5 +1,19 @@
+import numpy as np
 import pandas as pd
 
+from .assignment import solve_transportation
+
+# Sessions available at each subunit (column order of the session state store)
+SESSIONS = ['Mon_1', 'Mon_2', 'Mon_3', 'Tues_1', 'Tues_2', 'Tues_3']
+
+# Days of week with sessions (first part of session names)
+DAYS = ['Mon', 'Tues']
+
+# Integer codes for session status ('x' = session closed)
+SESSION_STATUS = ['negative', 'positive', 'recovered', 'x']
+STATUS_CODE = {status: code for code, status in enumerate(SESSION_STATUS)}
+
+
 class AllocatePatients:
     """A collection of methods to allocate patients to units and shifts
     
@@ -8,17 +22,39 @@ class AllocatePatients:
     
     _params: Reference to sceanrio paramters object
     _pop: Reference to model patient population object   
+    capacity_version: List (by session status) of counters increased whenever free capacity
+        for that status may increase (used to check validity of search cursors)
     count_day_swaps: Number of times patients have had to change sessions    
     count_total_patients: total patients loaded  
     count_status: Number of sessions allocated to COVID negative/positive patients
-    inpatient_counts: Count of inpatients at each subunit
+    chairs: NumPy array (int32) of number of chairs in each subunit
+    free_session_count: NumPy array (int32, status x session) of number of subunits with a
+        free chair in each session, by session status (free-capacity index)
+    inpatient_count: NumPy array (int32) of count of inpatients at each subunit
+    initial_session_status: NumPy array (int8, subunit x session) of session status codes at
+        start of run (restored by reset)
     inpatient_units: List of whether subunits accept inpatients 
+    session_count: NumPy array (int32, subunit x session) of patients allocated to each session
+    patient_session: dictionary, key=patient, value=(subunit row, session column) of the
+        session the patient is allocated to (membership index)
+    session_index: dictionary, key=session name, value=column in session arrays
+    session_patients: nested list (subunit x session) of dictionaries (used as ordered sets)
+        of patients allocated to each session (membership index)
+    session_status: NumPy array (int8, subunit x session) of session status codes
     travel_times: DataFrame of travel times from patient postcode sector to each unit
-    unit_chairs: Number of chairs in each unit (or subunit)
+    unit_index: dictionary, key=subunit name, value=row in session arrays
     unit_list: List of all units (or subunit (where unit is split))
     unit_location_lookup: dictionary, key=subunit name, value=subunit postcode
     unit_order_by_patient_postcode: List of units ordered by proximity to patient postcode
     unit_order_given: List of preferred order of subunits for COVID-positive patients
+    unit_free_session_count: NumPy array (int32, status x subunit) of number of sessions
+        with a free chair at each subunit, by session status (free-capacity index)
+    unit_order_lookup: dictionary, key=patient postcode, value=list of units by proximity
+    
+    DataFrame views (built from the session arrays on request, read only):
+    
+    inpatient_counts: Count of inpatients at each subunit
+    unit_chairs: Number of chairs in each unit (or subunit)
     unit_sessions: A DataFrame of status of each subunit/session (negative/positive/closed)
     unit_sessions_count: DataFrame on number of aptients allocated to each subunit/session
     
@@ -35,18 +71,59 @@ class AllocatePatients:
     allocate_inpatient:
         Allocate a COVID +ve patient to inpatient care when necessary
         
+    allocate_many:
+        Allocate patients to sessions (as allocate_patient), sharing search cursors between
+        patients with the same search order
+        
+    add_patient_to_session:
+        Add patient to session membership index
+        
     allocate_patient: 
         Allocates patients to sessions. Calls appropriate method for patient
         COVID status. Adds travel time for patients.
+        
+    allocate_patients_min_cost:
+        Allocate COVID -ve/recovered patients to minimise total additional travel time
+        
+    allocate_to_location:
+        Allocate a COVID -ve/recovered patient to a session on a given day at a given location
+    
+    build_free_capacity_index:
+        Build index of sessions with free chairs from session status and counts
     
     check_availability_in_session:
         Checks availability in a list of sessions
         
+    discharge_inpatient:
+        Remove a patient from inpatient counts at end of inpatient stay
+        
+    get_patients_in_session:
+        List patients currently allocated to a subunit session
+        
+    has_free_capacity:
+        Checks free-capacity index for any free chair in a list of sessions
+        
     load_patient:
         Inital load of patients into system
         
+    load_patients:
+        Inital load of patients into system (batched, using allocate_many)
+        
     remove_patient:
         Remove patient from appropriate counts and lists
+        
+    remove_patient_from_session:
+        Remove patient from session membership index
+        
+    reset:
+        Reset session states, counts and membership indexes to start of run (for a new
+        population), keeping unit information and preferences
+        
+    search_sessions:
+        Check units for a free chair in a session, in search order, until patient allocated
+        
+    set_session_state:
+        Update status and/or patient count of a session (maintains free-capacity index)
     
 
     """
@@ -76,56 +153,100 @@ class AllocatePatients:
         units_input = _units.unit_info
         
         self.unit_list = list(units_input['subunit']) + ['HOME']
-        unit_chairs = list(units_input['Chairs']) + [9999]
+        self.unit_index = {unit: index for index, unit in enumerate(self.unit_list)}
+        self.session_index = {session: index for index, session in enumerate(SESSIONS)}
         
         self.unit_location_lookup = _units.location_lookup
         self.travel_times = _units.travel_times
+        
+        # Array of travel times (avoids DataFrame lookups when allocating patients)
+        self.travel_time_array = _units.travel_time_array
+        self.travel_time_location_index = _units.travel_time_location_index
+        self.travel_time_unit_index = _units.travel_time_unit_index
 
         self.inpatient_units = units_input[['subunit', 'inpatient']]
         self.inpatient_units.set_index('subunit', inplace=True)
-        
+        self.accepts_inpatients = np.append(units_input['inpatient'].values == 1, False)
         
         # Set up units. Start by allocating all shifts -ve (and shift 4 closed)
-        self.unit_sessions = pd.DataFrame(index=self.unit_list)
-        
-        # set up available shifts (avalable shifts all set to 'neg).Miss out home location.
-        # Create columns for shifts and set all to negative
-        self.unit_sessions = self.unit_sessions.assign(Mon_1 = 'negative', Mon_2 = 'negative', 
-                Mon_3 = 'negative', Tues_1 = 'negative', Tues_2 = 'negative', Tues_3 = 'negative')
+        number_of_units = len(self.unit_list)
+        self.initial_session_status = np.full(
+            (number_of_units, len(SESSIONS)), STATUS_CODE['negative'], dtype=np.int8)
         
         # Close unit shifts where not available (read from input sheet, avoid 'last entry of HOME')
         if self._params.open_all_sessions == False:
-            for subunit in self.unit_list[0:-1]:
-                unit_info = units_input[units_input['subunit'] == subunit]
-                for session in ['Mon_1', 'Mon_2', 'Mon_3', 'Tues_1', 'Tues_2', 'Tues_3']:
-                    if unit_info[session].values != 1:
-                        # Session closed (not available)
-                        self.unit_sessions.loc[subunit][session] = 'x'
+            closed = units_input[SESSIONS].values != 1
+            self.initial_session_status[:-1][closed] = STATUS_CODE['x']
         
-        # Set numebr of chairs in each subunit                
-        self.unit_chairs = pd.DataFrame(index=self.unit_list)
-        self.unit_chairs['chairs'] = unit_chairs
+        # Set number of chairs in each subunit (HOME is effectively unlimited)
+        self.chairs = np.append(units_input['Chairs'].values, 9999).astype(np.int32)
         
-        # Set up patient counter table
-        self.unit_sessions_count = self.unit_sessions.copy()
-        self.unit_sessions_count[['Mon_1', 'Mon_2', 'Mon_3', 'Tues_1', 'Tues_2', 'Tues_3']] = 0
+        # Unit preferences
+        self.unit_order_by_patient_postcode = _units.unit_preferences
+        self.unit_order_given = _units.given_order
+        subunits = self.unit_list[:number_of_units]
+        self.unit_order_lookup = {
+            location: [subunits[i] for i in preferences]
+            for location, preferences in zip(self.unit_order_by_patient_postcode.index,
+                                             _units.unit_preference_index.tolist())}
         
-        # Overall counts
-        self.count_total_patients = 0
-        self.count_status = {'negative': 0, 'positive': 0, 'recovered': 0, 'died': 0}
-        self.count_day_swaps = 0
+        # Set up session states, counts and membership indexes
+        self.reset(_pop)
         
-        # Inpatient counts
-        self.inpatient_counts = pd.DataFrame(index=self.unit_list)
-        self.inpatient_counts['inpatients'] = 0
+    
+    @property
+    def inpatient_counts(self):
+        """DataFrame view of count of inpatients at each subunit."""
         
+        return pd.DataFrame({'inpatients': self.inpatient_count}, index=self.unit_list)
+    
+    
+    @property
+    def unit_chairs(self):
+        """DataFrame view of number of chairs in each subunit."""
         
-        # Unit preferences
-        self.unit_order_by_patient_postcode = _units.unit_preferences
-        self.unit_order_given = _units.given_order
+        return pd.DataFrame({'chairs': self.chairs}, index=self.unit_list)
+    
+    
+    @property
+    def unit_sessions(self):
+        """DataFrame view of status of each subunit/session (negative/positive/x)."""
+        
+        status_names = np.array(SESSION_STATUS, dtype=object)[self.session_status]
+        return pd.DataFrame(status_names, index=self.unit_list, columns=SESSIONS)
+    
+    
+    @property
+    def unit_sessions_count(self):
+        """DataFrame view of number of patients allocated to each subunit/session."""
+        
+        return pd.DataFrame(self.session_count, index=self.unit_list, columns=SESSIONS)
                 
         
-    def allocate_cov_neg_patient(self, patient):
+    def add_patient_to_session(self, patient, unit_index, session_index):
+        """
+        Add patient to session membership index.
+
+        Parameters
+        ----------
+        patient : Object
+            Paotient object (information on individual patient).
+        unit_index : int
+            Row of subunit in session arrays.
+        session_index : int
+            Column of session in session arrays.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.session_patients[unit_index][session_index][patient] = None
+        self.patient_session[patient] = (unit_index, session_index)
+        
+    
+    def allocate_cov_neg_patient(self, patient, search_start=0):
         """
         Allocate a COVID -ve patient to subunit session. Preference:
             1) Try assigning to local unit with current allocated day
@@ -136,53 +257,32 @@ class AllocatePatients:
         ----------
         patient : Object
             Paotient object (information on individual patient).
+        search_start : int, optional
+            Position in search order to start from (see search_sessions). The default is 0.
 
         Returns
         -------
-        None.
+        int
+            Position in search order where patient allocated (see search_sessions).
 
         """
         
         first_day = patient.first_day        
         sessions_to_check = [first_day+'_1', first_day+'_2', first_day+'_3']
         
-        # 1) Try assigning to local unit first
+        search_order = [
+            # 1) Try assigning to local unit first
+            (sessions_to_check, patient.default_unit),
+            #2) If no availabilty check all day sessions
+            (SESSIONS, patient.default_unit),
+            #3) If no availability check other units
+            (SESSIONS, self.unit_order_lookup[patient.location])]
         
-        units_to_check = patient.default_unit
-        for unit_to_check in units_to_check:            
-            self.check_availability_in_session(patient, unit_to_check, sessions_to_check, 
-                                               'negative')
-            if patient.unallocated_to_session == False:
-                break
-                        
-            
-        #2) If no availabilty check all day sessions
-        
-        if patient.unallocated_to_session:
-            sessions_to_check = ['Mon_1', 'Mon_2', 'Mon_3', 'Tues_1', 'Tues_2', 'Tues_3']
-            units_to_check = patient.default_unit
-            for unit_to_check in units_to_check:            
-                self.check_availability_in_session(patient, unit_to_check, sessions_to_check, 
-                                                   'negative')
-                if patient.unallocated_to_session == False:
-                    break
-            
-        #3) If no availability check other units
-
-        if patient.unallocated_to_session:
-            sessions_to_check = ['Mon_1', 'Mon_2', 'Mon_3', 'Tues_1', 'Tues_2', 'Tues_3']
-            units_to_check = self.unit_order_by_patient_postcode.loc[patient.location] 
-
-            for unit_to_check in units_to_check:
-                self.check_availability_in_session(
-                    patient, unit_to_check, sessions_to_check, 'negative')
-                # Change day if successful
-                if patient.unallocated_to_session == False:
-                    break
+        return self.search_sessions(patient, search_order, 'negative', search_start)
 
         
     
-    def allocate_cov_pos_patient(self, patient):
+    def allocate_cov_pos_patient(self, patient, search_start=0):
         """
         Allocate a COVID +ve patient to subunit session. Preference:
             1) Try assigning to local unit with current allocated day
@@ -194,72 +294,61 @@ class AllocatePatients:
         ----------
         patient : Object
             Paotient object (information on individual patient).
+        search_start : int, optional
+            Position in search order (steps 1-3) to start from (see search_sessions). The
+            default is 0.
 
         Returns
         -------
-        None.
+        int
+            Position in search order (steps 1-3) where patient allocated (see
+            search_sessions).
         """
         
         first_day = patient.first_day        
         sessions_to_check = [first_day+'_1', first_day+'_2', first_day+'_3']
         
-        # 1) Try assigning to local unit first
-        units_to_check = patient.default_unit
-        for unit_to_check in units_to_check:            
-            self.check_availability_in_session(patient, unit_to_check, sessions_to_check, 
-                                               'positive')
-            if patient.unallocated_to_session == False:
-                    break
-        
-        #2) If no availabilty check all day sessions
+        search_order = [
+            # 1) Try assigning to local unit first
+            (sessions_to_check, patient.default_unit),
+            #2) If no availabilty check all day sessions
+            (SESSIONS, patient.default_unit),
+            #3) If no availability check other units
+            (SESSIONS, self.unit_order_given)]
         
-        if patient.unallocated_to_session:
-            sessions_to_check = ['Mon_1', 'Mon_2', 'Mon_3', 'Tues_1', 'Tues_2', 'Tues_3']
-            units_to_check = patient.default_unit
-            for unit_to_check in units_to_check:            
-                self.check_availability_in_session(patient, unit_to_check, sessions_to_check, 
-                                                   'positive')
-                if patient.unallocated_to_session == False:
-                    break
-            
-        #3) If no availability check other units
-            
-        if patient.unallocated_to_session:
-            sessions_to_check = ['Mon_1', 'Mon_2', 'Mon_3', 'Tues_1', 'Tues_2', 'Tues_3']
-            units_to_check = self.unit_order_given
-
-            for unit_to_check in units_to_check:
-                self.check_availability_in_session(
-                    patient, unit_to_check, sessions_to_check, 'positive')
-                # Change day if successful
-                if patient.unallocated_to_session == False:
-                    break
+        position = self.search_sessions(patient, search_order, 'positive', search_start)
                 
         ################ Need to open a new cov +ve session ###################
         ## Work through prescribed list of units - clear a session as needed ##
                 
         if patient.unallocated_to_session:
             units_to_check = self.unit_order_given
-            sessions_to_check = ['Mon_1', 'Mon_2', 'Mon_3', 'Tues_1', 'Tues_2', 'Tues_3']
+            sessions_to_check = SESSIONS
             for unit in units_to_check:
                 if patient.unallocated_to_session:
+                    unit_index = self.unit_index[unit]
                     for session in sessions_to_check:   
-                       if self.unit_sessions.loc[unit][session] == 'negative':
+                       session_index = self.session_index[session]
+                       if (self.session_status[unit_index, session_index] == 
+                           STATUS_CODE['negative']):
                            # Move patients to be reallocated and reassign to cov +ve
-                           self.unit_sessions.loc[unit][session] = 'positive'
-                           self.unit_sessions_count.loc[unit][session] = 0
-                           # Remove all current patients in that session
-                           for session_patient in self._pop.negative_patients:
-                               if (session_patient.current_unit == unit and 
-                                   session_patient.session == session):
-                                       session_patient.current_unit = 'none'
-                                       session_patient.session = 'none'
-                                       session_patient.unallocated_to_session = True
+                           self.set_session_state(
+                               unit_index, session_index, STATUS_CODE['positive'], 0)
+                           # Remove all current negative patients in that session
+                           for session_patient in list(
+                                   self.session_patients[unit_index][session_index]):
+                               if session_patient.status == 'negative':
+                                   self.remove_patient_from_session(session_patient)
+                                   session_patient.current_unit = 'none'
+                                   session_patient.session = 'none'
+                                   session_patient.unallocated_to_session = True
                            # Assign patient
                            patient.current_unit = unit
                            self.check_availability_in_session(patient, unit, [session], 'positive')
                            break
         
+        return position
+        
 
     def allocate_inpatient(self, patient):
         """
@@ -277,16 +366,17 @@ class AllocatePatients:
 
         """
 
-        units_to_check = self.unit_order_by_patient_postcode.loc[patient.location] 
+        units_to_check = self.unit_order_lookup[patient.location]
 
         for unit_to_check in units_to_check:
-            if self.inpatient_units.loc[unit_to_check].values[0] == 1:
+            unit_index = self.unit_index[unit_to_check]
+            if self.accepts_inpatients[unit_index]:
                 patient.current_unit = unit_to_check
-                self.inpatient_counts.loc[unit_to_check]['inpatients'] += 1
+                self.inpatient_count[unit_index] += 1
                 break
             
     
-    def allocate_patient(self, patient):
+    def allocate_patient(self, patient, allocation_function=None, search_start=0):
         """
         Allocates patients to sessions. Calls appropriate method for patient
         COVID status. Adds travel time for patients.
@@ -295,14 +385,23 @@ class AllocatePatients:
         ----------
         patient : Object
             Paotient object (information on individual patient).
+        allocation_function : function, optional
+            Function (taking patient) to allocate patient to a session, in place of
+            method for patient COVID status. The default is None.
+        search_start : int, optional
+            Position in search order to start from, passed to method for patient COVID
+            status (see search_sessions). The default is 0.
 
         Returns
         -------
-        None.
+        int or None
+            Position in search order where patient allocated (None if allocation_function
+            given).
 
         """
         
         # Reset patient allocation status
+        self.remove_patient_from_session(patient)
         patient.session = 'none'
         patient.unallocated_to_session = True
        
@@ -311,8 +410,11 @@ class AllocatePatients:
                      'positive': self.allocate_cov_pos_patient,
                      'recovered': self.allocate_cov_neg_patient}
         
-        function_to_call = func_dict[patient.status]
-        function_to_call(patient)
+        if allocation_function is None:
+            function_to_call = func_dict[patient.status]
+            position = function_to_call(patient, search_start)
+        else:
+            position = allocation_function(patient)
         
         # Unallocated patients
         if patient.unallocated_to_session:
@@ -326,12 +428,215 @@ class AllocatePatients:
         if patient.unallocated_to_session == False and (
                 patient.current_unit_location != patient.default_unit_location):
                 patient.displaced = True
-                patient.current_travel_time = \
-                    self.travel_times.loc[patient.location][patient.current_unit_location]
+                patient.current_travel_time = self.travel_time_array[
+                    self.travel_time_location_index[patient.location],
+                    self.travel_time_unit_index[patient.current_unit_location]]
                 patient.displaced_additional_time = \
                     patient.current_travel_time - patient.default_time
                 self._pop.displaced_patients.append(patient)
+        
+        return position
+
+    
+    def allocate_many(self, patients):
+        """
+        Allocate patients to sessions (in order), with the same results as calling
+        allocate_patient for each patient. Patients with the same search order (COVID
+        session type, postcode sector, first day and default unit) share a search cursor:
+        while free capacity for their session type has not increased (see
+        capacity_version), units and sessions already found full for an earlier patient
+        are not checked again.
+
+        Parameters
+        ----------
+        patients : iterable
+            Patient objects to allocate.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        cursors = dict()
+        for patient in patients:
+            session_type = 'positive' if patient.status == 'positive' else 'negative'
+            # Search order for COVID +ve patients does not depend on postcode
+            location = patient.location if session_type == 'negative' else None
+            key = (session_type, location, patient.first_day, tuple(patient.default_unit))
+            code = STATUS_CODE[session_type]
+            version = self.capacity_version[code]
+            
+            # Start from cursor if capacity has not increased since it was set
+            search_start = 0
+            if key in cursors and cursors[key][0] == version:
+                search_start = cursors[key][1]
+            
+            position = self.allocate_patient(patient, search_start=search_start)
+            
+            # Keep cursor unless capacity increased during allocation
+            if self.capacity_version[code] == version:
+                cursors[key] = (version, position)
+            else:
+                cursors.pop(key, None)
+                
+                
+    def allocate_patients_min_cost(self, patients, displaced_penalty=None,
+                                   day_change_penalty=1e-6):
+        """
+        Allocate COVID -ve/recovered patients to negative sessions with free chairs,
+        minimising the number of patients displaced from their default unit location and
+        then total additional travel time of displaced patients (travel time beyond time
+        to default unit). Patients are grouped by postcode sector, default unit location
+        and first day (patients in a group have the same costs), and groups are assigned
+        to unit locations and days by solving a min-cost transportation problem. Within a
+        location and day, patients take sessions as in check_availability_in_session.
+        
+        A small penalty for changing day prefers first day where otherwise equal.
+        Patients dialysing at home, and patients that cannot be assigned (no free chairs),
+        are allocated by allocate_patient.
+
+        Parameters
+        ----------
+        patients : list
+            COVID -ve/recovered patients (not currently allocated to a session).
+        displaced_penalty : float, optional
+            Cost (minutes) of allocating away from default unit location. The default
+            (None) is more than the longest travel time, so that the number of displaced
+            patients is minimised first.
+        day_change_penalty : float, optional
+            Cost (minutes) of allocating on a day other than first day. The default
+            is 1e-6.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if displaced_penalty is None:
+            displaced_penalty = self.travel_time_array.max() + 1
+        number_of_units = len(self.unit_list) - 1
+        unit_locations = [self.unit_location_lookup[unit] for unit in self.unit_list[:-1]]
+        locations = list(dict.fromkeys(unit_locations))
+        
+        # Free chairs in negative sessions at each location on each day
+        free_chairs = np.where(
+            self.session_status[:number_of_units] == STATUS_CODE['negative'],
+            self.chairs[:number_of_units, np.newaxis] - self.session_count[:number_of_units],
+            0).clip(min=0)
+        day_columns = [[self.session_index[session] for session in SESSIONS
+                        if session.split('_')[0] == day] for day in DAYS]
+        capacity = []
+        for location in locations:
+            rows = [i for i, unit_location in enumerate(unit_locations)
+                    if unit_location == location]
+            for columns in day_columns:
+                capacity.append(free_chairs[np.ix_(rows, columns)].sum())
+        # Add sink for patients who cannot be assigned
+        capacity.append(len(patients))
+        
+        # Group patients (not at home)
+        groups = dict()
+        for patient in patients:
+            if patient.default_unit_location == 'HOME':
+                self.allocate_patient(patient)
+            else:
+                key = (patient.location, patient.default_unit_location, patient.first_day)
+                groups.setdefault(key, []).append(patient)
+        if len(groups) == 0:
+            return
+        
+        # Cost of allocating each group to each location and day
+        location_columns = [self.travel_time_unit_index[location] for location in locations]
+        cost = np.empty((len(groups), len(capacity)))
+        for row, (location, default_location, first_day) in enumerate(groups):
+            travel = self.travel_time_array[self.travel_time_location_index[location]]
+            additional_time = (
+                travel[location_columns] - travel[self.travel_time_unit_index[default_location]])
+            displaced = np.array(locations) != default_location
+            location_cost = np.where(displaced, additional_time + displaced_penalty, 0)
+            day_cost = np.array([day != first_day for day in DAYS]) * day_change_penalty
+            cost[row, :-1] = (location_cost[:, np.newaxis] + day_cost).ravel()
+        # Cost of not assigning patient exceeds cost of any assignment
+        cost[:, -1] = 2 * displaced_penalty + 1e6
+        
+        supply = [len(group) for group in groups.values()]
+        flow = solve_transportation(supply, capacity, cost)
+        
+        # Allocate patients in each group to assigned locations and days
+        for row, group in enumerate(groups.values()):
+            patient_iterator = iter(group)
+            for sink in np.nonzero(flow[row])[0]:
+                for _ in range(flow[row, sink]):
+                    patient = next(patient_iterator)
+                    if sink == len(capacity) - 1:
+                        self.allocate_patient(patient)
+                    else:
+                        location = locations[sink // len(DAYS)]
+                        day = DAYS[sink % len(DAYS)]
+                        self.allocate_patient(
+                            patient, lambda patient: self.allocate_to_location(
+                                patient, location, day))
+            # Any patients not assigned
+            for patient in patient_iterator:
+                self.allocate_patient(patient)
+                        
+                        
+    def allocate_to_location(self, patient, location, day):
+        """
+        Allocate a COVID -ve/recovered patient to a negative session on a given day at a
+        subunit at a given location (subunits checked in order).
+
+        Parameters
+        ----------
+        patient : Object
+            Paotient object (information on individual patient).
+        location : str
+            Unit postcode.
+        day : str
+            Day of week (e.g. 'Mon').
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        sessions_to_check = [session for session in SESSIONS if session.split('_')[0] == day]
+        for unit in self.unit_list[:-1]:
+            if self.unit_location_lookup[unit] == location:
+                self.check_availability_in_session(
+                    patient, unit, sessions_to_check, 'negative')
+                if patient.unallocated_to_session == False:
+                    break
+        
+        
+    def build_free_capacity_index(self):
+        """
+        Build index of sessions with free chairs from session status and counts. The index
+        holds, for each session status, the number of subunits with a free chair in each
+        session and the number of sessions with a free chair at each subunit. It is kept up
+        to date by set_session_state.
 
+        Returns
+        -------
+        None.
+
+        """
+        
+        # Free capacity may have changed (invalidates search cursors)
+        self.capacity_version = [version + 1 for version in self.capacity_version]
+        
+        has_free_chair = self.session_count < self.chairs[:, np.newaxis]
+        self.free_session_count = np.zeros((len(SESSION_STATUS), len(SESSIONS)), dtype=np.int32)
+        self.unit_free_session_count = np.zeros(
+            (len(SESSION_STATUS), len(self.unit_list)), dtype=np.int32)
+        for code in range(len(SESSION_STATUS)):
+            free = has_free_chair & (self.session_status == code)
+            self.free_session_count[code] = free.sum(axis=0)
+            self.unit_free_session_count[code] = free.sum(axis=1)
+    
     
     def check_availability_in_session(self, patient, unit, sessions_to_check, session_type):
             """
@@ -355,13 +660,22 @@ class AllocatePatients:
             """
             
             patient.unallocated_to_session = True
+            unit_index = self.unit_index[unit]
+            status_code = STATUS_CODE[session_type]
+            # No free chair in any session of this type at unit
+            if self.unit_free_session_count[status_code, unit_index] == 0:
+                return
+            unit_status = self.session_status[unit_index]
+            unit_count = self.session_count[unit_index]
             for session in sessions_to_check:
-                if self.unit_sessions.loc[unit][session] == session_type:
-                    has_capacity = (self.unit_sessions_count.loc[unit][session] < 
-                        self.unit_chairs.loc[unit]['chairs'])
+                session_index = self.session_index[session]
+                if unit_status[session_index] == status_code:
+                    has_capacity = unit_count[session_index] < self.chairs[unit_index]
                     if has_capacity:
                         # Chair free to be allocated
-                        self.unit_sessions_count.loc[unit][session] += 1
+                        self.set_session_state(
+                            unit_index, session_index, count=unit_count[session_index] + 1)
+                        self.add_patient_to_session(patient, unit_index, session_index)
                         patient.session = session
                         patient.current_unit = unit
                         patient.unallocated_to_session = False
@@ -369,6 +683,70 @@ class AllocatePatients:
 
 
 
+    def discharge_inpatient(self, patient):
+        """
+        Remove a patient from inpatient counts at end of inpatient stay.
+
+        Parameters
+        ----------
+        patient : Object
+            Paotient object (information on individual patient).
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.inpatient_count[self.unit_index[patient.current_unit]] -= 1
+        
+        
+    def get_patients_in_session(self, unit, session):
+        """
+        List patients currently allocated to a subunit session (in order of allocation).
+
+        Parameters
+        ----------
+        unit : string
+            Subunit name.
+        session : string
+            Session name (e.g. 'Mon_1').
+
+        Returns
+        -------
+        list
+            Patient objects allocated to the session.
+
+        """
+        
+        return list(self.session_patients[self.unit_index[unit]][self.session_index[session]])
+    
+    
+    def has_free_capacity(self, sessions_to_check, session_type):
+        """
+        Checks free-capacity index for any free chair in a list of sessions (in any unit).
+
+        Parameters
+        ----------
+        sessions_to_check : list
+           The list of sessions to check
+        session_type : string
+            Type of session: 'negative' or 'positive'.
+
+        Returns
+        -------
+        bool
+            True if any unit has a free chair in one of the sessions, otherwise False.
+
+        """
+        
+        free_sessions = self.free_session_count[STATUS_CODE[session_type]]
+        for session in sessions_to_check:
+            if free_sessions[self.session_index[session]] > 0:
+                return True
+        return False
+        
+        
     def load_patient(self, patient):
         """
         Inital load of patients into system. Adds to population patient dictionary,
@@ -401,6 +779,37 @@ class AllocatePatients:
         patient_dict[patient.status].append(patient)       
                 
     
+    def load_patients(self, patients):
+        """
+        Inital load of patients into system (as load_patient for each patient, with
+        patients allocated by allocate_many).
+
+        Parameters
+        ----------
+        patients : list
+            Patient objects (information on individual patients).
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        # Maintain patient count 
+        self.count_total_patients += len(patients)
+        
+        # Allocate patients to subunit/session
+        self.allocate_many(patients)
+        
+        # Add to appropriate _population lists
+        patient_dict = {'negative': self._pop.negative_patients, 
+                         'positive': self._pop.positive_patients,
+                         'recovered': self._pop.recovered_patients,
+                         'died': self._pop.died_patients}
+        for patient in patients:
+            patient_dict[patient.status].append(patient)
+            
+    
     def remove_patient(self, patient):
         """
         Remove patient from appropriate counts and lists.
@@ -418,7 +827,11 @@ class AllocatePatients:
         
         # Remove patient from subunit/session (unless not allocated to subunit/session)
         if not patient.unallocated_to_session:
-            self.unit_sessions_count.loc[patient.current_unit][patient.session] -= 1
+            unit_index = self.unit_index[patient.current_unit]
+            session_index = self.session_index[patient.session]
+            self.set_session_state(
+                unit_index, session_index, count=self.session_count[unit_index, session_index] - 1)
+        self.remove_patient_from_session(patient)
         
         # Remove from appropriate _population lists (use dict to select appropriate list)
         patient_dict = {'negative': self._pop.negative_patients, 
@@ -429,15 +842,164 @@ class AllocatePatients:
         # Reset patient displacement from default unit
         patient.displaced = False
         patient.displaced_additional_time = True
-        if patient in self._pop.displaced_patients:
-            self._pop.displaced_patients.remove(patient)
+        self._pop.displaced_patients.discard(patient)
 
         # If positive patient check if session can be re-allocated to cov negative
         if patient.status == 'positive' and patient.session != 'none':
-            if self.unit_sessions_count.loc[patient.current_unit][patient.session] == 0:
-                self.unit_sessions.loc[patient.current_unit][patient.session] = 'negative'
-            
+            unit_index = self.unit_index[patient.current_unit]
+            session_index = self.session_index[patient.session]
+            if self.session_count[unit_index, session_index] == 0:
+                self.set_session_state(unit_index, session_index, STATUS_CODE['negative'])
 
-            
-            
+
+    def remove_patient_from_session(self, patient):
+        """
+        Remove patient from session membership index (if allocated to a session).
+
+        Parameters
+        ----------
+        patient : patient object
+            A single patient.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if patient in self.patient_session:
+            unit_index, session_index = self.patient_session.pop(patient)
+            del self.session_patients[unit_index][session_index][patient]
+
+
+    def reset(self, _pop):
+        """
+        Reset session states, counts and membership indexes to start of run, for a new
+        patient population. Unit information, chairs and unit preferences are kept, so a
+        model may be re-run without rebuilding them.
+
+        Parameters
+        ----------
+        _pop : Object
+            Object holding patient populations (all patients, patients by COVID
+            stage, inpatients).
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self._pop = _pop
+        number_of_units = len(self.unit_list)
+
+        # Session status (from input sheet) and patient counter table
+        self.session_status = self.initial_session_status.copy()
+        self.session_count = np.zeros((number_of_units, len(SESSIONS)), dtype=np.int32)
+
+        # Set up index of sessions with free chairs
+        self.capacity_version = [0 for status in SESSION_STATUS]
+        self.build_free_capacity_index()
+
+        # Set up index of patients allocated to each session
+        self.session_patients = [
+            [dict() for session in SESSIONS] for unit in self.unit_list]
+        self.patient_session = dict()
+
+        # Overall counts
+        self.count_total_patients = 0
+        self.count_status = {'negative': 0, 'positive': 0, 'recovered': 0, 'died': 0}
+        self.count_day_swaps = 0
+
+        # Inpatient counts
+        self.inpatient_count = np.zeros(number_of_units, dtype=np.int32)
+
+
+    def search_sessions(self, patient, search_order, session_type, search_start=0):
+        """
+        Check units for a free chair in a session (of session type), in search order, until
+        patient is allocated. Search order is a list of steps, each a list of sessions and a
+        list of units (each unit is checked for the step's sessions). A step is skipped if
+        no unit has a free chair in any of its sessions. Positions in the search order count
+        units across steps; units before search_start are not checked (used where they are
+        known to be full).
+
+        Parameters
+        ----------
+        patient : Object
+            Paotient object (information on individual patient).
+        search_order : list
+            List of (sessions, units) steps.
+        session_type : string
+            Type of session: 'negative' or 'positive'.
+        search_start : int, optional
+            Position in search order to start from. The default is 0.
+
+        Returns
+        -------
+        int
+            Position in search order of unit patient allocated to (number of positions if
+            patient not allocated).
+
+        """
         
+        position = 0
+        for sessions_to_check, units_to_check in search_order:
+            step_length = len(units_to_check)
+            if position + step_length > search_start and self.has_free_capacity(
+                    sessions_to_check, session_type):
+                for i in range(max(search_start - position, 0), step_length):
+                    self.check_availability_in_session(
+                        patient, units_to_check[i], sessions_to_check, session_type)
+                    if patient.unallocated_to_session == False:
+                        return position + i
+            position += step_length
+        return position
+    
+    
+    def set_session_state(self, unit_index, session_index, status=None, count=None):
+        """
+        Update status and/or patient count of a session. All changes to session status and
+        counts go through this method so that the free-capacity index stays up to date.
+
+        Parameters
+        ----------
+        unit_index : int
+            Row of subunit in session arrays.
+        session_index : int
+            Column of session in session arrays.
+        status : int, optional
+            New session status code (see STATUS_CODE). The default is None (unchanged).
+        count : int, optional
+            New count of patients in session. The default is None (unchanged).
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        chairs = self.chairs[unit_index]
+        
+        # Remove session from index under its current state
+        old_status = self.session_status[unit_index, session_index]
+        old_count = self.session_count[unit_index, session_index]
+        if self.session_count[unit_index, session_index] < chairs:
+            self.free_session_count[old_status, session_index] -= 1
+            self.unit_free_session_count[old_status, unit_index] -= 1
+        
+        # Update session
+        if status is not None:
+            self.session_status[unit_index, session_index] = status
+        if count is not None:
+            self.session_count[unit_index, session_index] = count
+        
+        # Add session back to index under its new state
+        new_status = self.session_status[unit_index, session_index]
+        if self.session_count[unit_index, session_index] < chairs:
+            self.free_session_count[new_status, session_index] += 1
+            self.unit_free_session_count[new_status, unit_index] += 1
+            
+        # Record possible increase in free capacity for new status
+        if new_status != old_status or self.session_count[unit_index, session_index] < old_count:
+            self.capacity_version[new_status] += 1
@@ -0,0 +1,103 @@
+'''
+Contains min-cost transportation solver used for optimal reallocation of
+patients to units
+'''
+import numpy as np
+
+
+def solve_transportation(supply, capacity, cost):
+    """
+    Solve a min-cost transportation problem: assign units of supply (e.g.
+    patients in groups with the same costs) to sinks (e.g. unit locations and
+    days) with limited capacity, minimising total cost. Uses successive
+    shortest paths: each step adds one group's supply along the cheapest path,
+    which may move supply already assigned between sinks. Shortest paths are
+    found by Bellman-Ford over the sinks (few sinks, many groups).
+
+    If total capacity is less than total supply, supply that cannot be
+    assigned is left unassigned (add a sink with high cost and large capacity
+    to find the cheapest assignment of all supply).
+
+    Parameters
+    ----------
+    supply : array of int
+        Supply in each group (groups).
+    capacity : array of int
+        Capacity of each sink (sinks).
+    cost : 2D array of float
+        Cost of assigning one unit of each group to each sink (groups x sinks).
+        Use numpy.inf where a group cannot be assigned to a sink.
+
+    Returns
+    -------
+    flow : 2D array of int
+        Number of units of each group assigned to each sink (groups x sinks).
+    """
+
+    cost = np.asarray(cost, dtype=np.float64)
+    number_of_groups, number_of_sinks = cost.shape
+    sinks = np.arange(number_of_sinks)
+    flow = np.zeros((number_of_groups, number_of_sinks), dtype=np.int64)
+    remaining = np.array(supply, dtype=np.int64)
+    free = np.array(capacity, dtype=np.int64)
+    tolerance = 1e-9
+
+    while remaining.sum() > 0 and free.sum() > 0:
+
+        # Cheapest group (with remaining supply) to add to each sink
+        entry = np.where((remaining > 0)[:, np.newaxis], cost, np.inf)
+        entry_group = entry.argmin(axis=0)
+        distance = entry[entry_group, sinks]
+        previous_sink = np.full(number_of_sinks, -1)
+        previous_group = entry_group.copy()
+
+        # Cheapest group to move from one sink (row) to another (column)
+        groups, from_sinks = np.nonzero(flow)
+        moves = cost[groups, :] - cost[groups, from_sinks][:, np.newaxis]
+        move_cost = np.full((number_of_sinks, number_of_sinks), np.inf)
+        move_group = np.zeros((number_of_sinks, number_of_sinks), dtype=np.int64)
+        for sink in np.unique(from_sinks):
+            rows = np.nonzero(from_sinks == sink)[0]
+            best = moves[rows].argmin(axis=0)
+            move_cost[sink] = moves[rows[best], sinks]
+            move_group[sink] = groups[rows[best]]
+        move_cost[sinks, sinks] = np.inf
+
+        # Shortest paths to each sink (Bellman-Ford)
+        for _ in range(number_of_sinks):
+            candidate = distance[:, np.newaxis] + move_cost
+            best = candidate.argmin(axis=0)
+            best_distance = candidate[best, sinks]
+            improved = best_distance < distance - tolerance
+            if not improved.any():
+                break
+            distance[improved] = best_distance[improved]
+            previous_sink[improved] = best[improved]
+            previous_group[improved] = move_group[best[improved], sinks[improved]]
+
+        # Cheapest sink with free capacity
+        reachable = np.where(free > 0, distance, np.inf)
+        target = reachable.argmin()
+        if reachable[target] == np.inf:
+            break
+
+        # Trace path back from target sink (moves between sinks, then entry)
+        path = []
+        sink = target
+        while previous_sink[sink] >= 0:
+            path.append((previous_group[sink], previous_sink[sink], sink))
+            sink = previous_sink[sink]
+        entry_group = previous_group[sink]
+
+        # Augment by largest amount possible along path
+        amount = min(remaining[entry_group], free[target])
+        for group, from_sink, _ in path:
+            amount = min(amount, flow[group, from_sink])
+        remaining[entry_group] -= amount
+        flow[entry_group, sink] += amount
+        for group, from_sink, to_sink in path:
+            flow[group, from_sink] -= amount
+            flow[group, to_sink] += amount
+        free[target] -= amount
+
+    return flow
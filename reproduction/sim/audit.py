@@ -1,21 +1,242 @@
+import math
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from .allocation import STATUS_CODE
+
+
+class AuditRecorder:
+    """
+    Columnar store for audit results. Holds a preallocated NumPy buffer for each column,
+    which audits write into in place. Results are converted to a DataFrame on request.
+    
+    Object attributes
+    -----------------
+    
+    audit_count: Number of audits recorded
+    buffers: Dictionary of column name (key) and NumPy buffer (value)
+    columns: List of column names
+    rows_per_audit: Number of rows added by each audit (e.g. one per subunit)
+    
+    Methods
+    -------
+    
+    record:
+        Write results of one audit into the buffers
+        
+    to_dataframe:
+        Convert recorded results to a DataFrame
+    
+    """
+    
+    def __init__(self, columns, dtypes, number_of_audits, rows_per_audit=1):
+        """
+        Constructor for audit recorder.
+        
+        Parameters
+        ----------
+        columns : list
+            Column names (in order).
+        dtypes : dict
+            Dictionary of column name (key) and NumPy dtype (value).
+        number_of_audits : int
+            Expected number of audits (used to size buffers; buffers grow if exceeded).
+        rows_per_audit : int, optional
+            Number of rows added by each audit. The default is 1.
+        
+        Returns
+        -------
+        None.
+        
+        """
+        
+        self.columns = columns
+        self.rows_per_audit = rows_per_audit
+        self.audit_count = 0
+        size = max(number_of_audits, 1) * rows_per_audit
+        self.buffers = {column: np.empty(size, dtype=dtypes[column]) for column in columns}
+        
+    def record(self, values):
+        """
+        Write results of one audit into the buffers.
+        
+        Parameters
+        ----------
+        values : dict
+            Dictionary of column name (key) and value (value). Values are scalars or arrays
+            with one entry per row of the audit.
+        
+        Returns
+        -------
+        None.
+        
+        """
+        
+        start = self.audit_count * self.rows_per_audit
+        end = start + self.rows_per_audit
+        
+        # Double buffer size if full
+        if end > len(self.buffers[self.columns[0]]):
+            for column, buffer in self.buffers.items():
+                self.buffers[column] = np.concatenate([buffer, np.empty_like(buffer)])
+        
+        for column in self.columns:
+            self.buffers[column][start:end] = values[column]
+        self.audit_count += 1
+        
+    def to_dataframe(self):
+        """
+        Convert recorded results to a DataFrame.
+        
+        Returns
+        -------
+        DataFrame
+            Recorded results (one row per audit row).
+        
+        """
+        
+        rows = self.audit_count * self.rows_per_audit
+        return pd.DataFrame(
+            {column: self.buffers[column][:rows] for column in self.columns},
+            columns=self.columns)
+
+
+class UnitAuditRecorder:
+    """
+    Store for unit-level audit results. Holds a preallocated NumPy array of
+    (audits x subunits x metrics), which audits write into in place. Results are converted
+    to a DataFrame (one row per audit and subunit) on request.
+    
+    Object attributes
+    -----------------
+    
+    audit_count: Number of audits recorded
+    days: NumPy array of day of each audit
+    integer_metrics: List of metrics converted to integer in DataFrame
+    master_units: NumPy array of master unit of each subunit
+    metrics: List of metric names (last axis of results array)
+    results: NumPy array (float64) of audit results (audits x subunits x metrics)
+    subunits: NumPy array of subunit names
+    
+    Methods
+    -------
+    
+    record:
+        Write results of one audit into the results array
+        
+    to_dataframe:
+        Convert recorded results to a DataFrame
+    
+    """
+    
+    def __init__(self, metrics, master_units, subunits, number_of_audits, day_dtype,
+                 integer_metrics=()):
+        """
+        Constructor for unit audit recorder.
+        
+        Parameters
+        ----------
+        metrics : list
+            Metric names (in order).
+        master_units : list
+            Master unit of each subunit.
+        subunits : list
+            Subunit names.
+        number_of_audits : int
+            Expected number of audits (used to size arrays; arrays grow if exceeded).
+        day_dtype : NumPy dtype
+            Dtype of audit days.
+        integer_metrics : list, optional
+            Metrics converted to integer in DataFrame. The default is none.
+        
+        Returns
+        -------
+        None.
+        
+        """
+        
+        self.metrics = metrics
+        self.integer_metrics = list(integer_metrics)
+        self.master_units = np.array(master_units, dtype=object)
+        self.subunits = np.array(subunits, dtype=object)
+        self.audit_count = 0
+        size = max(number_of_audits, 1)
+        self.days = np.empty(size, dtype=day_dtype)
+        self.results = np.empty((size, len(subunits), len(metrics)), dtype=np.float64)
+        
+    def record(self, day, results):
+        """
+        Write results of one audit into the results array.
+        
+        Parameters
+        ----------
+        day : int or float
+            Day of audit.
+        results : NumPy array
+            Array of (subunits x metrics).
+        
+        Returns
+        -------
+        None.
+        
+        """
+        
+        # Double array size if full
+        if self.audit_count == len(self.days):
+            self.days = np.concatenate([self.days, np.empty_like(self.days)])
+            self.results = np.concatenate([self.results, np.empty_like(self.results)])
+        
+        self.days[self.audit_count] = day
+        self.results[self.audit_count] = results
+        self.audit_count += 1
+        
+    def to_dataframe(self):
+        """
+        Convert recorded results to a DataFrame.
+        
+        Returns
+        -------
+        DataFrame
+            Recorded results (one row per audit and subunit).
+        
+        """
+        
+        audits = self.audit_count
+        subunits = len(self.subunits)
+        results = self.results[:audits].reshape(audits * subunits, len(self.metrics))
+        
+        df = pd.DataFrame({'day': np.repeat(self.days[:audits], subunits),
+                           'master_unit': np.tile(self.master_units, audits),
+                           'subunit': np.tile(self.subunits, audits)})
+        for index, metric in enumerate(self.metrics):
+            if metric in self.integer_metrics:
+                df[metric] = results[:, index].astype(np.int64)
+            else:
+                df[metric] = results[:, index]
+        
+        return df
+
 
 class Audit:
     """
-    Runs audit on patient and unit metrics at day intervals. Stores audits in DataFrames.
+    Runs audit on patient and unit metrics at day intervals. Stores audits in columnar
+    recorders (AuditRecorder), from which audit DataFrames are produced on request.
     
     Object attributes
     -----------------
     
-    Audits stored are:
+    Audits (DataFrames, produced from recorders on request) are:
         displaced_audit: count of displaced patients, and additional travel time
         inpatient_audit: count of inpatients
         patient_audit: count of all patients in different stages of COVID
         unit_audit: counts of patients (by COVID stage) at each subunit
         
+    Audit recorders are:
+        displaced_recorder, inpatient_recorder, patient_recorder (AuditRecorder)
+        unit_recorder (UnitAuditRecorder)
+        
     Other class parameters:
         _allocate: reference to model patient-unit allocation object
         _env: Reference to model environment object
@@ -39,6 +260,9 @@ class Audit:
         Also counts number ofCOVID postive/negative sessions at each unit.
         Provides both unit (master unit) and subunit.
     
+    reset:
+        Set up new audit recorders for a model run (keeping unit information)
+    
 
     """    
     
@@ -79,22 +303,92 @@ class Audit:
         self.audit_subunit_list =list(unit_info['subunit']) + ['HOME']
         self.unit_info.set_index('subunit', inplace=True)
         
-        # Set up audit DataFrames
+        # Audit columns
         self.patient_cols = [
             'day', 'negative', 'positive', 'recovered', 'inpatient', 'died', 'total', 'unallocated']
-        self.patient_audit = pd.DataFrame(columns=self.patient_cols)
-
         self.displaced_cols = ['day', 'number', 'add_time_min', 'add_time_1Q', 'add_time_median', 
                                 'add_time_3Q', 'add_time_max', 'add_time_total']
-        self.displaced_audit = pd.DataFrame(columns=self.displaced_cols) 
-
         self.unit_cols = [
             'day', 'master_unit', 'subunit', 'negative', 'positive', 'recovered', 'neg+rec', 
             'total', 'negative_shifts', 'positive_shifts']
-        self.unit_audit = pd.DataFrame(columns=self.unit_cols)
-        
         self.inpatient_cols = ['day', 'master_unit', 'subunit', 'inpatients']
-        self.inpatient_audit =  pd.DataFrame(columns=self.inpatient_cols)
+        
+        # Session status codes counted in unit audit (negative, positive, recovered)
+        self.unit_audit_status_codes = np.array(
+            [STATUS_CODE['negative'], STATUS_CODE['positive'], STATUS_CODE['recovered']])
+        
+        # Set up audit recorders
+        self.reset(env, pop)
+        
+    def reset(self, env, pop):
+        """
+        Set up new (empty) audit recorders for a model run, keeping unit information.
+        Audit DataFrames already produced from previous recorders are unaffected.
+        
+        Parameters
+        ----------
+        
+        env : Object
+            Model enviornment object.
+        pop : Object
+            Object holding patient populations (all patients, patients by COVID
+            stage, inpatients).
+        
+        Returns
+        -------
+        None.       
+        
+        """
+        
+        self._env = env
+        self._pop = pop
+        
+        # Set up audit recorders (buffers sized for number of audits in run)
+        params = self._params
+        number_of_audits = math.ceil(params.run_length / params.audit_interval)
+        day_dtype = np.asarray(params.audit_interval).dtype
+        
+        dtypes = {col: np.int64 for col in self.patient_cols}
+        dtypes['day'] = day_dtype
+        self.patient_recorder = AuditRecorder(self.patient_cols, dtypes, number_of_audits)
+
+        dtypes = {col: np.float64 for col in self.displaced_cols}
+        dtypes['day'] = day_dtype
+        dtypes['number'] = np.int64
+        self.displaced_recorder = AuditRecorder(self.displaced_cols, dtypes, number_of_audits)
+
+        self.unit_recorder = UnitAuditRecorder(
+            self.unit_cols[3:], self.audit_unit_list, self.audit_subunit_list, number_of_audits,
+            day_dtype, integer_metrics=['negative_shifts', 'positive_shifts'])
+        
+        dtypes = {'day': day_dtype, 'master_unit': object, 'subunit': object,
+                  'inpatients': np.int64}
+        self.inpatient_recorder = AuditRecorder(
+            self.inpatient_cols, dtypes, number_of_audits, len(self.audit_subunit_list))
+        
+    @property
+    def displaced_audit(self):
+        """DataFrame of displaced patient audit."""
+        
+        return self.displaced_recorder.to_dataframe()
+    
+    @property
+    def inpatient_audit(self):
+        """DataFrame of inpatient audit."""
+        
+        return self.inpatient_recorder.to_dataframe()
+    
+    @property
+    def patient_audit(self):
+        """DataFrame of patient audit."""
+        
+        return self.patient_recorder.to_dataframe()
+    
+    @property
+    def unit_audit(self):
+        """DataFrame of unit audit."""
+        
+        return self.unit_recorder.to_dataframe()
         
 
     def perform_patient_audit(self):
@@ -106,7 +400,7 @@ class Audit:
         # Continuous audit
         while True:
             
-            # General patient audit (put audit results in dictionary and add to audit DataFrame)
+            # General patient audit (put audit results in dictionary and add to audit recorder)
             audit = dict()
             audit['day'] = self._env.now
             audit['negative'] = len(self._pop.negative_patients)
@@ -116,26 +410,23 @@ class Audit:
             audit['died'] = len(self._pop.died_patients)
             audit['total'] = len(self._pop.patients)
             audit['unallocated'] = len(self._pop.unallocated_patients)
-            # Add dictionary to existing DataFrame
-            self.patient_audit = \
-                self.patient_audit.append(audit, ignore_index=True)
+            # Add dictionary to audit recorder
+            self.patient_recorder.record(audit)
             
-            # Displaced patient audit (put audit results in dictionary and add to audit DataFrame)
+            # Displaced patient audit (put audit results in dictionary and add to audit recorder)
             audit = dict()
-            # Get displaced times
-            additional_time = []
-            for patient in self._pop.displaced_patients:
-                additional_time.append(patient.displaced_additional_time)
+            # Get running statistics of displaced times (kept by displaced patient list)
+            additional_time = self._pop.displaced_patients.additional_time
             audit['day'] = self._env.now
             audit['number'] = len(self._pop.displaced_patients)
             if len(additional_time) > 0:
                 # Dispalced patients exist, calculate statistics
-                audit['add_time_min'] = np.min(additional_time)
-                audit['add_time_1Q'] = np.quantile(additional_time, 0.25)
-                audit['add_time_median'] = np.quantile(additional_time, 0.50)
-                audit['add_time_3Q'] = np.quantile(additional_time, 0.75)
-                audit['add_time_max'] = np.max(additional_time)
-                audit['add_time_total'] = np.sum(additional_time)
+                audit['add_time_min'] = additional_time.min()
+                audit['add_time_1Q'] = additional_time.quantile(0.25)
+                audit['add_time_median'] = additional_time.quantile(0.50)
+                audit['add_time_3Q'] = additional_time.quantile(0.75)
+                audit['add_time_max'] = additional_time.max()
+                audit['add_time_total'] = additional_time.total
             else:
                 # No displaced patients exist, set all statistics to zero
                 audit['add_time_min'] = 0
@@ -144,9 +435,8 @@ class Audit:
                 audit['add_time_3Q'] = 0
                 audit['add_time_max'] = 0
                 audit['add_time_total'] = 0
-            # Add dictionary to existing DataFrame
-            self.displaced_audit = \
-                self.displaced_audit.append(audit, ignore_index=True)
+            # Add dictionary to audit recorder
+            self.displaced_recorder.record(audit)
             
             # Trigger next audit after interval
             yield self._env.timeout(self._params.audit_interval)
@@ -161,49 +451,46 @@ class Audit:
         # Continuous audit
         while True:
 
-            audit = pd.DataFrame(columns=self.unit_cols)
-      
             # Outpatient audit
-
-            audit['negative'] = self._allocate.unit_sessions_count[
-                self._allocate.unit_sessions == 'negative'].sum(axis=1)
-            audit['positive'] = self._allocate.unit_sessions_count[
-                self._allocate.unit_sessions == 'positive'].sum(axis=1)
-            audit['recovered'] = self._allocate.unit_sessions_count[
-                self._allocate.unit_sessions == 'recovered'].sum(axis=1)
-            audit['neg+rec'] =  audit['negative'] + audit['recovered']
-            audit['total'] = audit['negative'] + audit['positive'] + audit['recovered']
-            audit['negative_shifts'] = (self._allocate.unit_sessions == 'negative').sum(axis=1)
-            audit['positive_shifts'] = (self._allocate.unit_sessions == 'positive').sum(axis=1)
-            audit['day'] = self._env.now
-            audit['master_unit'] = self.audit_unit_list
-            audit['subunit'] = self.audit_subunit_list
-            audit.reset_index(inplace=True)
-            audit.drop('index', axis=1, inplace=True)
+            
+            # Patient counts and number of sessions for each status with a single reduction:
+            # (subunit x session x status x [patients, sessions]) summed over sessions
+            session_status = self._allocate.session_status
+            session_count = self._allocate.session_count
+            has_status = (session_status[:, :, np.newaxis] == self.unit_audit_status_codes)
+            weights = np.stack([session_count, np.ones_like(session_count)], axis=-1)
+            totals = (has_status[:, :, :, np.newaxis] * 
+                      weights[:, :, np.newaxis, :]).sum(axis=1)
+            patients = totals[:, :, 0].astype(np.float64)
+            shifts = totals[:, :, 1]
+            
+            # Columns: negative, positive, recovered, neg+rec, total
+            patient_counts = np.column_stack([
+                patients,
+                patients[:, 0] + patients[:, 2],
+                patients[:, 0] + patients[:, 1] + patients[:, 2]])
             
             # Adjust patient counts if 2x weekly
             if self._params.drop_to_two_sessions:
-                cols_to_adjust = ['negative', 'positive', 'recovered', 'neg+rec', 'total']
-                audit[cols_to_adjust] = np.ceil(
-                    (audit[cols_to_adjust] * 0.667 * 
+                patient_counts = np.ceil(
+                    (patient_counts * 0.667 * 
                      self._params.prop_patients_drop_to_two_sessions) +
-                     audit[cols_to_adjust] * (1 - self._params.prop_patients_drop_to_two_sessions))
-
-            # Add audit to existing DataFrame            
-            self.unit_audit = self.unit_audit.append(audit, ignore_index=True)
+                     patient_counts * (1 - self._params.prop_patients_drop_to_two_sessions))
+            
+            # Add audit to audit recorder (negative and positive shifts follow patient counts)
+            self.unit_recorder.record(
+                self._env.now, np.column_stack([patient_counts, shifts[:, :2]]))
             
             # Inpatient audit
             
-            audit = pd.DataFrame(columns=self.inpatient_cols)
+            audit = dict()
+            audit['day'] = self._env.now
             audit['master_unit'] = self.audit_unit_list
             audit['subunit'] = self.audit_subunit_list
-            audit['inpatients'] = self._allocate.inpatient_counts.values.flatten()
-            audit['day'] = self._env.now
-            audit.reset_index(inplace=True)
-            audit.drop('index', axis=1, inplace=True)
+            audit['inpatients'] = self._allocate.inpatient_count
             
-            # Add audit to existing DataFrame
-            self.inpatient_audit = self.inpatient_audit.append(audit, ignore_index=True)
+            # Add audit to audit recorder
+            self.inpatient_recorder.record(audit)
 
             # Trigger next audit after interval        
             yield self._env.timeout(self._params.audit_interval)
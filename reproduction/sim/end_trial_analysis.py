@@ -3,6 +3,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 import math
 
+from .aggregation import (SUMMARY_FUNCTIONS, dense_audit, sum_by_master_unit,
+                          summarise_replications)
+from .output import load_audits
+
 
 class EndTrialAnalysis:
     """
@@ -33,6 +37,12 @@ class EndTrialAnalysis:
     # Methods
     ---------    
     
+    from_files:
+        Create analysis from saved audits (CSV or binary formats, see sim.output)
+        
+    from_summary:
+        Create analysis from online summary of replications (ReplicationSummary)
+        
     plot_displaced_audit:
         Charts number of patients displaced from their home units, and average additional
         travel time (one way). Saves figure.
@@ -55,81 +65,125 @@ class EndTrialAnalysis:
         """
         Constructor method prepares data for plotting.
         
-        Pivot tables aggregate data from multiple runs
+        Pivot tables aggregate data from multiple runs (median, minimum and maximum
+        across runs)
         
         d_audit_pivot: displaced patient audit pivoted by day
         p_audit_pivot: patient audit pivoted by day
         u_audit: unit audit pivoted by day
         i_audit_pivot: inpatient audit pivoted by day
+        
+        Audits are either expanded audits from run_replications (replication
+        number in 'scenario' column) or tidy tables (replication number in 'rep'
+        column, see sim.output).
         """
                
         self.name = name
         
-        self.unit_names = list(set(u_audit['master_unit']))
+        # Column holding replication number
+        rep_col = 'rep' if 'rep' in u_audit.columns else 'scenario'
         
-        # Displaced patient audit (convert numeric data to float to avoid castign error in pivot)
+        self.unit_names = list(pd.unique(u_audit['master_unit']))
+        
+        # Audits are reshaped to dense arrays (replications x days [x units] x metrics) and
+        # summarised over replications (see sim.aggregation)
+        
+        # Displaced patient audit
         
         data_cols = ['number','add_time_min', 'add_time_1Q', 'add_time_median', 'add_time_3Q',
                         'add_time_max', 'add_time_total']
         
-        d_audit[data_cols] = d_audit[data_cols].astype('float')
+        array, labels = dense_audit(d_audit, [rep_col, 'day'], data_cols)
+        self.d_audit_pivot = summarise_replications(array, labels[1:], ['day'], data_cols)
         
-        self.d_audit_pivot = d_audit.pivot_table(index=['day'],
-                values=data_cols,
-                aggfunc=[np.median, np.min, np.max],
-                margins=False) # margins summarises all
-        
-        # Patient audit (convert numeric data to float to avoid castign error in pivot)
+        # Patient audit
         
         data_cols = ['negative','positive', 'recovered', 'inpatient', 'died', 'unallocated']
         
-        p_audit[data_cols] = p_audit[data_cols].astype('float')
-        
-        self.p_audit_pivot = p_audit.pivot_table(index=['day'],
-                values=data_cols,
-                aggfunc=[np.median, np.min, np.max],
-                margins=False) # margins summarises all
+        array, labels = dense_audit(p_audit, [rep_col, 'day'], data_cols)
+        self.p_audit_pivot = summarise_replications(array, labels[1:], ['day'], data_cols)
         
-        # Unit audit (convert numeric data to float to avoid castign error in pivot)
+        # Unit audit (sum subunits of each master unit in each replication, then summarise)
         
         data_cols = ['negative','positive', 'recovered','neg+rec', 'total']
         
-        u_audit[data_cols] = u_audit[data_cols].astype('float')
+        array, labels = dense_audit(u_audit, [rep_col, 'day', 'subunit'], data_cols)
+        array, master_units = sum_by_master_unit(array, labels[2], u_audit)
+        self.u_audit_pivot = summarise_replications(
+            array, [labels[1], master_units], ['day', 'master_unit'], data_cols)
         
+        # Inpatient audit (sum subunits of each master unit in each replication, then summarise)
         
-        u_audit_sum_master_units = u_audit.pivot_table(index=['scenario', 'day', 'master_unit'],
-                values=data_cols,
-                aggfunc=[np.sum],
-                margins=False)
+        data_cols = ['inpatients']
         
-        self.u_audit_pivot = u_audit_sum_master_units['sum'].pivot_table(
-                index=['day', 'master_unit'],
-                values=data_cols,
-                aggfunc=[np.median, np.min, np.max],
-                margins=False) # margins summarises all
+        array, labels = dense_audit(i_audit, [rep_col, 'day', 'subunit'], data_cols)
+        array, master_units = sum_by_master_unit(array, labels[2], i_audit)
+        self.i_audit_pivot = summarise_replications(
+            array, [labels[1], master_units], ['day', 'master_unit'], data_cols)
+                
+
+    @classmethod
+    def from_files(cls, name, path_stem, output_format='csv'):
+        """
+        Create analysis from saved audits.
+        
+        Parameters
+        ----------
+        name : str
+            Scenario name.
+        path_stem : str
+            Start of file paths (folder, scenario name and number of reps), e.g.
+            'output/base_3_month_reps_30'.
+        output_format : str, optional
+            'csv', 'parquet', 'feather' or 'npz'. The default is 'csv'.
+        
+        Returns
+        -------
+        EndTrialAnalysis
+        """
         
-        # Inpatient audit
+        return cls(name, *load_audits(name, path_stem, output_format))
         
-        # Dummy column added as pivot was misbehaving with only one data column!
         
-        i_audit['dummy'] = 1
+    @classmethod
+    def from_summary(cls, name, summary):
+        """
+        Create analysis from an online summary of replications (see
+        sim.aggregation.ReplicationSummary), without holding all replication
+        audits. Median, minimum and maximum are the same as from audits while
+        the number of replications is within the capacity of the summary's
+        quantile sketches (medians are estimated beyond that).
+        
+        Parameters
+        ----------
+        name : str
+            Scenario name.
+        summary : ReplicationSummary
+            Summary of replications.
+        
+        Returns
+        -------
+        EndTrialAnalysis
+        """
         
-        data_cols = ['inpatients', 'dummy']
-        i_audit[data_cols] = i_audit[data_cols].astype('float')
+        analysis = cls.__new__(cls)
+        analysis.name = name
+        analysis.unit_names = list(summary.labels['unit'][1])
         
-        inpatient_audit_sum_master_units = i_audit.pivot_table(
-                index=['scenario', 'day', 'master_unit'],
-                values=data_cols,
-                aggfunc=[np.sum],
-                margins=False)
+        # Pivot tables (median, minimum and maximum; metrics in sorted order)
+        pivots = dict()
+        for audit_name in ['displaced', 'patient', 'unit', 'inpatient']:
+            audit_summary = summary.summary(audit_name)
+            metrics = sorted(audit_summary.columns.levels[1])
+            columns = pd.MultiIndex.from_product([list(SUMMARY_FUNCTIONS), metrics])
+            pivots[audit_name] = audit_summary[columns].dropna(how='all')
+        analysis.d_audit_pivot = pivots['displaced']
+        analysis.p_audit_pivot = pivots['patient']
+        analysis.u_audit_pivot = pivots['unit']
+        analysis.i_audit_pivot = pivots['inpatient']
+        
+        return analysis
         
-   
-        self.i_audit_pivot = inpatient_audit_sum_master_units['sum'].pivot_table(
-                index=['day', 'master_unit'],
-                values=data_cols,
-                aggfunc=[np.median, np.min, np.max],
-                margins=False) # margins summarises all
-                
 
     def plot_displaced_audit(self):
         """
@@ -0,0 +1,195 @@
+'''
+Contains class holding model input data (read once and shared between
+replications)
+'''
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from .units import Dialysis_units
+
+
+class ModelInputs:
+    """
+    Read-only bundle of model input data. Reads patient, unit and travel
+    matrix data from CSV and ranks units (by travel time, and by given order
+    for COVID +ve patients) once, so that replications can share the results
+    rather than each re-reading and re-ranking.
+
+    Arrays are set read-only. DataFrames should be treated as read-only (model
+    objects copy them before making any changes). Use to_memmap() to back
+    arrays with memory-mapped .npy files (as parallel replications do): a
+    bundle with memory-mapped arrays is pickled with the paths of the files
+    rather than the arrays, so worker processes share the files.
+
+    Object attributes
+    -----------------
+
+    given_order: List of preferred order of subunits for COVID-positive patients
+    patient_data: DataFrame of patient data (COVID status filled as negative)
+    patient_locations: List of patient postcode sectors (travel matrix rows)
+    travel_matrix: NumPy array of travel times (patient postcode x unit location)
+    unit_info: DataFrame of unit information
+    unit_locations: List of unit postcodes (travel matrix columns)
+    unit_preference_index: NumPy array of subunit indices (patient postcode x rank)
+        ordered by proximity to each patient postcode
+    unit_preferences: DataFrame of subunits ordered by proximity to each patient postcode
+
+    Methods
+    -------
+
+    load:
+        Read input data from CSV files and rank units (class method)
+
+    to_memmap:
+        Save arrays to .npy files and return bundle using memory-mapped arrays
+    """
+
+    def __init__(self, patient_data, unit_info, travel_matrix,
+                 patient_locations, unit_locations, unit_preference_index,
+                 unit_preferences, given_order):
+        """
+        Constructor for model inputs (use ModelInputs.load() to read from CSV).
+
+        Parameters
+        ----------
+        patient_data : DataFrame
+            Patient data.
+        unit_info : DataFrame
+            Unit information.
+        travel_matrix : NumPy array
+            Travel times (patient postcode x unit location).
+        patient_locations : list
+            Patient postcode sectors (travel matrix rows).
+        unit_locations : list
+            Unit postcodes (travel matrix columns).
+        unit_preference_index : NumPy array
+            Subunit indices (position in unit_info) ordered by proximity to each
+            patient postcode.
+        unit_preferences : DataFrame
+            Subunits ordered by proximity to each patient postcode.
+        given_order : list
+            Preferred order of subunits for COVID-positive patients.
+        """
+        self.patient_data = patient_data
+        self.unit_info = unit_info
+        self.travel_matrix = travel_matrix
+        if isinstance(travel_matrix, np.ndarray):
+            self.travel_matrix.setflags(write=False)
+        self.patient_locations = list(patient_locations)
+        self.unit_locations = list(unit_locations)
+        self.unit_preference_index = unit_preference_index
+        if isinstance(unit_preference_index, np.ndarray):
+            self.unit_preference_index.setflags(write=False)
+        self.unit_preferences = unit_preferences
+        self.given_order = list(given_order)
+
+    @classmethod
+    def load(cls, data_folder='data', cache_folder=None):
+        """
+        Read input data from CSV files and rank units.
+
+        Parameters
+        ----------
+        data_folder : str, optional
+            Folder containing patients.csv, units.csv and travel_matrix.csv.
+            The default is 'data'.
+        cache_folder : str, optional
+            Folder to cache unit rankings in. The default is None (no caching).
+
+        Returns
+        -------
+        ModelInputs
+        """
+        # Read patient data (treat missing COVID status as negative)
+        patient_data = pd.read_csv(os.path.join(data_folder, 'patients.csv'))
+        patient_data['COVID status'].fillna('negative', inplace=True)
+
+        # Read units and travel matrix, and rank units
+        units = Dialysis_units(None, data_folder=data_folder,
+                               cache_folder=cache_folder)
+
+        return cls(patient_data=patient_data,
+                   unit_info=units.unit_info,
+                   travel_matrix=units.travel_times.values.copy(),
+                   patient_locations=units.travel_times.index,
+                   unit_locations=units.travel_times.columns,
+                   unit_preference_index=units.unit_preference_index,
+                   unit_preferences=units.unit_preferences,
+                   given_order=units.given_order)
+
+    @property
+    def travel_times(self):
+        """DataFrame view of travel matrix (index = patient postcode sector)"""
+        travel_times = pd.DataFrame(
+            self.travel_matrix, index=self.patient_locations,
+            columns=self.unit_locations)
+        travel_times.index.name = 'from_postcode'
+        return travel_times
+
+    def to_memmap(self, folder=None):
+        """
+        Save arrays to .npy files and return a copy of the bundle whose arrays
+        are memory-mapped (read-only) from those files. Worker processes that
+        receive the copy then share the files rather than holding their own
+        copies of the arrays.
+
+        Parameters
+        ----------
+        folder : str, optional
+            Folder to save .npy files to. If None, files are saved to a
+            temporary folder, removed when the returned bundle is garbage
+            collected. The default is None.
+
+        Returns
+        -------
+        ModelInputs
+        """
+        temporary = folder is None
+        if temporary:
+            folder = tempfile.mkdtemp(prefix='model_inputs_')
+        path = os.path.join(folder, 'travel_matrix.npy')
+        np.save(path, self.travel_matrix)
+        preference_path = os.path.join(folder, 'unit_preference_index.npy')
+        np.save(preference_path, self.unit_preference_index)
+        inputs = ModelInputs(patient_data=self.patient_data,
+                             unit_info=self.unit_info,
+                             travel_matrix=np.load(path, mmap_mode='r'),
+                             patient_locations=self.patient_locations,
+                             unit_locations=self.unit_locations,
+                             unit_preference_index=np.load(preference_path, mmap_mode='r'),
+                             unit_preferences=self.unit_preferences,
+                             given_order=self.given_order)
+        if temporary:
+            weakref.finalize(inputs, shutil.rmtree, folder, True)
+        return inputs
+
+    def __getstate__(self):
+        """Pickle memory-mapped arrays as paths of their .npy files"""
+        state = self.__dict__.copy()
+        for name in ['travel_matrix', 'unit_preference_index']:
+            values = state[name]
+            if isinstance(values, np.memmap) and values.filename is not None:
+                state[name] = MemmapPath(values.filename)
+        return state
+
+    def __setstate__(self, state):
+        """Memory-map arrays pickled as paths (read-only)"""
+        for name, values in state.items():
+            if isinstance(values, MemmapPath):
+                state[name] = np.load(values.path, mmap_mode='r')
+        self.__dict__.update(state)
+
+
+class MemmapPath:
+    """
+    Path of a .npy file holding a memory-mapped array (used to pickle
+    ModelInputs arrays)
+    """
+
+    def __init__(self, path):
+        self.path = path
@@ -1,11 +1,177 @@
+import math
+
 import simpy
 import pandas as pd
 import numpy as np
 
 from .patient import Patient
 from .units import Dialysis_units
-from .allocation import AllocatePatients
+from .allocation import AllocatePatients, STATUS_CODE
 from .audit import Audit
+from .inputs import ModelInputs
+from .progression import PatientProgressionCalendar
+from .statistics import OrderStatistics
+
+class PatientList:
+    """
+    Insertion-ordered collection of patients backed by a dictionary (used as an ordered set).
+    Supports the list operations used on population lists (append, remove, pop, len, `in`,
+    iteration) with constant-time membership tests and removal. Iteration order is order
+    of insertion, as with a list. Appending a patient already in the collection leaves it
+    in its current position.
+    
+    Attributes
+    ----------
+    
+    on_append: optional function called with patient whenever a patient is appended
+        (None by default)
+    
+    Methods
+    -------
+    
+    append:
+        Add patient to end of collection
+        
+    clear:
+        Remove all patients
+        
+    discard:
+        Remove patient if present
+        
+    pop:
+        Remove and return last patient added
+        
+    remove:
+        Remove patient (raises ValueError if not present)
+    
+    """
+    
+    def __init__(self, patients=()):
+        """
+        Constructor method.
+
+        Parameters
+        ----------
+        patients : iterable, optional
+            Patients to add (in order). The default is empty.
+
+        """
+        
+        self._patients = dict.fromkeys(patients)
+        self.on_append = None
+        
+    def __contains__(self, patient):
+        return patient in self._patients
+    
+    def __iter__(self):
+        return iter(self._patients)
+    
+    def __len__(self):
+        return len(self._patients)
+    
+    def __repr__(self):
+        return f'PatientList({list(self._patients)})'
+        
+    def append(self, patient):
+        """Add patient to end of collection."""
+        
+        self._patients[patient] = None
+        if self.on_append is not None:
+            self.on_append(patient)
+        
+    def clear(self):
+        """Remove all patients."""
+        
+        self._patients.clear()
+        
+    def discard(self, patient):
+        """Remove patient if present."""
+        
+        self._patients.pop(patient, None)
+        
+    def pop(self):
+        """Remove and return last patient added."""
+        
+        return self._patients.popitem()[0]
+        
+    def remove(self, patient):
+        """Remove patient (raises ValueError if not present)."""
+        
+        try:
+            del self._patients[patient]
+        except KeyError:
+            raise ValueError(f'{patient} not in PatientList') from None
+
+
+class DisplacedPatientList(PatientList):
+    """
+    PatientList of displaced patients which also keeps running statistics of their
+    additional travel time. Each patient's displaced_additional_time is recorded when they
+    are added and removed from the statistics when they leave the list, so quantiles and
+    totals are available at any time without rebuilding from the patient list.
+    
+    Attributes
+    ----------
+    
+    additional_time: OrderStatistics of additional travel time of patients in list
+    
+    """
+    
+    def __init__(self, patients=()):
+        """
+        Constructor method.
+
+        Parameters
+        ----------
+        patients : iterable, optional
+            Patients to add (in order). The default is empty.
+
+        """
+        
+        super().__init__()
+        self.additional_time = OrderStatistics()
+        for patient in patients:
+            self.append(patient)
+            
+    def __repr__(self):
+        return f'DisplacedPatientList({list(self._patients)})'
+        
+    def append(self, patient):
+        """Add patient to end of collection (updating additional time if already present)."""
+        
+        if patient in self._patients:
+            self.additional_time.remove(self._patients[patient])
+        self._patients[patient] = patient.displaced_additional_time
+        self.additional_time.add(patient.displaced_additional_time)
+        if self.on_append is not None:
+            self.on_append(patient)
+        
+    def clear(self):
+        """Remove all patients."""
+        
+        self._patients.clear()
+        self.additional_time = OrderStatistics()
+        
+    def discard(self, patient):
+        """Remove patient if present."""
+        
+        if patient in self._patients:
+            self.additional_time.remove(self._patients.pop(patient))
+        
+    def pop(self):
+        """Remove and return last patient added."""
+        
+        patient, additional_time = self._patients.popitem()
+        self.additional_time.remove(additional_time)
+        return patient
+        
+    def remove(self, patient):
+        """Remove patient (raises ValueError if not present)."""
+        
+        if patient not in self._patients:
+            raise ValueError(f'{patient} not in DisplacedPatientList')
+        self.discard(patient)
+
 
 class Population:
     """
@@ -16,6 +182,10 @@ class Population:
     Attributes
     ----------
     
+    Patient lists are PatientList objects (insertion-ordered, constant-time membership and
+    removal). The displaced patient list also keeps statistics of additional travel time
+    (DisplacedPatientList).
+    
     patients: dictionary of all patients
     unallocated_patients: list (of patient objects) of patients not currently allocated
     displaced_patients: list (of patient objects) of patients displaced from home unit
@@ -35,14 +205,14 @@ class Population:
         
         # Patient populations
         self.patients = dict()
-        self.unallocated_patients = []
-        self.displaced_patients = []
-        self.negative_patients = []
-        self.positive_patients = []
-        self.recovered_patients = []
-        self.died_patients = []
+        self.unallocated_patients = PatientList()
+        self.displaced_patients = DisplacedPatientList()
+        self.negative_patients = PatientList()
+        self.positive_patients = PatientList()
+        self.recovered_patients = PatientList()
+        self.died_patients = PatientList()
         self.default_travel_times = []
-        self.inpatients = [] 
+        self.inpatients = PatientList()
         
 
 class DialysisSim:
@@ -58,6 +228,9 @@ class DialysisSim:
     allocate: Patient allocation object
     audit: Audit object (patients, units, displaced patients, inpatients)
     patient_data: patient data (location and current unit) read from CSV
+    optimisation_results: list of dictionaries of displaced patients and total additional
+        travel time before and after optimisation (reallocation_mode 'optimal')
+    progression: Patient progression event calendar (None if one process per patient)
     
     
     Methods
@@ -68,29 +241,66 @@ class DialysisSim:
         allocated (as room in sessions is made free by other patients being reallocated as
         COVID status changes.)
         
+    notify:
+        Trigger process waiting for patients to become unallocated or displaced.
+        
     reallocate_all_patients:
         Reallocation of all patients reassigns all patients, optimising use of units and minimising
         travel times for patients. Is called typically every 7 days.
         
+    reallocate_displaced_patients:
+        Incremental reallocation of displaced patients (and patients in sessions they could move
+        back into).
+        
+    optimise_allocation:
+        Reallocate all patients, assigning COVID -ve and recovered patients to minimise total
+        additional travel time.
+        
+    rebuild_allocation:
+        Remove all patients from sessions and re-allocate.
+        
+    reset:
+        Reset model for a new run with a given random number set (keeping unit information).
+        
     run:
         Set up regular processes (audits + reallocation methods). And start environment running.
     
+    wait_for_notification:
+        Wait (in a SimPy process) until notified that patients are unallocated or displaced.
+    
     set_up_patient_population:
         Create patient objects, and start virus progression for each patient.
         
+    set_up_run:
+        Set up state for a model run (results, reallocation triggers and patient population).
+        
     
     """    
     
     
-    def __init__(self, scenario):
-        """constructor for initiating simpy simulation environment"""
+    def __init__(self, scenario, inputs=None):
+        """
+        constructor for initiating simpy simulation environment
+        
+        Parameters
+        ----------
+        scenario : Object
+            Scenario parameters object.
+        inputs : ModelInputs, optional
+            Preloaded model input data (patients, units, travel matrix and unit rankings). If
+            None, input data is read from the data/ folder. The default is None.
+        """
         
         self._params = scenario
+        
+        # Load model input data
+        if inputs is None:
+            inputs = ModelInputs.load()
 
         # Set up simpy environment        
         self._env = simpy.Environment()
         # Set up units
-        self._units = Dialysis_units(self._env)
+        self._units = Dialysis_units(self._env, inputs)
         # Set up population 
         self.pop = Population()
         # Set up patient/unit allocations methods
@@ -98,20 +308,25 @@ class DialysisSim:
         # Set up audit class
         self.audit = Audit(self._env, self.allocate, self.pop, self._params, self._units.unit_info)
         
-        # Load patient data:
-        self.patient_data = pd.read_csv('data/patients.csv')
-        self.patient_data['COVID status'].fillna('negative', inplace=True)
+        # Patient data (location and current unit)
+        self.patient_data = inputs.patient_data
         
-        # Initiate patient population
-        self.set_up_patient_population()
+        # Set up run state and patient population
+        self.set_up_run()
         
     def check_sessions_for_unallocated_patients(self):
         """
         If there are patients unallocated to sessions, check (daily) whether they can be
         allocated (as room in sessions is made free by other patients being reallocated as
         COVID status changes.)
+        
+        If scenario reallocation_trigger is 'event', then when there are no unallocated
+        patients the process waits until a patient is unallocated, and then resumes at the
+        next daily check (rather than waking every day). Checks therefore happen on the same
+        days as with daily checking, with the same results.
         """
         
+        day = self._env.now
         while True:
             # Check if there are unallocated patients
             if len(self.pop.unallocated_patients) > 0:
@@ -119,11 +334,14 @@ class DialysisSim:
                 # First compress allocated cov +ve sessions
                 for patient in self.pop.positive_patients:
                     if patient.unallocated_to_session == False:
-                        self.allocate.units_count.loc[patient.current_unit][patient.session] -= 1
+                        unit_index = self.allocate.unit_index[patient.current_unit]
+                        session_index = self.allocate.session_index[patient.session]
+                        count = self.allocate.session_count[unit_index, session_index] - 1
+                        self.allocate.set_session_state(unit_index, session_index, count=count)
                         # Check if session can be re-allocated
-                        if self.allocate.units_count.loc[patient.current_unit][
-                            patient.session] == 0:
-                            self.allocate.units.loc[patient.current_unit][patient.session] = 'neg'
+                        if count == 0:
+                            self.allocate.set_session_state(
+                                unit_index, session_index, STATUS_CODE['negative'])
                 
                 # Re-assign cov +ve patients
                 print('reassigning patients')
@@ -132,7 +350,8 @@ class DialysisSim:
                         self.allocate.allocate_patient(patient)
                 
                 # Now go through unallocated patient list
-                still_unallocated = []
+                still_unallocated = PatientList()
+                still_unallocated.on_append = self.pop.unallocated_patients.on_append
                 # Use dictionary to skip reallocation when no more neg or pos can be reallocated
                 re_allocate = {'negative': True, 'positive': True, 'recovered': True}
                 # Go through unallocated patient list, remove and try to allocate
@@ -155,57 +374,244 @@ class DialysisSim:
                 # Refresh list of unalocated population in opo class
                 self.pop.unallocated_patients = still_unallocated
                 
-            # Delay of 1 day befor enext reallocation 
-            yield self._env.timeout(1)
+            # Delay of 1 day befor enext reallocation (or to next day after patient
+            # unallocated if waiting for notification)
+            next_day = day + 1
+            if (self._params.reallocation_trigger == 'event' and
+                    len(self.pop.unallocated_patients) == 0):
+                yield from self.wait_for_notification('unallocated')
+                next_day = max(next_day, math.ceil(self._env.now))
+            yield self._env.timeout(next_day - self._env.now)
+            day = next_day
             
             
     def reallocate_all_patients(self):
         """
         Reallocation of all patients reassigns all patients, optimising use of units and minimising
         travel times for patients. Is called typically every 28 days.
+        
+        If scenario reallocation_mode is 'incremental', only displaced patients and patients in
+        sessions they could move back into are reassigned (see reallocate_displaced_patients).
+        If 'optimal', COVID -ve and recovered patients are reassigned to minimise total additional
+        travel time (see optimise_allocation).
+        
+        If scenario reallocation_trigger is 'event', then when there are no displaced patients
+        the process waits until a patient is displaced, and then resumes at the next scheduled
+        reallocation time (rather than waking at every scheduled time).
 
         """
         
-        # Set up dictionary to hold population lists by COVID status
-        patient_dict = {'negative': self.pop.negative_patients, 
-                        'positive': self.pop.positive_patients,
-                        'recovered': self.pop.recovered_patients}
+        if self._params.reallocation_mode == 'incremental':
+            reallocate = self.reallocate_displaced_patients
+        elif self._params.reallocation_mode == 'optimal':
+            reallocate = self.optimise_allocation
+        elif self._params.reallocation_mode == 'full':
+            reallocate = self.rebuild_allocation
+        else:
+            raise ValueError(
+                f'Unknown reallocation mode: {self._params.reallocation_mode}')
         
         # Continuous loop
+        reallocation_time = self._env.now
         while True:
             
             # Delay before first reallocation
-            yield self._env.timeout(7.1)
+            reallocation_time = reallocation_time + 7.1
+            if (self._params.reallocation_trigger == 'event' and
+                    len(self.pop.displaced_patients) == 0):
+                yield from self.wait_for_notification('displaced')
+                # Skip reallocation times passed while waiting
+                while reallocation_time < self._env.now:
+                    reallocation_time = reallocation_time + 7 + 7.1
+            yield self._env.timeout(reallocation_time - self._env.now)
              
             # Run reallocation only if patients currently displaced from their home unit
             if len(self.pop.displaced_patients) > 0:
+                reallocate()
+
+            # Wait 28 days to next reallocation
+            reallocation_time = reallocation_time + 7
+            
+            
+    def optimise_allocation(self):
+        """
+        Reallocate all patients, assigning COVID -ve and recovered patients to minimise total
+        additional travel time. COVID +ve patients are first allocated as in a full rebuild
+        (which sets the sessions used for COVID +ve patients), then COVID -ve and recovered
+        patients are assigned to the remaining negative sessions by solving a min-cost
+        transportation problem (AllocatePatients.allocate_patients_min_cost). Displaced
+        patients and total additional travel time from the full rebuild, and after
+        optimisation, are recorded in optimisation_results.
+        """
+        
+        # Full rebuild (records result of greedy allocation)
+        self.rebuild_allocation()
+        greedy_displaced = len(self.pop.displaced_patients)
+        greedy_additional_time = self.pop.displaced_patients.additional_time.total
+        
+        # Remove COVID -ve and recovered patients
+        patient_dict = {'negative': self.pop.negative_patients,
+                        'recovered': self.pop.recovered_patients}
+        to_allocate = []
+        for status in ['recovered', 'negative']:
+            patients = list(patient_dict[status])
+            for patient in patients:
+                self.allocate.remove_patient(patient)
+                patient_dict[status].append(patient)
+            to_allocate.extend(patients)
+        
+        # Allocate to minimise additional travel time
+        self.allocate.allocate_patients_min_cost(to_allocate)
+        
+        optimised_additional_time = self.pop.displaced_patients.additional_time.total
+        self.optimisation_results.append({
+            'day': self._env.now,
+            'greedy_displaced': greedy_displaced,
+            'greedy_add_time_total': greedy_additional_time,
+            'optimised_displaced': len(self.pop.displaced_patients),
+            'optimised_add_time_total': optimised_additional_time,
+            'improvement': greedy_additional_time - optimised_additional_time})
+        
+        
+    def rebuild_allocation(self):
+        """
+        Remove all patients (except inpatients and died patients) from sessions, and
+        re-allocate them (COVID +ve first, then recovered, then negative).
+        """
+        
+        # Set up dictionary to hold population lists by COVID status
+        patient_dict = {'negative': self.pop.negative_patients, 
+                        'positive': self.pop.positive_patients,
+                        'recovered': self.pop.recovered_patients}
+        
+        # Remove all patients from population lists
+        for key, patient in self.pop.patients.items():
+            # Do not reallocate inpatients and died patients
+            if patient.status in ['negative', 'positive', 'recovered']:
+                self.allocate.remove_patient(patient)
+                # Add patient to temprary lists of patients
+                patient_dict[patient.status].append(patient)  
+        
+        # Reset list of displaced patients
+        self.pop.displaced_patients.clear()
+        
+        # Allocate patients (Cov +ve first then negative)
+        self.allocate.allocate_many(self.pop.positive_patients)
+        self.allocate.allocate_many(self.pop.recovered_patients)
+        self.allocate.allocate_many(self.pop.negative_patients)
                 
-                # Remove all patients from population lists
-                for key, patient in self.pop.patients.items():
-                    # Do not reallocate inpatients and died patients
-                    if patient.status in ['negative', 'positive', 'recovered']:
-                        self.allocate.remove_patient(patient)
-                        # Add patient to temprary lists of patients
-                        patient_dict[patient.status].append(patient)  
-                
-                # Reset list of displaced patients
-                self.pop.displaced_patients = []
                 
-                # Allocate patients (Cov +ve first then negative)
-                if len(self.pop.positive_patients) > 0:
-                    for patient in self.pop.positive_patients:
-                        self.allocate.allocate_patient(patient)
-                if len(self.pop.recovered_patients) > 0:
-                    for patient in self.pop.recovered_patients:
-                        self.allocate.allocate_patient(patient)
-                if len(self.pop.negative_patients) > 0:
-                    for patient in self.pop.negative_patients:
-                        self.allocate.allocate_patient(patient)
+    def reallocate_displaced_patients(self):
+        """
+        Incremental reallocation. Removes from sessions only displaced patients, unallocated
+        patients (including COVID -ve patients cleared from sessions opened for COVID +ve
+        patients, which are not in the list of unallocated patients), and patients in sessions
+        at the displaced patients' default subunits (the sessions they could move back into).
+        These patients are then re-allocated (COVID +ve first, then recovered, then negative;
+        in order of patient ID within each), as in a full rebuild. Other patients keep their
+        sessions.
+        """
+        
+        patient_dict = {'negative': self.pop.negative_patients, 
+                        'positive': self.pop.positive_patients,
+                        'recovered': self.pop.recovered_patients}
+        
+        # Patients to reallocate
+        to_reallocate = set(self.pop.displaced_patients)
+        to_reallocate.update(self.pop.unallocated_patients)
+        for patients in patient_dict.values():
+            to_reallocate.update(
+                patient for patient in patients if patient.unallocated_to_session)
+        default_units = set()
+        for patient in self.pop.displaced_patients:
+            default_units.update(patient.default_unit)
+        for unit in default_units:
+            unit_index = self.allocate.unit_index.get(unit)
+            if unit_index is not None:
+                for session_patients in self.allocate.session_patients[unit_index]:
+                    to_reallocate.update(session_patients)
+        
+        # Remove patients from sessions (except inpatients and died patients)
+        to_allocate = {'positive': [], 'recovered': [], 'negative': []}
+        for patient in sorted(to_reallocate, key=lambda patient: patient.patient_id):
+            if patient.status in to_allocate:
+                self.allocate.remove_patient(patient)
+                patient_dict[patient.status].append(patient)
+                to_allocate[patient.status].append(patient)
+        
+        # Allocate patients (Cov +ve first then recovered then negative)
+        for status in ['positive', 'recovered', 'negative']:
+            self.allocate.allocate_many(to_allocate[status])
+        
+        # Remove patients allocated to a session from list of unallocated patients (so
+        # they are not allocated again by check_sessions_for_unallocated_patients)
+        for patients in to_allocate.values():
+            for patient in patients:
+                if not patient.unallocated_to_session:
+                    self.pop.unallocated_patients.discard(patient)
+        
+        
+    def notify(self, name):
+        """
+        Trigger process waiting for patients to become unallocated or displaced (if any).
 
-            # Wait 28 days to next reallocation
-            yield self._env.timeout(7)
+        Parameters
+        ----------
+        name : str
+            'unallocated' or 'displaced'.
+        """
+        
+        event = self._notifications[name]
+        if event is not None:
+            self._notifications[name] = None
+            event.succeed()
             
             
+    def wait_for_notification(self, name):
+        """
+        Wait (in a SimPy process, using `yield from`) until notified that patients have
+        become unallocated or displaced.
+
+        Parameters
+        ----------
+        name : str
+            'unallocated' or 'displaced'.
+        """
+        
+        event = self._env.event()
+        self._notifications[name] = event
+        yield event
+        
+        
+    def reset(self, random_number_set, antithetic=False):
+        """
+        Reset model for a new run with a given random number set. Unit information,
+        unit rankings, chairs and travel times are kept; a new SimPy environment,
+        patient population, session allocation state and audit recorders are set up,
+        and patient samples are drawn again. A model that is reset gives the same
+        results as a new model created with the same random number set.
+        Audits from previous runs (DataFrames) are unaffected.
+
+        Parameters
+        ----------
+        random_number_set : int or None
+            Random number set for run (None for a random set of seeds).
+        antithetic : bool, optional
+            Use antithetic samples of the random number set. The default is False.
+        """
+        
+        self._params.set_random_no_set(random_number_set, antithetic)
+        
+        # Set up new environment and population (keeping unit information)
+        self._env = simpy.Environment()
+        self._units._env = self._env
+        self.pop = Population()
+        self.allocate.reset(self.pop)
+        self.audit.reset(self._env, self.pop)
+        
+        # Set up run state and patient population
+        self.set_up_run()
+        
     def run(self):
         """
         Set up regular processes (audits + reallocation methods). And start environment running.
@@ -222,69 +628,194 @@ class DialysisSim:
 
             
     
+    def sample_patient_parameters(self, number_of_patients):
+        """
+        Draw infection and inpatient samples for all patients as arrays. Each
+        distribution has its own random number stream; samples are drawn from
+        each stream in patient order (and only for patients that need them, e.g.
+        time to infection only for patients who will be infected), so results
+        match drawing samples one patient at a time.
+
+        If scenario common_random_numbers is True, every stream is sampled for
+        every patient (including mortality, otherwise sampled at the end of
+        infection in event order), so each patient gets the same random numbers
+        whatever the scenario parameters (common random numbers).
+
+        Parameters
+        ----------
+        number_of_patients : int
+            Number of patients to draw samples for.
+
+        Returns
+        -------
+        samples : dict
+            Dictionary of lists (one entry per patient): will_be_infected,
+            time_to_infection, time_positive, require_inpatient, inpatient_los,
+            random_positive (uniform random number for random positives at
+            start) and mortality_random (uniform random number for mortality,
+            or None if sampled at end of infection).
+        """
+
+        params = self._params
+        common = params.common_random_numbers
+
+        will_be_infected = (params.will_be_infected_rand.sample(number_of_patients) <
+                            params.total_proportion_people_infected)
+        time_to_infection = np.full(number_of_patients, 99999, dtype=object)
+        if common:
+            time_to_infection[will_be_infected] = params.time_to_infection.sample(
+                number_of_patients)[will_be_infected].tolist()
+        else:
+            time_to_infection[will_be_infected] = params.time_to_infection.sample(
+                int(will_be_infected.sum())).tolist()
+
+        time_positive = np.array(
+            params.time_positive.sample(number_of_patients).tolist(), dtype=object)
+        require_inpatient = (params.requiring_inpatient_random.sample(number_of_patients) <
+                             params.proportion_pos_requiring_inpatient)
+        # Over-write pos LoS for inpatients (as used for outpatient care)
+        inpatient_los = np.zeros(number_of_patients, dtype=object)
+        if common:
+            time_positive[require_inpatient] = params.time_pos_before_inpatient.sample(
+                number_of_patients)[require_inpatient].tolist()
+            inpatient_los[require_inpatient] = params.time_inpatient.sample(
+                number_of_patients)[require_inpatient].tolist()
+            mortality_random = params.mortality_rand.sample(number_of_patients).tolist()
+        else:
+            number_inpatient = int(require_inpatient.sum())
+            time_positive[require_inpatient] = (
+                params.time_pos_before_inpatient.sample(number_inpatient).tolist())
+            inpatient_los[require_inpatient] = params.time_inpatient.sample(
+                number_inpatient).tolist()
+            mortality_random = [None] * number_of_patients
+
+        samples = {
+            'will_be_infected': will_be_infected.tolist(),
+            'time_to_infection': time_to_infection.tolist(),
+            'time_positive': time_positive.tolist(),
+            'require_inpatient': require_inpatient.tolist(),
+            'inpatient_los': inpatient_los.tolist(),
+            'random_positive': params.random_positive_rand.sample(
+                number_of_patients).tolist(),
+            'mortality_random': mortality_random}
+
+        return samples
+
+
     def set_up_patient_population(self):
         """
         Create patient objects, and start virus progression for each patient.
+        Samples for all patients are drawn first (see sample_patient_parameters),
+        then patients are created, allocated (AllocatePatients.load_patients) and started,
+        in patient data order.
+        Progression uses one SimPy process per patient, or a single event calendar
+        (PatientProgressionCalendar) if scenario progression_engine is 'calendar'.
         """
 
+        patient_data = self.patient_data
+        samples = self.sample_patient_parameters(len(patient_data))
+
+        # Set up progression engine
+        if self._params.progression_engine == 'calendar':
+            self.progression = PatientProgressionCalendar(self._env)
+        elif self._params.progression_engine == 'process':
+            self.progression = None
+        else:
+            raise ValueError(
+                f'Unknown progression engine: {self._params.progression_engine}')
+
+        # Map master units to subunits (in unit info order)
+        subunits_by_master_unit = dict()
+        for subunit, master_unit in zip(self._units.unit_info.index,
+                                        self._units.unit_info['unit']):
+            subunits_by_master_unit.setdefault(master_unit, []).append(subunit)
+
+        columns = zip(patient_data['Patient ID'].tolist(),
+                      patient_data['Postcode sector'].tolist(),
+                      patient_data['Patient type'].tolist(),
+                      patient_data['first_day'].tolist(),
+                      patient_data['COVID status'].tolist(),
+                      patient_data['Site Postcode'].tolist(),
+                      patient_data['Site'].tolist())
+
         # Instantise patients
-        for key, value in self.patient_data.iterrows():
+        patients = []
+        for i, (patient_id, location, dialysis_type, first_day, status,
+                default_unit_location, master_unit) in enumerate(columns):
 
-        # Set up patient details in dictionary (to be passed to Patient class)
+            # Set up patient details in dictionary (to be passed to Patient class)
             patient_dict = dict()
-            patient_dict['patient_id'] = value['Patient ID']
-            patient_dict['location'] = value['Postcode sector']
-            patient_dict['dialysis_type'] = value['Patient type']
-            patient_dict['first_day'] = value['first_day']
-                        
-            patient_dict['will_be_infected'] = (
-                True if self._params.will_be_infected_rand.sample() < 
-                self._params.total_proportion_people_infected else False)
-
-            patient_dict['time_to_infection'] = (
-                    self._params.time_to_infection.sample() if 
-                    patient_dict['will_be_infected'] else 99999)
+            patient_dict['patient_id'] = patient_id
+            patient_dict['location'] = location
+            patient_dict['dialysis_type'] = dialysis_type
+            patient_dict['first_day'] = first_day
+            patient_dict['will_be_infected'] = samples['will_be_infected'][i]
+            patient_dict['time_to_infection'] = samples['time_to_infection'][i]
+            patient_dict['time_positive'] = samples['time_positive'][i]
 
-            patient_dict['time_positive'] = self._params.time_positive.sample()
-            patient_dict['status'] = value['COVID status']
-            
             # Turn all current suspected into negatives (assume will be treated in side rooms)
-            if patient_dict['status'] == 'suspected':
-                patient_dict['status'] = 'negative'
-                
-            # Set default unit location
-            patient_dict['default_unit_location'] = value['Site Postcode']
-                
-            # Get subunits for default unit
-            if patient_dict['default_unit_location'] == 'HOME':
+            patient_dict['status'] = 'negative' if status == 'suspected' else status
+
+            # Set default unit location and subunits for default unit
+            patient_dict['default_unit_location'] = default_unit_location
+            if default_unit_location == 'HOME':
                 patient_dict['default_unit'] = ['HOME']
             else:
-                master_unit = value['Site']
-                subunits = list(self._units.unit_info[
-                    self._units.unit_info['unit']==master_unit].index)
-                patient_dict['default_unit'] = subunits
-                
+                patient_dict['default_unit'] = list(
+                    subunits_by_master_unit.get(master_unit, []))
+
             # Set inpatient-related parameters
-            patient_dict['require_inpatient'] = (
-                True if self._params.requiring_inpatient_random.sample() < 
-                self._params.proportion_pos_requiring_inpatient else False)
-            if patient_dict['require_inpatient']:
-                # Over-write pos LoS (as used for outpatient care)
-                patient_dict['time_positive'] = self._params.time_pos_before_inpatient.sample()
-                patient_dict['inpatient_los'] = self._params.time_inpatient.sample()
-            else:
-                patient_dict['inpatient_los'] = 0
+            patient_dict['require_inpatient'] = samples['require_inpatient'][i]
+            patient_dict['inpatient_los'] = samples['inpatient_los'][i]
+
+            # Set random numbers for random positives at start and mortality
+            patient_dict['random_positive'] = samples['random_positive'][i]
+            patient_dict['mortality_random'] = samples['mortality_random'][i]
 
             # Create patient and add to patient population
             patient = Patient(
                 self._env, patient_dict, self.allocate, self._params, self.pop, self._units)
-            self.pop.patients[value['Patient ID']] = patient
-            
-            # Allocate patient to unit
-            self.allocate.load_patient(patient)
-            
+            self.pop.patients[patient_id] = patient
+            patients.append(patient)
+
+        # Allocate patients to units
+        self.allocate.load_patients(patients)
+
+        for patient in patients:
             # Add default travel time to Population list
             self.pop.default_travel_times.append(patient.default_time)
-            
+
             # Start patient virus progression
-            self._env.process(patient.patient_virus_progress())
\ No newline at end of file
+            if self.progression is None:
+                self._env.process(patient.patient_virus_progress())
+            else:
+                self.progression.add_patient(patient)
+
+        # Start event calendar process
+        if self.progression is not None:
+            self._env.process(self.progression.run())
+
+
+    def set_up_run(self):
+        """
+        Set up state for a model run (results, reallocation triggers and patient
+        population, with patient samples drawn from scenario random number streams).
+        """
+        
+        # Results of optimised reallocations (reallocation_mode 'optimal')
+        self.optimisation_results = []
+        
+        # Events waited on by checks when no patients are unallocated or displaced
+        # (only used if scenario reallocation_trigger is 'event')
+        self._notifications = {'unallocated': None, 'displaced': None}
+        if self._params.reallocation_trigger == 'event':
+            self.pop.unallocated_patients.on_append = (
+                lambda patient: self.notify('unallocated'))
+            self.pop.displaced_patients.on_append = (
+                lambda patient: self.notify('displaced'))
+        elif self._params.reallocation_trigger != 'periodic':
+            raise ValueError(
+                f'Unknown reallocation trigger: {self._params.reallocation_trigger}')
+        
+        # Initiate patient population
+        self.set_up_patient_population()
@@ -0,0 +1,575 @@
+'''
+Contains functions to save and load replication audits as CSV or columnar
+binary files (Parquet, Feather or compressed NumPy .npz).
+
+Binary files hold one tidy table per audit with columns scenario (scenario
+name), rep (replication number), day, then (for unit and inpatient audits)
+master_unit and subunit, then audit metrics, with NumPy integer/float dtypes.
+Parquet and Feather need pyarrow installed (used through pandas).
+
+Replications may also be streamed to disk as they complete (ReplicationStore),
+and saved from the store one replication at a time (save_store_audits).
+'''
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from .helper_functions import expand_multi_index
+
+
+# Audits saved for each scenario (in order returned by multiple_replications)
+AUDIT_NAMES = ['patient', 'unit', 'displaced', 'inpatient']
+
+# Names of expanded multi-index columns of each audit in CSV files
+CSV_INDEX_COLUMNS = {'patient': ['scenario', 'day'], 'unit': ['scenario', 'audit#'],
+                     'displaced': ['scenario', 'day'], 'inpatient': ['scenario', 'audit#']}
+
+# File extension for each output format
+OUTPUT_FORMATS = {'csv': '.csv', 'feather': '.feather', 'npz': '.npz',
+                  'parquet': '.parquet'}
+
+
+def audit_path(path_stem, audit_name, output_format):
+    '''
+    Path of audit file, e.g. output/base_reps_30_patient_audit.csv
+
+    Parameters
+    ----------
+    path_stem : str
+        Start of file path (folder, scenario name and number of reps).
+    audit_name : str
+        'patient', 'unit', 'displaced' or 'inpatient'.
+    output_format : str
+        'csv', 'parquet', 'feather' or 'npz'.
+
+    Returns
+    -------
+    str
+        Path of audit file.
+    '''
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format: {output_format}')
+    return f'{path_stem}_{audit_name}_audit{OUTPUT_FORMATS[output_format]}'
+
+
+def tidy_audit(name, audit):
+    '''
+    Convert an audit with multi-index (rep, row) (as returned by
+    multiple_replications) to a tidy table with columns scenario, rep, day,
+    then the audit columns.
+
+    Parameters
+    ----------
+    name : str
+        Scenario name.
+    audit : DataFrame
+        Audit with multi-index (rep, row). Patient and displaced audits have
+        day as the row index; unit and inpatient audits have a day column.
+
+    Returns
+    -------
+    DataFrame
+        Tidy audit table.
+    '''
+    rows = len(audit)
+    table = {'scenario': np.full(rows, name, dtype=object),
+             'rep': audit.index.get_level_values(0).values.astype(np.int64)}
+    if 'day' in audit.columns:
+        table['day'] = audit['day'].values
+    else:
+        table['day'] = audit.index.get_level_values(1).values
+    for column in audit.columns:
+        if column == 'day':
+            continue
+        table[column] = audit[column].values
+
+    return pd.DataFrame(table)
+
+
+def save_audits(name, audits, path_stem, output_format):
+    '''
+    Save audits from multiple_replications (patient, unit, displaced,
+    inpatient) for a scenario in a binary format (one file per audit; see
+    module notes for layout). CSV files are saved by run_replications.
+
+    Parameters
+    ----------
+    name : str
+        Scenario name.
+    audits : tuple of DataFrame
+        Patient, unit, displaced and inpatient audits with multi-index (rep,
+        row).
+    path_stem : str
+        Start of file paths (folder, scenario name and number of reps).
+    output_format : str
+        'parquet', 'feather' or 'npz'.
+
+    Returns
+    -------
+    None.
+    '''
+    for audit_name, audit in zip(AUDIT_NAMES, audits):
+        path = audit_path(path_stem, audit_name, output_format)
+        table = tidy_audit(name, audit)
+        if output_format == 'parquet':
+            table.to_parquet(path, index=False)
+        elif output_format == 'feather':
+            table.to_feather(path)
+        elif output_format == 'npz':
+            np.savez_compressed(path, **{
+                column: (values.values.astype(str) if values.dtype == object
+                         else values.values)
+                for column, values in table.items()})
+        else:
+            raise ValueError(f'Unknown binary output format: {output_format}')
+
+
+def load_audits(name, path_stem, output_format):
+    '''
+    Load saved audits for a scenario as tidy tables (see module notes).
+
+    Parameters
+    ----------
+    name : str
+        Scenario name.
+    path_stem : str
+        Start of file paths (folder, scenario name and number of reps).
+    output_format : str
+        'csv', 'parquet', 'feather' or 'npz'.
+
+    Returns
+    -------
+    tuple of DataFrame
+        Patient, unit, displaced and inpatient audits.
+    '''
+    audits = []
+    for audit_name in AUDIT_NAMES:
+        path = audit_path(path_stem, audit_name, output_format)
+        if output_format == 'csv':
+            # CSV has replication number in 'scenario' column
+            table = pd.read_csv(path)
+            table = table.rename(columns={'scenario': 'rep'})
+            if audit_name in ['unit', 'inpatient']:
+                table = table.drop(columns='audit#')
+            table.insert(0, 'scenario', name)
+        elif output_format == 'parquet':
+            table = pd.read_parquet(path)
+        elif output_format == 'feather':
+            table = pd.read_feather(path)
+        else:
+            with np.load(path) as data:
+                table = pd.DataFrame({
+                    column: (data[column].astype(object) if data[column].dtype.kind == 'U'
+                             else data[column])
+                    for column in data.files})
+        audits.append(table)
+
+    return tuple(audits)
+
+
+def replication_audits(rep, audits):
+    '''
+    Audits of one replication with multi-index (rep, row), as returned for
+    all replications by multiple_replications (duplicate 'day' column removed
+    from patient and displaced audits).
+
+    Parameters
+    ----------
+    rep : int
+        Replication number.
+    audits : tuple of DataFrame
+        Patient, unit, displaced and inpatient audits of replication (as
+        produced by a model run).
+
+    Returns
+    -------
+    tuple of DataFrame
+        Patient, unit, displaced and inpatient audits with multi-index.
+    '''
+    indexed = []
+    for audit_name, audit in zip(AUDIT_NAMES, audits):
+        audit = pd.concat([audit], keys=[rep])
+        if audit_name in ['patient', 'displaced']:
+            audit = audit.drop('day', axis=1)
+        indexed.append(audit)
+
+    return tuple(indexed)
+
+
+def _csv_dtype_sample(values):
+    '''
+    Sample of a column with the same data type as the column when concatenated
+    with other columns, and after DataFrame.convert_dtypes: the first value,
+    the first non-integer value of a float column (else convert_dtypes gives
+    integers), and the first value of each type (missing or not) of an object
+    column.
+    '''
+    if values.dtype.kind == 'f':
+        non_integer = values[values.notna() & (values != np.floor(values))]
+        return pd.concat([values.iloc[:1], non_integer.iloc[:1]])
+    if values.dtype == object:
+        kinds = values.map(lambda value: (type(value), pd.isna(value)))
+        return values[~kinds.duplicated()]
+    return values.iloc[:1]
+
+
+def _scan_replication(name, rep, audits, output_formats, dtypes, rows):
+    '''
+    Update samples of CSV columns (see _csv_dtype_sample), data types of tidy
+    table columns and .npz columns (text as fixed width strings), and rows of
+    tidy tables, with one replication (first pass of save_store_audits)
+    '''
+    csv_dtypes, tidy_dtypes, npz_dtypes = dtypes
+    for k, audit in enumerate(replication_audits(rep, audits)):
+        if 'csv' in output_formats:
+            for column, values in audit.items():
+                sample = _csv_dtype_sample(values)
+                if column in csv_dtypes[k]:
+                    sample = _csv_dtype_sample(pd.concat([csv_dtypes[k][column], sample]))
+                csv_dtypes[k][column] = sample
+        if output_formats != ['csv']:
+            table = tidy_audit(name, audit)
+            rows[k] += len(table)
+            for column, values in table.items():
+                tidy_dtype = values.dtype
+                npz_dtype = values.values.astype(str).dtype if tidy_dtype == object else tidy_dtype
+                if column in tidy_dtypes[k]:
+                    tidy_dtype = np.result_type(tidy_dtypes[k][column], tidy_dtype)
+                    npz_dtype = np.result_type(npz_dtypes[k][column], npz_dtype)
+                tidy_dtypes[k][column] = tidy_dtype
+                npz_dtypes[k][column] = npz_dtype
+
+
+def _append_replication(name, rep, audits, path_stem, output_formats, dtypes, writers,
+                        npz_arrays, positions, first):
+    '''
+    Append one replication to CSV files, Parquet/Feather writers and .npz
+    column arrays (second pass of save_store_audits)
+    '''
+    csv_dtypes, tidy_dtypes, npz_dtypes = dtypes
+    for k, audit in enumerate(replication_audits(rep, audits)):
+        audit_name = AUDIT_NAMES[k]
+        if 'csv' in output_formats:
+            expanded = expand_multi_index(audit, CSV_INDEX_COLUMNS[audit_name])
+            expanded.astype(csv_dtypes[k]).to_csv(
+                audit_path(path_stem, audit_name, 'csv'), index=False,
+                mode='w' if first else 'a', header=first)
+        if output_formats == ['csv']:
+            continue
+        table = tidy_audit(name, audit).astype(tidy_dtypes[k])
+        for output_format in ['parquet', 'feather']:
+            if output_format in output_formats:
+                writers[(output_format, k)].write(table)
+        if 'npz' in output_formats:
+            start = positions[k]
+            for column, values in table.items():
+                values = values.values
+                npz_arrays[k][column][start:start + len(values)] = (
+                    values.astype(str) if values.dtype == object else values)
+            positions[k] += len(table)
+
+
+class _ArrowWriter:
+    '''
+    Writes tidy tables to a Parquet or Feather (Arrow IPC file) file in
+    batches with pyarrow (schema from first table)
+    '''
+
+    def __init__(self, path, output_format):
+        self.path = path
+        self.output_format = output_format
+        self.writer = None
+
+    def write(self, table):
+        import pyarrow as pa
+
+        if self.writer is None:
+            self.schema = pa.Schema.from_pandas(table, preserve_index=False)
+            if self.output_format == 'parquet':
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                self.writer = pa.ipc.new_file(self.path, self.schema)
+        self.writer.write_table(
+            pa.Table.from_pandas(table, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _write_npz(path, arrays):
+    '''
+    Write column arrays (e.g. memory-mapped) to a compressed .npz file, as
+    numpy.savez_compressed, writing each array in buffered chunks
+    '''
+    with zipfile.ZipFile(path, mode='w', compression=zipfile.ZIP_DEFLATED,
+                         allowZip64=True) as file:
+        for column, array in arrays.items():
+            with file.open(f'{column}.npy', mode='w', force_zip64=True) as entry:
+                np.lib.format.write_array(entry, array, allow_pickle=False)
+
+
+def save_store_audits(name, store, path_stem, output_formats, summary=None):
+    '''
+    Save audits of a scenario from a ReplicationStore in output formats, one
+    replication at a time, so that only one replication is held in memory.
+    Files are the same as saving all replications at once (see
+    save_scenario_outputs in sim.sim_replicate).
+
+    A first pass over the store finds the data type of each column over all
+    replications (and rows and text widths for .npz files). A second pass
+    appends each replication to CSV files, writes it to Parquet and Feather
+    files in batches (with pyarrow), and copies it into temporary
+    memory-mapped .npz columns (compressed into the .npz files at the end).
+    Replications may also be added to an online summary (e.g.
+    ReplicationSummary) in the second pass.
+
+    Parameters
+    ----------
+    name : str
+        Scenario name.
+    store : ReplicationStore
+        Store of replication audits.
+    path_stem : str
+        Start of file paths (folder, scenario name and number of reps).
+    output_formats : list of str
+        Formats to save audits in: 'csv', 'parquet', 'feather' or 'npz'.
+    summary : ReplicationSummary, optional
+        Summary to add replications to. The default is None.
+
+    Returns
+    -------
+    None.
+    '''
+    output_formats = list(output_formats)
+    for output_format in output_formats:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format: {output_format}')
+
+    # First pass: data types of columns, and rows of tidy tables
+    dtypes = tuple([dict() for audit_name in AUDIT_NAMES] for i in range(3))
+    rows = [0 for audit_name in AUDIT_NAMES]
+    if output_formats:
+        for rep, audits in store.iter_replications():
+            _scan_replication(name, rep, audits, output_formats, dtypes, rows)
+            # Release replication before loading next
+            del audits
+
+    # CSV data types: convert_dtypes once on samples of all replications (as
+    # expand_multi_index on all replications at once)
+    for k, samples in enumerate(dtypes[0]):
+        dtypes[0][k] = {column: sample.convert_dtypes().dtype
+                        for column, sample in samples.items()}
+
+    # Set up Parquet/Feather writers and .npz column arrays
+    writers = {(output_format, k): _ArrowWriter(
+                   audit_path(path_stem, audit_name, output_format), output_format)
+               for output_format in ['parquet', 'feather'] if output_format in output_formats
+               for k, audit_name in enumerate(AUDIT_NAMES)}
+    npz_arrays = None
+    if 'npz' in output_formats:
+        temporary_folder = tempfile.mkdtemp(dir=os.path.dirname(path_stem) or '.')
+        npz_arrays = [
+            {column: (np.lib.format.open_memmap(
+                         os.path.join(temporary_folder, f'{audit_name}_{i}.npy'),
+                         mode='w+', dtype=dtype, shape=(rows[k],))
+                      if rows[k] > 0 else np.empty(0, dtype=dtype))
+             for i, (column, dtype) in enumerate(dtypes[2][k].items())}
+            for k, audit_name in enumerate(AUDIT_NAMES)]
+    positions = [0 for audit_name in AUDIT_NAMES]
+
+    # Second pass: append each replication to files (and summary)
+    first = True
+    for rep, audits in store.iter_replications():
+        _append_replication(name, rep, audits, path_stem, output_formats, dtypes, writers,
+                            npz_arrays, positions, first)
+        if summary is not None:
+            summary.add_replication(audits, rep)
+        first = False
+        # Release replication before loading next
+        del audits
+
+    # Close files
+    for writer in writers.values():
+        writer.close()
+    if npz_arrays is not None:
+        for audit_name, arrays in zip(AUDIT_NAMES, npz_arrays):
+            _write_npz(audit_path(path_stem, audit_name, 'npz'), arrays)
+        del arrays
+        npz_arrays = None
+        shutil.rmtree(temporary_folder)
+
+
+class ReplicationStore:
+    """
+    On-disk store of replication audits, with one compressed NumPy file
+    (rep_<replication number>.npz) per replication holding its patient, unit,
+    displaced and inpatient audits (one array per audit column). Replications
+    are saved as they complete (e.g. by worker processes), so results need not
+    be held in memory until all replications are complete. Files are written to
+    a temporary name and then renamed, so only complete replications are read.
+
+    Object attributes
+    -----------------
+
+    folder: folder holding replication files
+
+    Methods
+    -------
+
+    clear:
+        Remove all replication files from store
+
+    iter_replications:
+        Load replications one at a time (replication number and audits)
+
+    load:
+        Load all replications as multi-index audits (as multiple_replications)
+
+    load_replication:
+        Load audits of one replication
+
+    replications:
+        List replication numbers in store
+
+    save:
+        Save audits of one replication
+    """
+
+    def __init__(self, folder):
+        """
+        Constructor for store (creates folder if it does not exist).
+
+        Parameters
+        ----------
+        folder : str
+            Folder to hold replication files.
+        """
+
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, rep):
+        """Path of replication file"""
+
+        return os.path.join(self.folder, f'rep_{rep}.npz')
+
+    def clear(self):
+        """Remove all replication files from store"""
+
+        for rep in self.replications():
+            os.remove(self._path(rep))
+
+    def iter_replications(self):
+        """
+        Load replications one at a time, in order of replication number.
+
+        Yields
+        ------
+        rep : int
+            Replication number.
+        audits : tuple of DataFrame
+            Patient, unit, displaced and inpatient audits of replication.
+        """
+
+        for rep in self.replications():
+            yield rep, self.load_replication(rep)
+
+    def load(self):
+        """
+        Load all replications as audits with multi-index (rep, row), as
+        returned by multiple_replications.
+
+        Returns
+        -------
+        tuple of DataFrame
+            Patient, unit, displaced and inpatient audits.
+        """
+
+        reps = self.replications()
+        audits = [self.load_replication(rep) for rep in reps]
+        audits = [pd.concat([rep_audits[k] for rep_audits in audits], keys=reps)
+                  for k in range(len(AUDIT_NAMES))]
+
+        # Remove duplicate 'day' (as unpack_audits)
+        audits[0].drop('day', axis=1, inplace=True)
+        audits[2].drop('day', axis=1, inplace=True)
+
+        return tuple(audits)
+
+    def load_replication(self, rep):
+        """
+        Load audits of one replication.
+
+        Parameters
+        ----------
+        rep : int
+            Replication number.
+
+        Returns
+        -------
+        tuple of DataFrame
+            Patient, unit, displaced and inpatient audits of replication.
+        """
+
+        columns = {audit_name: dict() for audit_name in AUDIT_NAMES}
+        with np.load(self._path(rep)) as data:
+            for key in data.files:
+                audit_name, column = key.split('/', 1)
+                values = data[key]
+                if values.dtype.kind == 'U':
+                    values = values.astype(object)
+                columns[audit_name][column] = values
+
+        return tuple(pd.DataFrame(columns[audit_name]) for audit_name in AUDIT_NAMES)
+
+    def replications(self):
+        """
+        List replication numbers in store.
+
+        Returns
+        -------
+        list of int
+            Replication numbers (sorted).
+        """
+
+        reps = []
+        for file_name in os.listdir(self.folder):
+            if file_name.startswith('rep_') and file_name.endswith('.npz'):
+                reps.append(int(file_name[4:-4]))
+
+        return sorted(reps)
+
+    def save(self, rep, audits):
+        """
+        Save audits of one replication.
+
+        Parameters
+        ----------
+        rep : int
+            Replication number.
+        audits : tuple of DataFrame
+            Patient, unit, displaced and inpatient audits of replication.
+
+        Returns
+        -------
+        None.
+        """
+
+        arrays = dict()
+        for audit_name, audit in zip(AUDIT_NAMES, audits):
+            for column, values in audit.items():
+                values = values.values
+                arrays[f'{audit_name}/{column}'] = (
+                    values.astype(str) if values.dtype == object else values)
+
+        # Write to temporary file, then rename (so partly written files are not read)
+        temporary_path = os.path.join(self.folder, f'.rep_{rep}.npz.tmp')
+        with open(temporary_path, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(temporary_path, self._path(rep))
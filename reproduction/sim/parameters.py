@@ -8,10 +8,11 @@ class Normal:
     '''
     Wraps a normal distribution and its parameters.
     Allows lower truncation of normal distribution.
-    Allows control of random number stream.
+    Allows control of random number stream, and antithetic sampling.
     '''
 
-    def __init__(self, mean=0.0, std=1.0, minimum=None, random_seed=None):
+    def __init__(self, mean=0.0, std=1.0, minimum=None, random_seed=None,
+                 antithetic=False):
         '''
 
         Constructor for Normal Distribution
@@ -28,9 +29,14 @@ class Normal:
         random_seed: int, optional (default=None)
             A random seed to reproduce samples.  If set to none then a unique
             sample is created.
+        antithetic: bool, optional (default=False)
+            Return antithetic samples (reflected about the mean, before
+            truncation), i.e. negatively correlated with samples from the same
+            random seed with antithetic=False.
 
         '''
         self.rng = np.random.default_rng(seed=random_seed)
+        self.antithetic = antithetic
         self.mean = mean
         self.std = std
         self.minimum = minimum
@@ -55,6 +61,9 @@ class Normal:
         '''
         sample = self.rng.normal(self.mean, self.std, size=size)
 
+        if self.antithetic:
+            sample = 2 * self.mean - sample
+
         if self.minimum is not None:
             if size is None:
                 sample = max(sample, self.minimum)
@@ -67,10 +76,10 @@ class Normal:
 class Uniform:
     '''
     Wraps a uniform distribution and its parameters
-    Allows control of random number stream.
+    Allows control of random number stream, and antithetic sampling.
     '''
 
-    def __init__(self, minimum, maximum, random_seed=None):
+    def __init__(self, minimum, maximum, random_seed=None, antithetic=False):
         '''
         Constructor of the Uniform Distribution
         sampling object
@@ -84,8 +93,13 @@ class Uniform:
         random_seed: int, optional (default=None)
             A random seed to reproduce samples. If set to none then a unique
             sample is created.
+        antithetic: bool, optional (default=False)
+            Return antithetic samples (minimum + maximum - x), i.e. negatively
+            correlated with samples from the same random seed with
+            antithetic=False.
         '''
         self.rng = np.random.default_rng(seed=random_seed)
+        self.antithetic = antithetic
         self.maximum = maximum
         self.minimum = minimum
 
@@ -105,9 +119,14 @@ class Uniform:
             uniform distributed variates.
         '''
 
-        return self.rng.uniform(
+        sample = self.rng.uniform(
             low=self.minimum, high=self.maximum, size=size)
 
+        if self.antithetic:
+            sample = self.minimum + self.maximum - sample
+
+        return sample
+
 
 DEFAULT_RUN_LENGTH = 200
 DEFAULT_AUDIT_INTERVAL = 1
@@ -119,6 +138,10 @@ DEFAULT_RANDOM_POSITIVE = 0
 DEFAULT_OPEN_ALL_SESSIONS = False
 DEFAULT_DROP_TO_TWO_SESSIONS = False
 DEFAULT_PROPORTION_DROP_TO_TWO = 0.9
+DEFAULT_PROGRESSION_ENGINE = 'process'
+DEFAULT_REALLOCATION_TRIGGER = 'periodic'
+DEFAULT_REALLOCATION_MODE = 'full'
+DEFAULT_COMMON_RANDOM_NUMBERS = False
 
 
 class Scenario:
@@ -138,7 +161,11 @@ class Scenario:
             random_positive_rate_at_start=DEFAULT_RANDOM_POSITIVE,
             open_all_sessions=DEFAULT_OPEN_ALL_SESSIONS,
             drop_to_two_sessions=DEFAULT_DROP_TO_TWO_SESSIONS,
-            prop_patients_drop_to_two_sessions=DEFAULT_DROP_TO_TWO_SESSIONS):
+            prop_patients_drop_to_two_sessions=DEFAULT_DROP_TO_TWO_SESSIONS,
+            progression_engine=DEFAULT_PROGRESSION_ENGINE,
+            reallocation_trigger=DEFAULT_REALLOCATION_TRIGGER,
+            reallocation_mode=DEFAULT_REALLOCATION_MODE,
+            common_random_numbers=DEFAULT_COMMON_RANDOM_NUMBERS):
         '''
         Create a scenario to with parameters for the simulation model
 
@@ -166,15 +193,36 @@ class Scenario:
         # Sampling (set up with no seed provided - can later rerun with a seed
         # via set_random_no_set())
         self.random_number_set = None
+        self.antithetic = False
         self.init_sampling()
 
+        # Common random numbers: draw every sample for every patient (in
+        # patient order), so each patient gets the same random numbers in all
+        # scenarios run with the same random number set. Default (False) draws
+        # samples only for patients that need them (e.g. time to infection
+        # only for patients who will be infected), as the original model.
+        self.common_random_numbers = common_random_numbers
+
         # Strategies
         self.open_all_sessions = open_all_sessions
         self.drop_to_two_sessions = drop_to_two_sessions
         self.prop_patients_drop_to_two_sessions = (
             prop_patients_drop_to_two_sessions)
 
-    def set_random_no_set(self, random_number_set):
+        # Patient COVID progression: 'process' (one SimPy process per patient)
+        # or 'calendar' (single event calendar process)
+        self.progression_engine = progression_engine
+
+        # Checks for unallocated/displaced patients: 'periodic' (wake every
+        # day/week) or 'event' (wait until patients unallocated/displaced)
+        self.reallocation_trigger = reallocation_trigger
+
+        # Weekly reallocation: 'full' (remove and re-allocate all patients),
+        # 'incremental' (only displaced patients and sessions they could use)
+        # or 'optimal' (minimise additional travel time of COVID -ve patients)
+        self.reallocation_mode = reallocation_mode
+
+    def set_random_no_set(self, random_number_set, antithetic=False):
         '''
         Controls the random sampling - can pass in a new random number set and
         do the sampling using that instead of the default.
@@ -184,9 +232,13 @@ class Scenario:
         random_number_set: int
             Used to control the set of pseudorandom numbers
             used by the distributions in the simulation.
+        antithetic: bool, optional (default=False)
+            Use antithetic samples of the random number set (for antithetic
+            replication pairs).
         '''
         # Replace the random_number_set
         self.random_number_set = random_number_set
+        self.antithetic = antithetic
         # Trigger recreation of sampling distributions
         self.init_sampling()
 
@@ -198,21 +250,32 @@ class Scenario:
         # Generate 20 high quality child seeds to use to create separate
         # independent random number generators for each distribution
         seeds = np.random.SeedSequence(self.random_number_set).spawn(20)
+        antithetic = self.antithetic
 
         # Infection distribution type (default = Normal)
-        self.time_to_infection = Normal(60, 15, 0.0, random_seed=seeds[0])
+        self.time_to_infection = Normal(
+            60, 15, 0.0, random_seed=seeds[0], antithetic=antithetic)
 
         # Sampling distribution for time positive
-        self.time_positive = Uniform(7, 14, random_seed=seeds[1])
+        self.time_positive = Uniform(
+            7, 14, random_seed=seeds[1], antithetic=antithetic)
 
         # Proportion Cov+ requiring inpatient care
         self.requiring_inpatient_random = Uniform(
-            0.0, 1.0, random_seed=seeds[2])
-        self.time_pos_before_inpatient = Uniform(3, 7, random_seed=seeds[3])
-        self.time_inpatient = Uniform(7.0, 14.0, random_seed=seeds[4])
+            0.0, 1.0, random_seed=seeds[2], antithetic=antithetic)
+        self.time_pos_before_inpatient = Uniform(
+            3, 7, random_seed=seeds[3], antithetic=antithetic)
+        self.time_inpatient = Uniform(
+            7.0, 14.0, random_seed=seeds[4], antithetic=antithetic)
 
         # Mortality random number
-        self.mortality_rand = Uniform(0.0, 1.0, random_seed=seeds[5])
+        self.mortality_rand = Uniform(
+            0.0, 1.0, random_seed=seeds[5], antithetic=antithetic)
 
         # Restrict the maximum proportion of people who can be infected
-        self.will_be_infected_rand = Uniform(0.0, 1.0, random_seed=seeds[6])
+        self.will_be_infected_rand = Uniform(
+            0.0, 1.0, random_seed=seeds[6], antithetic=antithetic)
+
+        # Random positives at start (negative patients)
+        self.random_positive_rand = Uniform(
+            0.0, 1.0, random_seed=seeds[7], antithetic=antithetic)
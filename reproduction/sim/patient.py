@@ -1,7 +1,3 @@
-import pandas as pd
-import random
-
-
 class Patient:
     """
     Patient object.
@@ -28,6 +24,8 @@ class Patient:
     first_day: First day of the week for dialysis (Mon or Tues)
     inpatient_los: inpatient length of stay if inpatient stay required
     location: Patient home location (postcode sector)
+    mortality_random: Uniform random number for mortality at end of infection
+        (None if sampled from scenario mortality stream at end of infection)
     patient_id: id of patient (allocated in model)
     require_inpatient: Whether patient will need inpation care (True/False)
     session: Current session at unit
@@ -45,8 +43,23 @@ class Patient:
         Death occurs at end of positive episode. Patient may start the model in
         any state
         
+    become_positive, end_positive_period, end_inpatient_stay, end_infection:
+        Status changes at the end of each period (used by patient_virus_progress,
+        or by the event calendar in PatientProgressionCalendar)
+        
+    Attributes are held in __slots__ (no per-patient __dict__), to reduce
+    memory use and speed up attribute access for large populations.
     """
 
+    __slots__ = (
+        '_allocate', '_env', '_params', '_pop', '_units',
+        'current_travel_time', 'current_unit', 'current_unit_location',
+        'default_time', 'default_unit', 'default_unit_location', 'displaced',
+        'displaced_additional_time', 'dialysis_type', 'first_day',
+        'inpatient_los', 'location', 'mortality_random', 'patient_id',
+        'require_inpatient', 'session', 'status', 'time_in', 'time_positive',
+        'time_to_infection', 'unallocated_to_session', 'will_be_infected')
+
     def __init__(self, env, patient_data, allocate, params, pop, units):
         
         """Constructor method for new patient. Patient data is passed as a
@@ -66,6 +79,7 @@ class Patient:
         self.first_day = patient_data['first_day']
         self.inpatient_los = patient_data['inpatient_los']
         self.location = patient_data['location']
+        self.mortality_random = patient_data['mortality_random']
         self._params = params
         self.patient_id = patient_data['patient_id']
         self._pop = pop
@@ -81,14 +95,15 @@ class Patient:
         
         # Add travel times to non-home :
         if self.default_unit_location != 'HOME':
-            self.current_travel_time = units.travel_times.loc[patient_data['location']][
-                patient_data['default_unit_location']]
+            self.current_travel_time = units.travel_time_array[
+                units.travel_time_location_index[self.location],
+                units.travel_time_unit_index[self.default_unit_location]]
             self.default_time = self.current_travel_time
             self.displaced_additional_time = 0
             
 
-        # Apply random positives
-        if (self.status == 'negative' and random.random() < 
+        # Apply random positives (random number from scenario stream)
+        if (self.status == 'negative' and patient_data['random_positive'] <
             self._params.random_positive_rate_at_start):
             self.status = 'positive'
         
@@ -106,21 +121,7 @@ class Patient:
             # Period of cov negative:
             yield self._env.timeout(self.time_to_infection)
             
-            # End of negative period, remove from patient allocation
-            self._allocate.remove_patient(self)
-            
-            # Switch status to positive and re-allocate
-            self.status = 'positive'            
-            
-            # If previously unallocated, remove from list of unallocated patients
-            if self in self._pop.unallocated_patients:
-                self._pop.unallocated_patients.remove(self)  
-
-            # Allocate patient
-            self._allocate.allocate_patient(self)
-            
-            # Add to appropriate patient list
-            self._pop.positive_patients.append(self)
+            self.become_positive()
             
         # Period of positive COVID
         if self.status == 'positive': 
@@ -128,48 +129,98 @@ class Patient:
             # Period of Cov positive
             yield self._env.timeout(self.time_positive)
             
-            # End of positive period, remove from patient allocation and reset location
-            self._allocate.remove_patient(self)            
-                        
-            # If previously unallocated, remove from list of unallocated patients
-            if self in self._pop.unallocated_patients:
-                self._pop.unallocated_patients.remove(self)
+            self.end_positive_period()
             
             # Check for inpatient stay
             if self.require_inpatient:
-          
-                self.status = 'inpatient'
-                self._pop.inpatients.append(self)
-                
-                self._allocate.allocate_inpatient(self)
                 
                 # Time in inpatient
                 yield self._env.timeout(self.inpatient_los)
                 
-                self._pop.inpatients.remove(self)
-                self._allocate.inpatient_counts.loc[self.current_unit] -= 1
+                self.end_inpatient_stay()
             
-            # Check for mortality at end of positive (+ inpatient) phase
-            if self._params.mortality_rand.sample() < self._params.mortality:
-                
-                # PATIENT DIES
-                self.status = 'died'
-                
-                # Add to appropriate patient list
-                self._pop.died_patients.append(self)
+            self.end_infection()
+            
+            
+    def become_positive(self):
+        """
+        End of negative period: patient becomes COVID positive and is re-allocated.
+        """
+        
+        # End of negative period, remove from patient allocation
+        self._allocate.remove_patient(self)
+        
+        # Switch status to positive and re-allocate
+        self.status = 'positive'            
+        
+        # If previously unallocated, remove from list of unallocated patients
+        self._pop.unallocated_patients.discard(self)
 
-                # No allocation of patient required
-                self.current_unit = 'none'
-                self.session = 'none'
+        # Allocate patient
+        self._allocate.allocate_patient(self)
+        
+        # Add to appropriate patient list
+        self._pop.positive_patients.append(self)
+        
+        
+    def end_positive_period(self):
+        """
+        End of positive (outpatient) period: patient is removed from allocation,
+        and becomes an inpatient if inpatient care required.
+        """
+        
+        # End of positive period, remove from patient allocation and reset location
+        self._allocate.remove_patient(self)            
+                    
+        # If previously unallocated, remove from list of unallocated patients
+        self._pop.unallocated_patients.discard(self)
+        
+        # Check for inpatient stay
+        if self.require_inpatient:
+      
+            self.status = 'inpatient'
+            self._pop.inpatients.append(self)
             
-            else:
-                # PATIENT RECOVERS
-                self.status = 'recovered'
-                
-                # Allocate patient
-                self._allocate.allocate_patient(self)
-                
-                # Add to appropriate patient list
-                self._pop.recovered_patients.append(self)
+            self._allocate.allocate_inpatient(self)
+            
+            
+    def end_inpatient_stay(self):
+        """
+        End of inpatient stay: patient discharged from inpatient unit.
+        """
+        
+        self._pop.inpatients.remove(self)
+        self._allocate.discharge_inpatient(self)
+        
+        
+    def end_infection(self):
+        """
+        End of positive (+ inpatient) phase: patient dies or recovers (and is
+        re-allocated).
+        """
+        
+        # Check for mortality at end of positive (+ inpatient) phase
+        mortality_random = self.mortality_random
+        if mortality_random is None:
+            mortality_random = self._params.mortality_rand.sample()
+        if mortality_random < self._params.mortality:
+            
+            # PATIENT DIES
+            self.status = 'died'
+            
+            # Add to appropriate patient list
+            self._pop.died_patients.append(self)
 
-            
\ No newline at end of file
+            # No allocation of patient required
+            self.current_unit = 'none'
+            self.session = 'none'
+        
+        else:
+            # PATIENT RECOVERS
+            self.status = 'recovered'
+            
+            # Allocate patient
+            self._allocate.allocate_patient(self)
+            
+            # Add to appropriate patient list
+            self._pop.recovered_patients.append(self)
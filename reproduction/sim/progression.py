@@ -0,0 +1,103 @@
+'''
+Contains class for progressing patients through COVID stages using a single
+event calendar (alternative to one SimPy process per patient)
+'''
+import heapq
+import itertools
+
+
+class PatientProgressionCalendar:
+    """
+    Event calendar of patient COVID stage changes. Each patient's next stage
+    change is held in a heap (ordered by time, then by order of scheduling),
+    and a single SimPy process works through the heap, waiting until the time
+    of the next change. Live SimPy events are O(1) rather than one process per
+    patient, and patients who will not change stage (e.g. not infected within
+    the run) cost only a heap entry.
+
+    Stage changes occur in the same order, and at the same times, as when each
+    patient has their own patient_virus_progress process (changes at the same
+    time occur in order of scheduling, as for SimPy timeouts), so results match
+    the per-process engine.
+
+    Object attributes
+    -----------------
+
+    _env: Reference to model environment object
+    calendar: heap of (time, sequence, stage, patient) for next stage changes
+
+    Methods
+    -------
+
+    add_patient:
+        Schedule first stage change for a patient (according to current status)
+
+    run:
+        SimPy process to work through calendar
+    """
+
+    def __init__(self, env):
+        """
+        Constructor for empty calendar.
+
+        Parameters
+        ----------
+        env : Object
+            Model environment object.
+        """
+
+        self._env = env
+        self.calendar = []
+        self._sequence = itertools.count()
+
+    def _schedule(self, time, stage, patient):
+        """Add a stage change to calendar"""
+
+        heapq.heappush(self.calendar, (time, next(self._sequence), stage, patient))
+
+    def add_patient(self, patient):
+        """
+        Schedule first stage change for a patient (negative patients become
+        positive after time_to_infection; positive patients end positive period
+        after time_positive). Patients in other states do not change stage.
+
+        Parameters
+        ----------
+        patient : Patient object
+            Patient to schedule.
+        """
+
+        now = self._env.now
+        if patient.status == 'negative':
+            self._schedule(now + patient.time_to_infection, 'infection', patient)
+        elif patient.status == 'positive':
+            self._schedule(now + patient.time_positive, 'end_positive', patient)
+
+    def run(self):
+        """
+        SimPy process to work through calendar. Waits until the time of the
+        next stage change, then makes all stage changes due at that time (and
+        schedules each patient's next stage change).
+        """
+
+        while len(self.calendar) > 0:
+            time = self.calendar[0][0]
+            yield self._env.timeout(time - self._env.now)
+
+            while len(self.calendar) > 0 and self.calendar[0][0] == time:
+                time, _, stage, patient = heapq.heappop(self.calendar)
+
+                if stage == 'infection':
+                    patient.become_positive()
+                    self._schedule(time + patient.time_positive, 'end_positive', patient)
+
+                elif stage == 'end_positive':
+                    patient.end_positive_period()
+                    if patient.require_inpatient:
+                        self._schedule(time + patient.inpatient_los, 'end_inpatient', patient)
+                    else:
+                        patient.end_infection()
+
+                elif stage == 'end_inpatient':
+                    patient.end_inpatient_stay()
+                    patient.end_infection()
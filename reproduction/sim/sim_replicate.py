@@ -1,13 +1,46 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+import copy
+import itertools
+import math
+import numbers
+
+from .aggregation import ReplicationSummary
 from .end_trial_analysis import EndTrialAnalysis
 from .helper_functions import expand_multi_index
+from .inputs import ModelInputs
 from .model import DialysisSim
+from .output import OUTPUT_FORMATS, ReplicationStore, save_audits, save_store_audits
 from .parameters import Scenario, Uniform, Normal
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, effective_n_jobs
+from joblib.externals.loky import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 
 
+# Number of chunks of replications per worker when chunk size is automatic (more than
+# one chunk per worker balances load if some replications take longer than others)
+CHUNKS_PER_WORKER = 2
+
+# Model input data of a worker process (set once per worker by set_worker_inputs)
+_worker_inputs = None
+
+# Key performance indicators of each replication (used for adaptive number of
+# replications), calculated from patient, unit, displaced and inpatient audits
+# with multi-index (rep, row)
+KPI_FUNCTIONS = {
+    # Peak number of COVID positive outpatients
+    'peak_positive': lambda p, u, d, i: p['positive'].groupby(level=0).max(),
+    # Peak number of displaced patients
+    'peak_displaced': lambda p, u, d, i: d['number'].groupby(level=0).max(),
+    # Total additional travel time of displaced patients (summed over days)
+    'total_additional_time': lambda p, u, d, i: d['add_time_total'].groupby(level=0).sum()}
+
+
 def run_replications(scenarios, number_of_replications=30, base_random_set=0,
-                     output_folder='output', plot=True):
+                     output_folder='output', plot=True, inputs=None, chunk_size='auto',
+                     output_format='csv', store_folder=None, relative_precision=None,
+                     kpis=tuple(KPI_FUNCTIONS), common_random_numbers=False,
+                     antithetic=False):
     """
     Main simulation code. Calls multiple runs of prescribed scenarios.
 
@@ -15,13 +48,17 @@ def run_replications(scenarios, number_of_replications=30, base_random_set=0,
 
     * Prescribe number of runs per scenario
     * Define scenarios (as dictionary items)
-    * Get audits from each scenario:
+    * Load model input data once (shared by all scenarios and replications)
+    * Get audits from each scenario (optionally streamed to disk as each
+      replication completes, then read back from disk; or with an adaptive
+      number of replications, see adaptive_replications):
         * p_audits: count of all patients in different stages of COVID
         * u_audits: counts of patients (by COVID stage) at each unit
         * p_audits: count of displaced patients, and additional travel time
         * i_audits: count of inpatients
+    * Save audits in binary formats if requested (see sim.output)
     * Expand audits (remove multi-index used to collate audits)
-    * Save audits to csv files
+    * Save audits to csv files (if requested)
     * Pass audits to end-run analysis
 
     Runs scenarios in separate threads using joblib
@@ -39,6 +76,41 @@ def run_replications(scenarios, number_of_replications=30, base_random_set=0,
         Path to save .csv result files to. Default is 'output'.
     plot : boolean, optional
         Whether to create plots. Default is True.
+    inputs : ModelInputs, optional
+        Preloaded model input data. If None, input data is read from the data/
+        folder once before running scenarios. Default is None.
+    chunk_size : int, 'auto' or None, optional
+        Number of replications run by each worker task (see
+        multiple_replications). Default is 'auto'.
+    output_format : str or list of str, optional
+        Format(s) to save audits in: 'csv', 'parquet', 'feather' or 'npz'
+        (binary formats save tidy tables, see sim.output; load with
+        EndTrialAnalysis.from_files). Default is 'csv'.
+    store_folder : str, optional
+        If given, each replication is saved to a ReplicationStore (in a
+        subfolder for each scenario) as it completes, rather than returned
+        from worker processes. Outputs are then saved from the store one
+        replication at a time (see save_store_audits), and plots use an online
+        summary of replications (EndTrialAnalysis.from_summary), so all
+        replications are never held in memory. Existing replication files for
+        the scenario are removed first. Default is None.
+    relative_precision : float, optional
+        If given, the number of replications is adaptive: replications are run
+        in batches until confidence interval half-widths of KPIs are within
+        this proportion of their means, with number_of_replications as the
+        maximum (see adaptive_replications). Achieved precision is printed and
+        saved as CSV. Cannot be used with store_folder. Default is None.
+    kpis : iterable of str, optional
+        KPIs used for adaptive number of replications (see KPI_FUNCTIONS).
+        Default is all.
+    common_random_numbers : boolean, optional
+        Variance reduction for comparing scenarios: every patient sample is
+        drawn for every patient, so each patient has the same random numbers
+        in all scenarios (for the same replication; see Scenario). Scenarios
+        are copied, not changed. Default is False.
+    antithetic : boolean, optional
+        Variance reduction within scenarios: run replications as antithetic
+        pairs (see replication_random_set). Default is False.
 
     Returns
     -------
@@ -51,50 +123,407 @@ def run_replications(scenarios, number_of_replications=30, base_random_set=0,
     # Add scenarios to be run to dictionary
     scenarios = scenarios
 
+    if relative_precision is not None and store_folder is not None:
+        raise ValueError('Adaptive number of replications cannot use store_folder')
+
+    # Check output formats before running scenarios
+    output_formats = [output_format] if isinstance(output_format, str) else output_format
+    for output_format in output_formats:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format: {output_format}')
+
+    # Load model input data (read and rank units once for all scenarios)
+    if inputs is None:
+        inputs = ModelInputs.load()
+
+    # Use common random numbers (on copies of scenarios)
+    if common_random_numbers:
+        scenarios = {name: copy.copy(scenario) for name, scenario in scenarios.items()}
+        for scenario in scenarios.values():
+            scenario.common_random_numbers = True
+
     # Loop through all scenarios
     for name, scenario in scenarios.items():
 
-        print(f'Running {N_REPS} reps of {name} =>', end=' ')
+        if relative_precision is None:
+            print(f'Running {N_REPS} reps of {name} =>', end=' ')
+        else:
+            print(f'Running up to {N_REPS} reps of {name} =>', end=' ')
         # Get audits from each scenario
 
         # Run each scenario in separate CPU thread (limit threads with n_jobs)
-        p_audits, u_audits, d_audits, i_audits = multiple_replications(
-            scenarios[name], n_reps=N_REPS, n_jobs=-1,
-            base_random_set=base_random_set)
-
-        # Expand multi-index to save as CSV
-        p_audits = expand_multi_index(p_audits, ['scenario', 'day'])
-        d_audits = expand_multi_index(d_audits, ['scenario', 'day'])
-        u_audits = expand_multi_index(u_audits, ['scenario', 'audit#'])
-        i_audits = expand_multi_index(i_audits, ['scenario', 'audit#'])
-
-        # Save as CSV
-        p_audits.to_csv(
-            f'{output_folder}/{name}_reps_{N_REPS}_patient_audit.csv', index=False)
-        u_audits.to_csv(
-            f'{output_folder}/{name}_reps_{N_REPS}_unit_audit.csv', index=False)
-        d_audits.to_csv(
-            f'{output_folder}/{name}_reps_{N_REPS}_displaced_audit.csv', index=False)
-        i_audits.to_csv(
-            f'{output_folder}/{name}_reps_{N_REPS}_inpatient_audit.csv', index=False)
-
-        # Run analysis after all replicate runs in a scenario
-        if plot:
-            analysis = EndTrialAnalysis(name, p_audits, u_audits, d_audits, i_audits)
-            analysis.plot_patient_audit()
-            analysis.plot_displaced_audit()
-            analysis.plot_unit_audit()
+        n_reps = N_REPS
+        if relative_precision is not None:
+            audits, report = adaptive_replications(
+                scenarios[name], kpis=kpis, relative_precision=relative_precision,
+                max_reps=N_REPS, n_jobs=-1, base_random_set=base_random_set,
+                inputs=inputs, chunk_size=chunk_size, antithetic=antithetic)
+            p_audits, u_audits, d_audits, i_audits = audits
+            n_reps = int(report['replications'].max())
+            print(f'\n{report.to_string()}')
+            report.to_csv(f'{output_folder}/{name}_reps_{n_reps}_precision.csv')
+        elif store_folder is None:
+            p_audits, u_audits, d_audits, i_audits = multiple_replications(
+                scenarios[name], n_reps=N_REPS, n_jobs=-1,
+                base_random_set=base_random_set, inputs=inputs,
+                chunk_size=chunk_size, antithetic=antithetic)
+        else:
+            store = ReplicationStore(f'{store_folder}/{name}')
+            store.clear()
+            multiple_replications(
+                scenarios[name], n_reps=N_REPS, n_jobs=-1,
+                base_random_set=base_random_set, inputs=inputs,
+                chunk_size=chunk_size, store=store, antithetic=antithetic)
+
+            # Save audits and run analysis one replication at a time
+            summary = ReplicationSummary() if plot else None
+            save_store_audits(name, store, f'{output_folder}/{name}_reps_{n_reps}',
+                              output_formats, summary)
+            if plot:
+                analysis = EndTrialAnalysis.from_summary(name, summary)
+                analysis.plot_patient_audit()
+                analysis.plot_displaced_audit()
+                analysis.plot_unit_audit()
+            print('Done.')
+            continue
+
+        # Save audits and run analysis
+        save_scenario_outputs(name, (p_audits, u_audits, d_audits, i_audits),
+                              f'{output_folder}/{name}_reps_{n_reps}', output_formats,
+                              plot)
 
         print('Done.')
 
     # All scenarios complete
 
 
-def multiple_replications(scenario, n_reps=10, n_jobs=1, base_random_set=0):
+def save_scenario_outputs(name, audits, path_stem, output_formats, plot=True):
+    '''
+    Save audits of a scenario (from multiple_replications) in output formats,
+    and run end-run analysis.
+
+    * Save audits in binary formats if requested (see sim.output)
+    * Expand audits (remove multi-index used to collate audits)
+    * Save audits to csv files (if requested)
+    * Pass audits to end-run analysis (if plotting)
+
+    Parameters
+    ----------
+    name : str
+        Scenario name.
+    audits : tuple of DataFrame
+        Patient, unit, displaced and inpatient audits with multi-index (rep,
+        row).
+    path_stem : str
+        Start of file paths (folder, scenario name and number of reps).
+    output_formats : list of str
+        Formats to save audits in: 'csv', 'parquet', 'feather' or 'npz'.
+    plot : boolean, optional
+        Whether to create plots. Default is True.
+
+    Returns
+    -------
+    None.
+    '''
+    p_audits, u_audits, d_audits, i_audits = audits
+
+    # Save in binary formats
+    for output_format in output_formats:
+        if output_format != 'csv':
+            save_audits(name, (p_audits, u_audits, d_audits, i_audits),
+                        path_stem, output_format)
+
+    # Expand multi-index to save as CSV
+    p_audits = expand_multi_index(p_audits, ['scenario', 'day'])
+    d_audits = expand_multi_index(d_audits, ['scenario', 'day'])
+    u_audits = expand_multi_index(u_audits, ['scenario', 'audit#'])
+    i_audits = expand_multi_index(i_audits, ['scenario', 'audit#'])
+
+    # Save as CSV
+    if 'csv' in output_formats:
+        p_audits.to_csv(f'{path_stem}_patient_audit.csv', index=False)
+        u_audits.to_csv(f'{path_stem}_unit_audit.csv', index=False)
+        d_audits.to_csv(f'{path_stem}_displaced_audit.csv', index=False)
+        i_audits.to_csv(f'{path_stem}_inpatient_audit.csv', index=False)
+
+    # Run analysis after all replicate runs in a scenario
+    if plot:
+        analysis = EndTrialAnalysis(name, p_audits, u_audits, d_audits, i_audits)
+        analysis.plot_patient_audit()
+        analysis.plot_displaced_audit()
+        analysis.plot_unit_audit()
+
+
+def scenario_grid(sweeps, **parameters):
+    '''
+    Scenarios for every combination of swept parameter values (a parameter
+    sweep), e.g.
+
+    scenario_grid({'total_proportion_people_infected': [0.6, 0.8],
+                   'mortality': np.linspace(0.1, 0.2, 3)}, run_length=150)
+
+    gives 6 scenarios, named from their swept values (e.g.
+    'total_proportion_people_infected_0.6_mortality_0.15').
+
+    Parameters
+    ----------
+    sweeps : dict
+        Values (iterable) of each swept Scenario parameter.
+    **parameters :
+        Other Scenario parameters (the same for all scenarios).
+
+    Returns
+    -------
+    scenarios : dict
+        Scenario for each combination of swept values (in order of
+        combinations, last parameter varying fastest).
+    '''
+    names = list(sweeps)
+    scenarios = dict()
+    for values in itertools.product(*[list(sweep) for sweep in sweeps.values()]):
+        swept = dict(zip(names, values))
+        name = '_'.join(
+            f'{key}_{value:g}' if isinstance(value, numbers.Real) and
+            not isinstance(value, bool) else f'{key}_{value}'
+            for key, value in swept.items())
+        scenarios[name] = Scenario(**parameters, **swept)
+
+    return scenarios
+
+
+def run_scenario_grid(scenarios, number_of_replications=30, base_random_set=0,
+                      output_folder='output', plot=False, inputs=None, n_jobs=-1,
+                      chunk_size='auto', output_format='csv',
+                      common_random_numbers=False, antithetic=False):
+    '''
+    Run replications of several scenarios (e.g. from scenario_grid) from one
+    work queue. Chunks of replications from all scenarios are run by a
+    shared pool of workers (rather than one scenario at a time, as
+    run_replications), so workers are not left idle at the end of each
+    scenario. Chunks are queued in scenario order, and outputs of each
+    scenario are saved (as run_replications, see save_scenario_outputs) as
+    soon as all of its replications are complete.
+
+    Replication i of each scenario uses the same random number set as in
+    run_replications (base_random_set + i, or antithetic pairs), so outputs
+    are the same.
+
+    Parameters
+    ----------
+    scenarios : dict
+        Scenario for each scenario name.
+    number_of_replications : int, optional
+        Number of independent replications of each scenario. The default is
+        30.
+    base_random_set : int, optional
+        To create the random number set for each replication, the replication
+        number is added to this value. The default is 0.
+    output_folder : str, optional
+        Path to save result files to. Default is 'output'.
+    plot : boolean, optional
+        Whether to create plots. Default is False.
+    inputs : ModelInputs, optional
+        Preloaded model input data. If None, input data is read from the data/
+        folder once. Default is None.
+    n_jobs : int, optional
+        No. of workers (-1 for all cores). Default is -1.
+    chunk_size : int or 'auto', optional
+        Number of replications in each task. 'auto' chooses chunk size from
+        number of workers and total number of replications of all scenarios
+        (see get_chunk_size). Default is 'auto'.
+    output_format : str or list of str, optional
+        Format(s) to save audits in (see run_replications). Default is 'csv'.
+    common_random_numbers : boolean, optional
+        Use common random numbers across scenarios (see run_replications).
+        Default is False.
+    antithetic : boolean, optional
+        Run replications as antithetic pairs. Default is False.
+
+    Returns
+    -------
+    None.
+    '''
+    # Check output formats before running scenarios
+    output_formats = [output_format] if isinstance(output_format, str) else output_format
+    for output_format in output_formats:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format: {output_format}')
+
+    # Load model input data (read and rank units once for all scenarios)
+    if inputs is None:
+        inputs = ModelInputs.load()
+
+    # Use common random numbers (on copies of scenarios)
+    if common_random_numbers:
+        scenarios = {name: copy.copy(scenario) for name, scenario in scenarios.items()}
+        for scenario in scenarios.values():
+            scenario.common_random_numbers = True
+
+    # Queue chunks of replications of all scenarios (in scenario order)
+    n_reps = number_of_replications
+    if chunk_size == 'auto':
+        chunk_size = min(get_chunk_size(n_reps * len(scenarios), n_jobs), n_reps)
+    tasks = [(name, range(start, min(start + chunk_size, n_reps)))
+             for name in scenarios for start in range(0, n_reps, chunk_size)]
+    remaining = {name: math.ceil(n_reps / chunk_size) for name in scenarios}
+    results = {name: dict() for name in scenarios}
+
+    print(f'Running {n_reps} reps of {len(scenarios)} scenarios =>', end=' ')
+    for (name, chunk), result in iter_completed_chunks(
+            scenarios, tasks, base_random_set, inputs, n_jobs, antithetic):
+
+        # Save outputs of scenario when all its chunks are complete
+        results[name][chunk.start] = result
+        remaining[name] -= 1
+        if remaining[name] == 0:
+            audits = unpack_chunks(
+                [results[name][start] for start in sorted(results[name])])
+            del results[name]
+            save_scenario_outputs(name, audits, f'{output_folder}/{name}_reps_{n_reps}',
+                                  output_formats, plot)
+            print(f'{name} done.', end=' ')
+
+    print('Done.')
+
+
+def iter_completed_chunks(scenarios, tasks, base_random_set=0, inputs=None, n_jobs=-1,
+                          antithetic=False):
+    '''
+    Run chunks of replications (see run_chunk) of several scenarios, and
+    yield results as chunks complete. With more than one worker, chunks are
+    submitted (in task order) to a pool of worker processes (a loky process
+    pool, as used by joblib, shut down when all chunks are complete);
+    otherwise chunks are run in order in this process. Model input data is
+    sent to each worker once, when the worker starts (see set_worker_inputs),
+    rather than with every chunk, with arrays memory-mapped (see
+    ModelInputs.to_memmap).
+
+    Parameters
+    ----------
+    scenarios : dict
+        Scenario for each scenario name.
+    tasks : list of tuple
+        Scenario name and replication numbers (range) of each chunk.
+    base_random_set : int, optional
+        Random number set of first replication (see replication_random_set).
+        The default is 0.
+    inputs : ModelInputs, optional
+        Preloaded model input data. The default is None.
+    n_jobs : int, optional
+        No. of workers (-1 for all cores). The default is -1.
+    antithetic : bool, optional
+        Run replications as antithetic pairs. The default is False.
+
+    Yields
+    ------
+    task : tuple
+        Scenario name and replication numbers of chunk.
+    result : tuple of dict
+        Packed patient, unit, displaced and inpatient audits for the chunk
+        (see pack_audits).
+    '''
+    n_workers = min(effective_n_jobs(n_jobs), len(tasks))
+    if n_workers <= 1:
+        for name, chunk in tasks:
+            yield (name, chunk), run_chunk(scenarios[name], chunk, base_random_set,
+                                           inputs, antithetic=antithetic)
+        return
+
+    # Share input arrays with workers as memory-mapped files
+    if inputs is not None:
+        inputs = inputs.to_memmap()
+
+    # Use a pool for these chunks only (joblib manages the reusable loky pool
+    # itself, and expects to have created it)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=set_worker_inputs,
+                             initargs=(inputs,)) as executor:
+        futures = {executor.submit(run_worker_chunk, scenarios[name], chunk,
+                                   base_random_set, antithetic=antithetic): (name, chunk)
+                   for name, chunk in tasks}
+        try:
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield futures.pop(future), future.result()
+        finally:
+            # Cancel chunks not yet started if iteration stops early
+            for future in futures:
+                future.cancel()
+
+
+def set_worker_inputs(inputs):
+    '''
+    Set model input data used by chunks run in this worker process (see
+    run_worker_chunk). Run once when each worker process starts.
+
+    Parameters
+    ----------
+    inputs : ModelInputs or None
+        Preloaded model input data.
+
+    Returns
+    -------
+    None.
+    '''
+    global _worker_inputs
+    _worker_inputs = inputs
+
+
+def run_worker_chunk(scenario, replications, base_random_set=0, antithetic=False):
+    '''
+    Run a chunk of replications (see run_chunk) in a worker process, with the
+    model input data set for the worker by set_worker_inputs.
+
+    Parameters
+    ----------
+    scenario : dataclass Scenario
+        Parameters for model run.
+    replications : iterable of int
+        Replication numbers to run.
+    base_random_set : int, optional
+        Random number set of first replication (see replication_random_set).
+        The default is 0.
+    antithetic : bool, optional
+        Run replications as antithetic pairs. The default is False.
+
+    Returns
+    -------
+    tuple of dict
+        Packed patient, unit, displaced and inpatient audits for the chunk
+        (see pack_audits).
+    '''
+    return run_chunk(scenario, replications, base_random_set, _worker_inputs,
+                     antithetic=antithetic)
+
+
+def multiple_replications(scenario, n_reps=10, n_jobs=1, base_random_set=0,
+                          inputs=None, chunk_size=None, store=None, summary=None,
+                          antithetic=False):
     '''
     Multiple independent replications of DialysisSim for a 
     scenario
 
+    Replications are run either as one task per replication, or in chunks:
+    each task runs a block of replications back-to-back (with one model,
+    reset between replications) and returns one columnar result for the
+    chunk, reducing the number of scenario and result transfers between
+    processes. Results are the same in either mode.
+
+    If a ReplicationStore is given, each replication is saved to the store as
+    it completes (by the worker running it) and audits are not returned, so
+    memory use is bounded by one replication per worker. Read results with
+    the store (load, or iter_replications for one replication at a time).
+
+    If a ReplicationSummary is given, replications are run in chunks and each
+    task keeps an online summary of its replications (see
+    sim.aggregation.ReplicationSummary); summaries of chunks are merged into
+    the given summary, and audits are not returned (use a store as well to
+    keep audits).
+
+    If antithetic is True, replications are run as antithetic pairs (see
+    replication_random_set), reducing the variance of means over replications
+    where outputs respond monotonically to the random numbers.
+
     Parameters
     ----------
     scenario : dataclass Scenario
@@ -106,6 +535,21 @@ def multiple_replications(scenario, n_reps=10, n_jobs=1, base_random_set=0):
     base_random_set : int, optional
         To create the random number set for each replication, the replication
         number is added to this value. The default is 0.
+    inputs : ModelInputs, optional
+        Preloaded model input data shared by all replications (arrays are
+        memory-mapped for worker processes, see ModelInputs.to_memmap). If
+        None, input data is read once from the data/ folder. The default is
+        None.
+    chunk_size : int, 'auto' or None, optional
+        Number of replications run by each task. 'auto' chooses chunk size
+        from number of workers and replications (see get_chunk_size). None
+        runs one task per replication. The default is None.
+    store : ReplicationStore, optional
+        Store to save replications to as they complete. The default is None.
+    summary : ReplicationSummary, optional
+        Summary to add replications to. The default is None.
+    antithetic : bool, optional
+        Run replications as antithetic pairs. The default is False.
 
     Returns
     -------
@@ -113,19 +557,396 @@ def multiple_replications(scenario, n_reps=10, n_jobs=1, base_random_set=0):
         List of Tuples (1 for each replication)
             0: Patient Audit.
             1. Unit Audit
+        (None if replications are saved to a store or summarised)
 
     TM Note: At the moment this is not combined....
 
     '''
+    # Load model input data once for all replications (arrays shared with
+    # worker processes as memory-mapped files)
+    if inputs is None:
+        inputs = ModelInputs.load()
+    if effective_n_jobs(n_jobs) > 1:
+        inputs = inputs.to_memmap()
+
     # Run in parallel, using the replication number as the random number set
-    audits = Parallel(n_jobs=n_jobs)(
-        delayed(single_run)(scenario, i, random_number_set=i+base_random_set)
-        for i in range(n_reps))
+    if chunk_size is None and summary is None:
+        rep_sets = [replication_random_set(i, base_random_set, antithetic)
+                    for i in range(n_reps)]
+        audits = Parallel(n_jobs=n_jobs)(
+            delayed(single_run)(scenario, i, random_number_set=random_number_set,
+                                inputs=inputs, store=store, antithetic=antithetic_rep)
+            for i, (random_number_set, antithetic_rep) in enumerate(rep_sets))
+
+        return None if store is not None else unpack_audits(audits)
+
+    # Run chunks of replications in parallel (one replication per chunk if
+    # chunk size is not given)
+    if chunk_size is None:
+        chunk_size = 1
+    elif chunk_size == 'auto':
+        chunk_size = get_chunk_size(n_reps, n_jobs)
+    chunks = [range(start, min(start + chunk_size, n_reps))
+              for start in range(0, n_reps, chunk_size)]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(run_chunk)(scenario, chunk, base_random_set, inputs, store,
+                           None if summary is None else summary.empty_like(),
+                           antithetic)
+        for chunk in chunks)
+
+    # Merge summaries of chunks (in replication order)
+    if summary is not None:
+        for chunk_summary in results:
+            summary.merge(chunk_summary)
+        return None
 
-    return unpack_audits(audits)
+    return None if store is not None else unpack_chunks(results)
 
 
-def single_run(scenario, i=0, random_number_set=None):
+def adaptive_replications(scenario, kpis=tuple(KPI_FUNCTIONS), relative_precision=0.05,
+                          confidence=0.95, min_reps=10, max_reps=100, batch_size=None,
+                          n_jobs=-1, base_random_set=0, inputs=None, chunk_size='auto',
+                          antithetic=False):
+    '''
+    Replications of DialysisSim for a scenario, run in parallel batches until
+    the confidence interval half-width of the mean of each KPI (see
+    KPI_FUNCTIONS) is within a relative precision of the mean, or until a
+    maximum number of replications.
+
+    Replications are numbered (and use random number sets) in order across
+    batches, so audits are the same as from multiple_replications with the
+    number of replications run. With antithetic pairs, first batch and batch
+    sizes are rounded up to even numbers, so pairs are not split.
+
+    Parameters
+    ----------
+    scenario : dataclass Scenario
+        parameters for the scenario.
+    kpis : iterable of str, optional
+        KPIs (keys of KPI_FUNCTIONS) to reach precision. The default is all.
+    relative_precision : float, optional
+        Target confidence interval half-width as a proportion of the mean. The
+        default is 0.05.
+    confidence : float, optional
+        Confidence level of intervals (t-distribution). The default is 0.95.
+    min_reps : int, optional
+        Number of replications in first batch (at least 2). The default is 10.
+    max_reps : int, optional
+        Maximum number of replications. The default is 100.
+    batch_size : int, optional
+        Number of replications in each further batch. If None, the number of
+        workers (at least 2). The default is None.
+    n_jobs : int, optional
+        No.of cores for parallel reps (-1 for all cores). The default is -1.
+    base_random_set : int, optional
+        To create the random number set for each replication, the replication
+        number is added to this value. The default is 0.
+    inputs : ModelInputs, optional
+        Preloaded model input data. If None, input data is read once from the
+        data/ folder. The default is None.
+    chunk_size : int, 'auto' or None, optional
+        Number of replications run by each task (see multiple_replications).
+        The default is 'auto'.
+    antithetic : bool, optional
+        Run replications as antithetic pairs. The default is False.
+
+    Returns
+    -------
+    audits : tuple of DataFrame
+        Patient, unit, displaced and inpatient audits (as
+        multiple_replications).
+    report : DataFrame
+        Precision achieved for each KPI (see precision_report).
+    '''
+    for kpi in kpis:
+        if kpi not in KPI_FUNCTIONS:
+            raise ValueError(f'Unknown KPI: {kpi}')
+
+    # Load model input data once for all batches
+    if inputs is None:
+        inputs = ModelInputs.load()
+
+    if batch_size is None:
+        batch_size = max(effective_n_jobs(n_jobs), 2)
+
+    # Keep antithetic pairs in the same batch
+    pair = 2 if antithetic else 1
+    batch_size = pair * math.ceil(batch_size / pair)
+
+    batches = []
+    n_reps = 0
+    batch_reps = min(pair * math.ceil(max(min_reps, 2) / pair), max_reps)
+    while True:
+        # Run batch (replication numbers continue from previous batches)
+        batch = multiple_replications(
+            scenario, n_reps=batch_reps, n_jobs=n_jobs,
+            base_random_set=base_random_set + n_reps // pair, inputs=inputs,
+            chunk_size=chunk_size, antithetic=antithetic)
+        for audit in batch:
+            audit.index = audit.index.set_levels(
+                audit.index.levels[0] + n_reps, level=0)
+        batches.append(batch)
+        n_reps += batch_reps
+
+        # Check precision of KPIs from all replications so far
+        audits = tuple(pd.concat([batch[k] for batch in batches]) for k in range(4))
+        report = precision_report(
+            replication_kpis(audits, kpis), relative_precision, confidence)
+        if report['converged'].all() or n_reps >= max_reps:
+            break
+        batch_reps = min(batch_size, max_reps - n_reps)
+
+    return audits, report
+
+
+def replication_kpis(audits, kpis=tuple(KPI_FUNCTIONS)):
+    '''
+    KPIs of each replication (see KPI_FUNCTIONS).
+
+    Parameters
+    ----------
+    audits : tuple of DataFrame
+        Patient, unit, displaced and inpatient audits with multi-index (rep,
+        row), as returned by multiple_replications.
+    kpis : iterable of str, optional
+        KPIs to calculate. The default is all.
+
+    Returns
+    -------
+    DataFrame
+        KPIs (columns) of each replication (index).
+    '''
+    return pd.DataFrame({kpi: KPI_FUNCTIONS[kpi](*audits) for kpi in kpis})
+
+
+def precision_report(kpi_values, relative_precision=0.05, confidence=0.95):
+    '''
+    Mean, confidence interval half-width (t-distribution) and relative
+    precision (half-width / mean) of KPIs across replications.
+
+    Parameters
+    ----------
+    kpi_values : DataFrame
+        KPIs (columns) of each replication (index).
+    relative_precision : float, optional
+        Target relative precision. The default is 0.05.
+    confidence : float, optional
+        Confidence level of intervals. The default is 0.95.
+
+    Returns
+    -------
+    DataFrame
+        For each KPI (index): replications, mean, std, half_width,
+        relative_precision, target and converged (relative precision within
+        target; a KPI with zero mean is converged only if it has no variation).
+    '''
+    # scipy is only needed for adaptive replications (imported when used)
+    from scipy import stats
+
+    n = kpi_values.count()
+    mean = kpi_values.mean()
+    std = kpi_values.std()
+    half_width = stats.t.ppf((1 + confidence) / 2, n - 1) * std / np.sqrt(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = half_width / mean.abs()
+    precision[(half_width == 0) & (mean == 0)] = 0.0
+
+    return pd.DataFrame({'replications': n,
+                         'mean': mean,
+                         'std': std,
+                         'half_width': half_width,
+                         'relative_precision': precision,
+                         'target': relative_precision,
+                         'converged': precision <= relative_precision})
+
+
+def get_chunk_size(n_reps, n_jobs=1):
+    '''
+    Automatic chunk size for replications: replications are split into
+    CHUNKS_PER_WORKER chunks for each worker (or fewer chunks if there are
+    fewer replications).
+
+    Parameters
+    ----------
+    n_reps : int
+        Number of replications.
+    n_jobs : int, optional
+        No. of cores for parallel reps (-1 for all cores). The default is 1.
+
+    Returns
+    -------
+    int
+        Number of replications in each chunk.
+    '''
+    n_workers = effective_n_jobs(n_jobs)
+    return max(1, math.ceil(n_reps / (n_workers * CHUNKS_PER_WORKER)))
+
+
+def run_chunk(scenario, replications, base_random_set=0, inputs=None, store=None,
+              summary=None, antithetic=False):
+    '''
+    Run a chunk of replications of DialysisSim back-to-back. One model is set
+    up for the chunk and reset (DialysisSim.reset) for each further
+    replication.
+
+    Parameters
+    ----------
+    scenario : dataclass Scenario
+        Parameters for model run.
+    replications : iterable of int
+        Replication numbers to run.
+    base_random_set : int, optional
+        The replication number is added to this value to give the random
+        number set for each replication (see replication_random_set). The
+        default is 0.
+    inputs : ModelInputs, optional
+        Preloaded model input data. If None, input data is read from the data/
+        folder. The default is None.
+    store : ReplicationStore, optional
+        If given, each replication is saved to store as it completes (and
+        audits are not returned). The default is None.
+    summary : ReplicationSummary, optional
+        If given, each replication is added to summary as it completes (and
+        audits are not returned). The default is None.
+    antithetic : bool, optional
+        Run replications as antithetic pairs. The default is False.
+
+    Returns
+    -------
+    tuple of dict, ReplicationSummary or None
+        Packed patient, unit, displaced and inpatient audits for the chunk
+        (see pack_audits); or summary if given; or None if replications are
+        saved to a store.
+    '''
+    audits = []
+    model = None
+    for i in replications:
+        random_number_set, antithetic_rep = replication_random_set(
+            i, base_random_set, antithetic)
+        print(f'{i}, ', end='')
+        if model is None:
+            scenario.set_random_no_set(random_number_set, antithetic_rep)
+            model = DialysisSim(scenario, inputs)
+        else:
+            model.reset(random_number_set, antithetic_rep)
+        model.run()
+        rep_audits = (model.audit.patient_audit, model.audit.unit_audit,
+                      model.audit.displaced_audit, model.audit.inpatient_audit)
+        if store is not None:
+            store.save(i, rep_audits)
+        if summary is not None:
+            summary.add_replication(rep_audits, i)
+        if store is None and summary is None:
+            audits.append(rep_audits)
+
+    if summary is not None:
+        return summary
+    if store is not None:
+        return None
+
+    return tuple(pack_audits([rep_audits[k] for rep_audits in audits], replications)
+                 for k in range(4))
+
+
+def pack_audits(audits, replications):
+    '''
+    Pack one type of audit from several replications into a single columnar
+    dictionary: one array per column (text columns as categoricals), with the
+    replication number and original index of each row.
+
+    Parameters
+    ----------
+    audits : list of DataFrame
+        Audit from each replication.
+    replications : iterable of int
+        Replication number of each audit.
+
+    Returns
+    -------
+    dict
+        'rep': replication number of each row, 'index': index of each row in
+        its replication audit, 'columns': dictionary of column arrays.
+    '''
+    columns = dict()
+    for column in audits[0].columns:
+        values = np.concatenate([audit[column].values for audit in audits])
+        if values.dtype == object:
+            values = pd.Categorical(values)
+        columns[column] = values
+
+    return {'rep': np.repeat(list(replications), [len(audit) for audit in audits]),
+            'index': np.concatenate([audit.index.values for audit in audits]),
+            'columns': columns}
+
+
+def unpack_chunks(packed_chunks):
+    '''
+    Unpacks packed audits from chunks of replications into seperate
+    multi-index data frames (rep, day), as unpack_audits.
+
+    Parameters
+    ----------
+    packed_chunks : list
+        Packed patient, unit, displaced and inpatient audits from each chunk
+        (in replication order).
+
+    Returns
+    -------
+    Tuple of DataFrames
+        Patient, unit, displaced and inpatient audits with multi-index.
+    '''
+    dataframes = []
+    for k in range(4):
+        packed = [chunk[k] for chunk in packed_chunks]
+        index = pd.MultiIndex.from_arrays(
+            [np.concatenate([p['rep'] for p in packed]),
+             np.concatenate([p['index'] for p in packed])])
+        columns = dict()
+        for column in packed[0]['columns']:
+            values = [p['columns'][column] for p in packed]
+            columns[column] = np.concatenate([np.asarray(v) for v in values])
+        dataframes.append(pd.DataFrame(columns, index=index))
+
+    df_patient, df_unit, df_displaced, df_inpatients = dataframes
+
+    # Remove duplicate 'day'
+    df_patient.drop('day', axis=1, inplace=True)
+    df_displaced.drop('day', axis=1, inplace=True)
+
+    # Return patient, unit, displaced patients, and inpatient audits
+    return df_patient, df_unit, df_displaced, df_inpatients
+
+
+def replication_random_set(i, base_random_set=0, antithetic=False):
+    '''
+    Random number set for a replication. Without antithetic pairs, the
+    replication number is added to base_random_set. With antithetic pairs,
+    replications 2k and 2k+1 both use random number set base_random_set + k,
+    and replication 2k+1 uses antithetic samples (see Scenario.set_random_no_set).
+
+    Parameters
+    ----------
+    i : int
+        Replication number.
+    base_random_set : int, optional
+        Random number set of first replication. The default is 0.
+    antithetic : bool, optional
+        Replications run as antithetic pairs. The default is False.
+
+    Returns
+    -------
+    random_number_set : int
+        Random number set for replication.
+    antithetic : bool
+        Whether replication uses antithetic samples.
+    '''
+    if antithetic:
+        return base_random_set + i // 2, i % 2 == 1
+    return base_random_set + i, False
+
+
+def single_run(scenario, i=0, random_number_set=None, inputs=None, store=None,
+               antithetic=False):
     '''
     Single run of DialysisSim for scenario
 
@@ -138,6 +959,14 @@ def single_run(scenario, i=0, random_number_set=None):
     random_number_set : int or None, optional (default=None)
         Controls the set of random seeds used by stochastic parts of the model.
         Use None for a random set of seeds.
+    inputs : ModelInputs, optional
+        Preloaded model input data. If None, input data is read from the data/
+        folder. The default is None.
+    store : ReplicationStore, optional
+        If given, audits are saved to store (as replication i) rather than
+        returned. The default is None.
+    antithetic : bool, optional
+        Use antithetic samples of the random number set. The default is False.
 
     Returns
     -------
@@ -148,16 +977,21 @@ def single_run(scenario, i=0, random_number_set=None):
 
     '''
     # Set random number set
-    scenario.set_random_no_set(random_number_set)
+    scenario.set_random_no_set(random_number_set, antithetic)
 
     # Run the model
     print(f'{i}, ', end='')
-    model = DialysisSim(scenario)
+    model = DialysisSim(scenario, inputs)
     model.run()
 
-    # Return audits
-    return model.audit.patient_audit, model.audit.unit_audit, \
-        model.audit.displaced_audit, model.audit.inpatient_audit
+    audits = (model.audit.patient_audit, model.audit.unit_audit,
+              model.audit.displaced_audit, model.audit.inpatient_audit)
+
+    # Save or return audits
+    if store is not None:
+        store.save(i, audits)
+        return None
+    return audits
 
 
 def unpack_audits(audits):
@@ -0,0 +1,167 @@
+'''
+Contains classes for running statistics updated as the model runs
+'''
+import bisect
+import math
+
+
+class OrderStatistics:
+    """
+    Multiset of numeric values with order statistics (minimum, maximum,
+    quantiles) and total available at any time. Counts of each distinct value
+    are held in a Fenwick (binary indexed) tree, so adding a value already
+    seen, removing a value, and finding the k-th smallest value take
+    O(log v) time (v = number of distinct values). A new distinct value
+    rebuilds the tree (O(v)).
+
+    Quantiles use linear interpolation between order statistics, as in
+    numpy.quantile with method='linear'.
+
+    Object attributes
+    -----------------
+
+    total: Sum of values held
+    values: Sorted list of distinct values seen
+
+    Methods
+    -------
+
+    add:
+        Add a value
+    kth_smallest:
+        Value at rank k (0 = smallest)
+    max:
+        Largest value
+    min:
+        Smallest value
+    quantile:
+        Quantile of values (linear interpolation)
+    remove:
+        Remove one instance of a value
+    """
+
+    def __init__(self):
+        """Constructor for empty multiset"""
+        self.values = []
+        self.total = 0
+        self._position = dict()
+        self._counts = []
+        self._tree = [0]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _rebuild(self):
+        """Rebuild value positions and Fenwick tree after new distinct value"""
+        self._position = {value: i for i, value in enumerate(self.values)}
+        self._tree = [0] + list(self._counts)
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def _update(self, position, change):
+        """Change count of value at position (0-based) in Fenwick tree"""
+        self._counts[position] += change
+        i = position + 1
+        while i < len(self._tree):
+            self._tree[i] += change
+            i += i & -i
+
+    def add(self, value):
+        """
+        Add a value.
+
+        Parameters
+        ----------
+        value : int or float
+            Value to add.
+        """
+        if value not in self._position:
+            position = bisect.bisect_left(self.values, value)
+            self.values.insert(position, value)
+            self._counts.insert(position, 0)
+            self._rebuild()
+        self._update(self._position[value], 1)
+        self.total += value
+        self._size += 1
+
+    def remove(self, value):
+        """
+        Remove one instance of a value.
+
+        Parameters
+        ----------
+        value : int or float
+            Value to remove.
+
+        Raises
+        ------
+        ValueError
+            If value is not held.
+        """
+        position = self._position.get(value)
+        if position is None or self._counts[position] == 0:
+            raise ValueError(f'{value} not in OrderStatistics')
+        self._update(position, -1)
+        self.total -= value
+        self._size -= 1
+
+    def kth_smallest(self, k):
+        """
+        Value at rank k (0 = smallest).
+
+        Parameters
+        ----------
+        k : int
+            Rank (0 to number of values - 1).
+
+        Returns
+        -------
+        int or float
+            Value at rank k.
+        """
+        if not 0 <= k < self._size:
+            raise IndexError('rank out of range')
+        position = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step > 0:
+            next_position = position + step
+            if next_position < len(self._tree) and self._tree[next_position] <= k:
+                position = next_position
+                k -= self._tree[position]
+            step >>= 1
+        return self.values[position]
+
+    def min(self):
+        """Smallest value"""
+        return self.kth_smallest(0)
+
+    def max(self):
+        """Largest value"""
+        return self.kth_smallest(self._size - 1)
+
+    def quantile(self, q):
+        """
+        Quantile of values using linear interpolation between the order
+        statistics either side (same arithmetic as numpy.quantile with
+        method='linear', called interpolation='linear' before numpy 1.22).
+
+        Parameters
+        ----------
+        q : float
+            Quantile (0 to 1).
+
+        Returns
+        -------
+        float
+            Quantile of values.
+        """
+        index = q * (self._size - 1)
+        below = math.floor(index)
+        above = min(below + 1, self._size - 1)
+        weight_above = index - below
+        weight_below = 1 - weight_above
+        return (self.kth_smallest(below) * weight_below +
+                self.kth_smallest(above) * weight_above)
@@ -1,78 +1,163 @@
+import hashlib
+import os
+
+import numpy as np
 import pandas as pd
 
+# Sort used to order locations by travel time: pandas sort_values default (quicksort,
+# not stable), as used by the original row-by-row ranking. Order of tied travel times
+# depends on the sort, and changes unit rankings and results.
+LOCATION_SORT_KIND = 'quicksort'
+
+
 class Dialysis_units:
     """
-    Class to hold unit information loaded from CSV. 
+    Class to hold unit information loaded from CSV.
     Ranks units by proximity (travel time) and by prescribed order (for COVID +ve
     patients).
-    
+
     Object attributes
     -----------------
-    
+
     location_lookup: dictionary linking subunit (key) to unit postocde (value)
     number_of_units: toal number of subunits
+    travel_time_array: NumPy array of travel times (patient postcode x unit location)
+    travel_time_location_index: dictionary of travel_time_array row for patient postcode
+    travel_time_unit_index: dictionary of travel_time_array column for unit postcode
     travel_times: import of travel times between patient postcode sectors and units
     unit_info: import of unit info csv
     unit_list: list of subunits
     unit_location: list of subunit locations
-    
-    
+    unit_preference_index: NumPy array (patient postcode x rank) of subunit indices (position
+        in unit_list) ordered by proximity to patient postcode
+    unit_preferences: DataFrame of subunit names ordered by proximity to patient postcode
+
+
     Methods
     -------
-    
+
     rank_units_by_travel_time:
-        For each patient location ranks choice of unit by travel time (lowest first). 
-        Stores results in a DataFrame.
-    
+        For each patient location ranks choice of unit by travel time (lowest first).
+        Stores results as an integer preference matrix and a DataFrame.
+
     rank_cov_units_by_entered_order
-    
-    
+
+
     """
-    def __init__(self, env):
-        """Constructor for dialysis unit"""
-        
-        self.unit_info = pd.read_csv('data/units.csv')
-        self.travel_times = pd.read_csv('data/travel_matrix.csv', index_col='from_postcode')
-        self.rank_units_by_travel_time()
-        self.rank_cov_units_by_entered_order()
+    def __init__(self, env, inputs=None, data_folder='data', cache_folder=None):
+        """
+        Constructor for dialysis unit.
+
+        Parameters
+        ----------
+        env : Object
+            Model environment object.
+        inputs : ModelInputs, optional
+            Preloaded model inputs. If given, unit data, travel times and unit rankings are
+            taken from inputs rather than read from CSV and re-ranked. The default is None.
+        data_folder : str, optional
+            Folder to read CSV files from if inputs not given. The default is 'data'.
+        cache_folder : str, optional
+            Folder to cache unit rankings in (keyed on travel matrix and unit locations).
+            The default is None (no caching).
+        """
+
+        if inputs is None:
+            self.unit_info = pd.read_csv(f'{data_folder}/units.csv')
+            self.travel_times = pd.read_csv(
+                f'{data_folder}/travel_matrix.csv', index_col='from_postcode')
+            self.rank_units_by_travel_time(cache_folder)
+            self.rank_cov_units_by_entered_order()
+        else:
+            # Copy unit info (modified by model), share read-only data and rankings
+            self.unit_info = inputs.unit_info.copy()
+            self.travel_times = inputs.travel_times
+            self.unit_preference_index = inputs.unit_preference_index
+            self.unit_preferences = inputs.unit_preferences
+            self.given_order = inputs.given_order
+        # Array of travel times, with row/column lookups (avoids DataFrame lookups)
+        self.travel_time_array = self.travel_times.values
+        self.travel_time_location_index = {
+            location: index for index, location in enumerate(self.travel_times.index)}
+        self.travel_time_unit_index = {
+            location: index for index, location in enumerate(self.travel_times.columns)}
+
         self.unit_list = list(self.unit_info.subunit)
         self.unit_location = list(self.unit_info.Location)
         self.number_of_units = len(self.unit_list)
-        
+
         # Create lookup table for subunit location
-        self.location_lookup = dict(zip(self.unit_list, self.unit_location)) 
-
-        
-    def rank_units_by_travel_time(self):
-        """For each patient location ranks choice of unit by travel time (lowest first). 
-        Stores results in a DataFrame."""
-        
-        # Create dictionaly linking subunit name to location
-        lookup = self.unit_info[['Location', 'subunit']]
-        lookup.set_index('Location', inplace=True)
-                
-        # For each patient location order units by proximity to patient postcode
-        cols = range(lookup.shape[0])
-        self.unit_preferences = pd.DataFrame(columns = cols)    
-        for key, value in self.travel_times.iterrows():
-            # Sort travel times to locations, and lookup subunits in location
-            value.sort_values(inplace=True)
-            value_dict = {x:y for x,y in enumerate(value.index)}
-            location_series = pd.Series(data=value_dict, name=key)
-            subunit_series = lookup.loc[location_series]
-            flat_list = [item for sublist in subunit_series.values for item in sublist]
-            row_to_add = {x:flat_list[x] for x in cols}
-            self.unit_preferences = self.unit_preferences.append(row_to_add, ignore_index=True)
-            
-        self.unit_preferences['patient_location'] = self.travel_times.index
-        self.unit_preferences.set_index('patient_location', inplace=True)
-        
-            
+        self.location_lookup = dict(zip(self.unit_list, self.unit_location))
+
+
+    def rank_units_by_travel_time(self, cache_folder=None):
+        """
+        For each patient location ranks choice of unit by travel time (lowest first).
+        Where there are multiple subunits at one location, they are ranked together in
+        the order listed in unit info. Locations are sorted by travel time for each
+        patient location with the same sort as pandas sort_values (NumPy quicksort, applied
+        row by row), so ties in travel time are ordered as in the original row-by-row ranking.
+        Stores results as an integer preference matrix (unit_preference_index) and a
+        DataFrame of subunit names (unit_preferences).
+
+        Parameters
+        ----------
+        cache_folder : str, optional
+            Folder to cache ranking in (as .npy, keyed on a hash of the travel matrix and
+            subunit locations). The default is None (no caching).
+        """
+
+        subunits = list(self.unit_info['subunit'])
+        travel_matrix = self.travel_times.values
+
+        # Column of travel matrix for each subunit's location
+        column_lookup = {location: i for i, location in enumerate(self.travel_times.columns)}
+        subunit_columns = np.array([column_lookup[location]
+                                    for location in self.unit_info['Location']])
+
+        # Load cached ranking if available
+        cache_path = None
+        if cache_folder is not None:
+            key = hashlib.sha256()
+            key.update(np.ascontiguousarray(travel_matrix).tobytes())
+            key.update(str(travel_matrix.dtype).encode())
+            key.update('|'.join(map(str, self.travel_times.index)).encode())
+            key.update('|'.join(map(str, self.travel_times.columns)).encode())
+            key.update('|'.join(map(str, subunit_columns)).encode())
+            key.update(LOCATION_SORT_KIND.encode())
+            cache_path = os.path.join(
+                cache_folder, f'unit_preferences_{key.hexdigest()[:16]}.npy')
+
+        if cache_path is not None and os.path.exists(cache_path):
+            preference_index = np.load(cache_path)
+        else:
+            # Rank of each location by travel time for each patient location (sorting
+            # each row as Series.sort_values, so tied travel times are ordered the same)
+            location_order = np.argsort(travel_matrix, axis=1, kind=LOCATION_SORT_KIND)
+            location_rank = np.empty_like(location_order)
+            rows = np.arange(travel_matrix.shape[0])[:, np.newaxis]
+            location_rank[rows, location_order] = np.arange(travel_matrix.shape[1])
+
+            # Order subunits by rank of their location (stable sort keeps unit info order
+            # for subunits at the same location)
+            preference_index = np.argsort(location_rank[:, subunit_columns], axis=1,
+                                          kind='stable')
+            if cache_path is not None:
+                os.makedirs(cache_folder, exist_ok=True)
+                np.save(cache_path, preference_index)
+
+        self.unit_preference_index = preference_index
+        self.unit_preferences = pd.DataFrame(
+            np.array(subunits, dtype=object)[preference_index],
+            index=pd.Index(self.travel_times.index, name='patient_location'),
+            columns=range(len(subunits)))
+
+
     def rank_cov_units_by_entered_order(self):
         """
         Filters and sorts units for allocation of COVID+ patients. Order read from CSV.
         """
-        
+
         mask = self.unit_info['Cov +ve order'] > 0
         # Sort only if some units are listed as being preferred
         if mask.sum() > 0:
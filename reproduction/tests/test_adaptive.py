@@ -0,0 +1,53 @@
+'''
+Adaptive replication testing
+
+This module contains tests to confirm that an adaptive number of replications
+gives the same audits as a fixed number of replications, and stops when KPIs
+reach precision or at the maximum number of replications.
+'''
+
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+import sim.sim_replicate as sim
+from sim.inputs import ModelInputs
+from sim.parameters import Scenario
+
+
+def test_adaptive_replications():
+    '''
+    Test adaptive number of replications stops at maximum for a precise
+    target, stops after first batch for a loose target, and gives the same
+    audits as a fixed number of replications
+    '''
+    inputs = ModelInputs.load()
+    scenario = Scenario(run_length=60, proportion_pos_requiring_inpatient=0.6)
+
+    audits, report = sim.adaptive_replications(
+        scenario, relative_precision=0.001, min_reps=3, max_reps=7, batch_size=2,
+        n_jobs=1, base_random_set=2700, inputs=inputs)
+    assert (report['replications'] == 7).all()
+    assert not report['converged'].all()
+    fixed_audits = sim.multiple_replications(scenario, 7, 1, 2700, inputs)
+    for audit, fixed_audit in zip(audits, fixed_audits):
+        pd.testing.assert_frame_equal(audit, fixed_audit)
+
+    audits, report = sim.adaptive_replications(
+        scenario, relative_precision=0.5, min_reps=3, max_reps=7,
+        n_jobs=1, base_random_set=2700, inputs=inputs)
+    assert (report['replications'] == 3).all()
+    assert report['converged'].all()
+
+
+def test_import_without_scipy():
+    '''
+    Test that replication module imports without scipy (only needed for
+    adaptive replications)
+    '''
+    code = ("import sys; sys.modules['scipy'] = None; "
+            "import sim.sim_replicate; import sim.model")
+    subprocess.run([sys.executable, '-c', code], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
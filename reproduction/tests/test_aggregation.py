@@ -0,0 +1,82 @@
+'''
+Aggregation testing
+
+This module contains tests to confirm that online summaries of replications
+(ReplicationSummary) match summaries of all replications (EndTrialAnalysis),
+and that quantile sketches remain accurate when merged.
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sim.sim_replicate as sim
+from sim.aggregation import QuantileSketch, ReplicationSummary
+from sim.end_trial_analysis import EndTrialAnalysis
+from sim.inputs import ModelInputs
+from sim.output import tidy_audit
+from sim.parameters import Scenario
+
+
+def test_summary_matches_analysis():
+    '''
+    Test that online summary (merged from chunks of replications) gives the
+    same median, minimum and maximum as EndTrialAnalysis, and the same mean
+    and standard deviation as pandas
+    '''
+    inputs = ModelInputs.load()
+    scenario = Scenario(run_length=60, proportion_pos_requiring_inpatient=0.6)
+    audits = sim.multiple_replications(scenario, 5, 1, 2700, inputs)
+    analysis = EndTrialAnalysis('test', *[tidy_audit('test', audit) for audit in audits])
+
+    summary = ReplicationSummary()
+    sim.multiple_replications(scenario, 5, 1, 2700, inputs, chunk_size=2, summary=summary)
+    assert summary.replications == set(range(5))
+
+    pivots = {'patient': analysis.p_audit_pivot, 'unit': analysis.u_audit_pivot,
+              'displaced': analysis.d_audit_pivot, 'inpatient': analysis.i_audit_pivot}
+    for audit_name, pivot in pivots.items():
+        audit_summary = summary.summary(audit_name)
+        for statistic in ['median', 'amin', 'amax']:
+            pd.testing.assert_frame_equal(
+                audit_summary[statistic], pivot[statistic][audit_summary[statistic].columns])
+
+    patient_summary = summary.summary('patient')
+    metrics = patient_summary['mean'].columns
+    by_day = audits[0].groupby(level=1)[metrics]
+    assert np.allclose(patient_summary['mean'].values, by_day.mean().values)
+    assert np.allclose(patient_summary['std'].values, by_day.std().values)
+
+
+def test_merged_sketch_accuracy():
+    '''
+    Test that quantiles from merged sketches are within 3% (in rank) of exact
+    quantiles once sketches have been compacted, and exact before
+    '''
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=(5000, 20))
+
+    sketches = [QuantileSketch((20,), capacity=64) for i in range(4)]
+    for i, row in enumerate(values):
+        sketches[i % 4].add(row)
+    merged = QuantileSketch((20,), capacity=64)
+    for sketch in sketches:
+        merged.merge(sketch)
+    assert merged.count == 5000
+
+    for q in [0.05, 0.5, 0.95]:
+        rank = (values < merged.quantile(q)).mean(axis=0)
+        assert np.abs(rank - q).max() < 0.03
+
+    small = QuantileSketch((20,), capacity=64)
+    for row in values[:50]:
+        small.add(row)
+    assert np.array_equal(small.quantile(0.5), np.quantile(values[:50], 0.5, axis=0))
+
+
+def test_empty_sketch_quantile():
+    '''
+    Test that quantile of an empty sketch raises ValueError
+    '''
+    with pytest.raises(ValueError):
+        QuantileSketch((20,)).quantile(0.5)
@@ -0,0 +1,112 @@
+'''
+Allocation testing
+
+This module contains tests to confirm that allocating patients together
+(sharing search cursors between patients with the same search order) gives
+the same allocation as allocating patients one at a time, when loading
+patients and when re-allocating all patients during a run.
+'''
+
+import numpy as np
+import pytest
+
+from sim.allocation import AllocatePatients
+from sim.inputs import ModelInputs
+from sim.model import DialysisSim
+from sim.parameters import Scenario
+
+
+PATIENT_ATTRIBUTES = ['current_unit', 'current_unit_location', 'session',
+                      'displaced', 'displaced_additional_time',
+                      'current_travel_time', 'unallocated_to_session']
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    return ModelInputs.load()
+
+
+def allocate_one_at_a_time(self, patients):
+    '''
+    Allocate patients by calling allocate_patient for each patient
+    '''
+    for patient in patients:
+        self.allocate_patient(patient)
+
+
+def allocation_state(model):
+    '''
+    Return session allocation (by patient ID), session counts and patient
+    allocation attributes of model
+    '''
+    allocate = model.allocate
+    session_patients = [[[patient.patient_id for patient in patients]
+                         for patients in unit_sessions]
+                        for unit_sessions in allocate.session_patients]
+    patient_session = {patient.patient_id: session
+                       for patient, session in allocate.patient_session.items()}
+    patients = [[getattr(patient, name) for name in PATIENT_ATTRIBUTES]
+                for patient in model.pop.patients.values()]
+    displaced = [patient.patient_id for patient in model.pop.displaced_patients]
+    unallocated = [patient.patient_id for patient in model.pop.unallocated_patients]
+    return (session_patients, patient_session, allocate.session_count.copy(),
+            patients, displaced, unallocated)
+
+
+def assert_same_allocation(state, expected):
+    '''
+    Assert two allocation states (from allocation_state) are the same
+    '''
+    for state_item, expected_item in zip(state, expected):
+        if isinstance(expected_item, np.ndarray):
+            assert np.array_equal(state_item, expected_item)
+        else:
+            assert state_item == expected_item
+
+
+@pytest.mark.parametrize('random_number_set, kwargs', [
+    (2700, dict()),
+    (2701, dict(random_positive_rate_at_start=0.2)),
+    (2702, dict(random_positive_rate_at_start=0.5)),
+    (2703, dict(random_positive_rate_at_start=0.3, drop_to_two_sessions=True,
+                prop_patients_drop_to_two_sessions=0.9))])
+def test_load_matches_allocate_patient(random_number_set, kwargs, inputs, monkeypatch):
+    '''
+    Test that loading patients with allocate_many gives the same allocation as
+    calling allocate_patient for each patient in turn (including displaced
+    patients)
+    '''
+    def set_up_allocation():
+        '''Set up model and return allocation state'''
+        scenario = Scenario(**kwargs)
+        scenario.set_random_no_set(random_number_set)
+        return allocation_state(DialysisSim(scenario, inputs))
+
+    many = set_up_allocation()
+    monkeypatch.setattr(AllocatePatients, 'allocate_many', allocate_one_at_a_time)
+    assert_same_allocation(many, set_up_allocation())
+
+
+@pytest.mark.parametrize('random_number_set, kwargs', [
+    (2700, dict(run_length=80, proportion_pos_requiring_inpatient=0.6)),
+    (2701, dict(run_length=60, total_proportion_people_infected=1.0,
+                proportion_pos_requiring_inpatient=0.0))])
+def test_rebuild_matches_allocate_patient(random_number_set, kwargs, inputs, monkeypatch):
+    '''
+    Test that re-allocating all patients part way through a run with
+    allocate_many gives the same allocation as calling allocate_patient for
+    each patient in turn. Runs include free capacity increasing during
+    re-allocation (which resets search cursors).
+    '''
+    def rebuild_allocation():
+        '''Run model, re-allocate all patients and return allocation state'''
+        scenario = Scenario(**kwargs)
+        scenario.set_random_no_set(random_number_set)
+        model = DialysisSim(scenario, inputs)
+        model.run()
+        model.rebuild_allocation()
+        return allocation_state(model)
+
+    many = rebuild_allocation()
+    monkeypatch.setattr(AllocatePatients, 'allocate_many', allocate_one_at_a_time)
+    assert_same_allocation(many, rebuild_allocation())
@@ -0,0 +1,114 @@
+'''
+Optimal reallocation testing
+
+This module contains tests to confirm that the min-cost transportation
+solver finds minimum cost assignments (compared with a linear assignment
+solver), and that optimal reallocation keeps session allocation consistent.
+'''
+
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+
+from sim.allocation import SESSION_STATUS
+from sim.assignment import solve_transportation
+from sim.inputs import ModelInputs
+from sim.model import DialysisSim
+from sim.parameters import Scenario
+
+
+def assignment_cost(supply, capacity, cost):
+    '''
+    Number of units assigned and minimum cost of assigning as many units of
+    supply as possible, from a linear assignment of each unit of supply to a
+    unit of capacity (infeasible pairs given a cost higher than any
+    assignment, so that the number of units assigned is maximised first)
+    '''
+    big_cost = 1e6
+    rows = np.repeat(np.arange(len(supply)), supply)
+    columns = np.repeat(np.arange(len(capacity)), capacity)
+    if len(rows) == 0 or len(columns) == 0:
+        return 0, 0.0
+    unit_cost = cost[rows][:, columns]
+    unit_cost = np.where(np.isinf(unit_cost), big_cost, unit_cost)
+    row_index, column_index = linear_sum_assignment(unit_cost)
+    assigned = unit_cost[row_index, column_index] < big_cost
+
+    return assigned.sum(), unit_cost[row_index, column_index][assigned].sum()
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_solver_matches_linear_assignment(seed):
+    '''
+    Test solver assigns as many units of supply as possible at minimum cost,
+    within supply and capacity, and only to feasible sinks. Instances include
+    total supply above and below total capacity, and groups with no feasible
+    sink.
+    '''
+    rng = np.random.default_rng(seed)
+    groups, sinks = rng.integers(1, 6), rng.integers(1, 5)
+    supply = rng.integers(0, 5, size=groups)
+    capacity = rng.integers(0, 6, size=sinks)
+    cost = rng.integers(0, 10, size=(groups, sinks)).astype(float)
+    cost[rng.random((groups, sinks)) < 0.25] = np.inf
+    if seed % 4 == 0:
+        cost[0] = np.inf
+
+    flow = solve_transportation(supply, capacity, cost)
+
+    assert (flow >= 0).all()
+    assert (flow.sum(axis=1) <= supply).all()
+    assert (flow.sum(axis=0) <= capacity).all()
+    assert (flow[np.isinf(cost)] == 0).all()
+    expected_assigned, expected_cost = assignment_cost(supply, capacity, cost)
+    assert flow.sum() == expected_assigned
+    assert np.isclose((flow * np.where(flow > 0, cost, 0)).sum(), expected_cost)
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(proportion_pos_requiring_inpatient=0.6),
+    dict(proportion_pos_requiring_inpatient=0.6, mortality=1.0)])
+def test_optimal_reallocation_consistent(kwargs):
+    '''
+    Test that with optimal reallocation, during runs with displaced patients,
+    no patient is allocated to more than one session, and the free-capacity
+    index matches session states and counts. Session counts are checked
+    against session membership when no patients recover: opening a COVID +ve
+    session clears only COVID -ve patients from it (as the original model),
+    so recovered patients may stay in a session that no longer counts them.
+    '''
+    scenario = Scenario(run_length=150, reallocation_mode='optimal', **kwargs)
+    scenario.set_random_no_set(2700)
+    model = DialysisSim(scenario, ModelInputs.load())
+    allocate = model.allocate
+    check_counts = scenario.mortality == 1.0
+
+    def check_allocation():
+        '''Check session membership, counts and free-capacity index each day'''
+        while True:
+            allocated = [patient
+                         for unit_sessions in allocate.session_patients
+                         for patients in unit_sessions for patient in patients]
+            assert len(allocated) == len(set(allocated)) == len(allocate.patient_session)
+            for patient, (unit_index, session_index) in allocate.patient_session.items():
+                assert patient in allocate.session_patients[unit_index][session_index]
+            if check_counts:
+                assert len(model.pop.recovered_patients) == 0
+                counts = np.array([[len(patients) for patients in unit_sessions]
+                                   for unit_sessions in allocate.session_patients])
+                assert np.array_equal(allocate.session_count, counts)
+
+            has_free_chair = allocate.session_count < allocate.chairs[:, np.newaxis]
+            for code in range(len(SESSION_STATUS)):
+                free = has_free_chair & (allocate.session_status == code)
+                assert np.array_equal(allocate.free_session_count[code], free.sum(axis=0))
+                assert np.array_equal(allocate.unit_free_session_count[code],
+                                      free.sum(axis=1))
+            yield model._env.timeout(1)
+
+    model._env.process(check_allocation())
+    model.run()
+
+    assert len(model.optimisation_results) > 0
+    for result in model.optimisation_results:
+        assert result['optimised_displaced'] <= result['greedy_displaced']
@@ -0,0 +1,48 @@
+'''
+Chunked replication testing
+
+This module contains tests to confirm that running replications in chunks
+(several replications per task, returned as packed columnar results) gives
+the same audits as running one replication per task.
+'''
+
+import pytest
+import pandas as pd
+
+import sim.sim_replicate as sim
+from sim.inputs import ModelInputs
+from sim.parameters import Scenario
+
+
+N_REPS = 5
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    return ModelInputs.load()
+
+
+@pytest.fixture(scope='module')
+def scenario():
+    return Scenario(run_length=60, proportion_pos_requiring_inpatient=0.6)
+
+
+@pytest.fixture(scope='module')
+def audits(scenario, inputs):
+    return sim.multiple_replications(scenario, N_REPS, 1, 2700, inputs)
+
+
+@pytest.mark.parametrize('n_jobs, chunk_size', [
+    (1, 1), (1, 2), (1, 3), (1, N_REPS), (2, 2), (2, 'auto')])
+def test_chunked_matches_per_replication(n_jobs, chunk_size, scenario, inputs, audits):
+    '''
+    Test that replications run in chunks (including chunk sizes that do not
+    divide the number of replications, and in worker processes) give the same
+    audits as one replication per task
+    '''
+    chunked_audits = sim.multiple_replications(
+        scenario, N_REPS, n_jobs, 2700, inputs, chunk_size=chunk_size)
+
+    assert len(chunked_audits) == len(audits)
+    for audit, chunked_audit in zip(audits, chunked_audits):
+        pd.testing.assert_frame_equal(audit, chunked_audit)
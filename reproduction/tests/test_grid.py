@@ -0,0 +1,88 @@
+'''
+Scenario grid testing
+
+This module contains tests to confirm that parameter sweeps generate a
+scenario for each combination of values, and that running scenarios from one
+work queue (in one process or a pool of workers) saves the same outputs as
+running scenarios one at a time, with model input data sent to each worker
+once.
+'''
+
+import numpy as np
+from joblib import Parallel, delayed
+
+import sim.sim_replicate as sim
+from sim.inputs import ModelInputs
+
+
+def test_scenario_grid():
+    '''
+    Test scenario grid has a scenario for each combination of swept values,
+    with other parameters the same for all scenarios
+    '''
+    scenarios = sim.scenario_grid(
+        {'total_proportion_people_infected': [0.6, 0.8],
+         'mortality': np.linspace(0.1, 0.2, 3)}, run_length=40)
+    assert len(scenarios) == 6
+    scenario = scenarios['total_proportion_people_infected_0.8_mortality_0.15']
+    assert scenario.total_proportion_people_infected == 0.8
+    assert np.isclose(scenario.mortality, 0.15)
+    assert all(scenario.run_length == 40 for scenario in scenarios.values())
+
+
+def test_grid_matches_replications(tmp_path):
+    '''
+    Test that scenarios run from one work queue save the same CSV files as
+    run_replications
+    '''
+    inputs = ModelInputs.load()
+    scenarios = sim.scenario_grid(
+        {'total_proportion_people_infected': [0.6, 0.8]},
+        run_length=40, proportion_pos_requiring_inpatient=0.6)
+    sim.run_replications(scenarios, 3, 2700, str(tmp_path), plot=False, inputs=inputs)
+
+    for n_jobs, chunk_size in [(1, 2), (2, 'auto')]:
+        folder = tmp_path / f'grid_{n_jobs}'
+        folder.mkdir()
+        sim.run_scenario_grid(scenarios, 3, 2700, str(folder), inputs=inputs,
+                              n_jobs=n_jobs, chunk_size=chunk_size)
+        for name in scenarios:
+            for audit_name in ['patient', 'unit', 'displaced', 'inpatient']:
+                file_name = f'{name}_reps_3_{audit_name}_audit.csv'
+                assert (folder / file_name).read_text() == (tmp_path / file_name).read_text()
+
+
+def test_inputs_sent_once_per_worker(monkeypatch):
+    '''
+    Test that model input data is pickled once for each worker process, not
+    for each chunk of replications
+    '''
+    pickled = []
+
+    def reduce_ex(self, protocol):
+        pickled.append(self)
+        return object.__reduce_ex__(self, protocol)
+
+    monkeypatch.setattr(ModelInputs, '__reduce_ex__', reduce_ex)
+    inputs = ModelInputs.load()
+    scenarios = sim.scenario_grid(
+        {'total_proportion_people_infected': [0.6, 0.8]}, run_length=20)
+    tasks = [(name, range(i, i + 1)) for name in scenarios for i in range(4)]
+
+    results = list(sim.iter_completed_chunks(scenarios, tasks, 2700, inputs, n_jobs=2))
+
+    assert (sorted((name, chunk.start) for (name, chunk), result in results) ==
+            sorted((name, chunk.start) for name, chunk in tasks))
+    assert 0 < len(pickled) <= 2
+
+
+def test_joblib_after_grid():
+    '''
+    Test that joblib can run tasks in worker processes after scenarios are run
+    from one work queue (which uses its own pool of workers)
+    '''
+    inputs = ModelInputs.load()
+    scenarios = sim.scenario_grid({'mortality': [0.1, 0.2]}, run_length=5)
+    tasks = [(name, range(0, 1)) for name in scenarios]
+    assert len(list(sim.iter_completed_chunks(scenarios, tasks, 2700, inputs, n_jobs=2))) == 2
+    assert Parallel(n_jobs=2)(delayed(abs)(-i) for i in range(3)) == [0, 1, 2]
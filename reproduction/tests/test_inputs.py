@@ -0,0 +1,73 @@
+'''
+Model input testing
+
+This module contains tests to confirm that model input data backed by
+memory-mapped files is shared with worker processes (pickled as file paths),
+and gives the same results as input data held in memory.
+'''
+
+import gc
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+import sim.sim_replicate as sim
+from sim.inputs import ModelInputs
+from sim.parameters import Scenario
+
+
+def travel_matrix_file(inputs):
+    '''
+    Return whether travel matrix is memory-mapped, and its file
+    '''
+    return isinstance(inputs.travel_matrix, np.memmap), inputs.travel_matrix.filename
+
+
+def test_memmap_pickled_as_paths():
+    '''
+    Test that memory-mapped inputs are pickled as file paths, and unpickle (in
+    this process and in worker processes) to arrays mapped from the same files
+    '''
+    inputs = ModelInputs.load()
+    shared = inputs.to_memmap()
+    assert (len(pickle.dumps(shared)) <
+            len(pickle.dumps(inputs)) - inputs.travel_matrix.nbytes)
+
+    unpickled = pickle.loads(pickle.dumps(shared))
+    for name in ['travel_matrix', 'unit_preference_index']:
+        assert isinstance(getattr(unpickled, name), np.memmap)
+        assert np.array_equal(getattr(unpickled, name), getattr(inputs, name))
+        assert not getattr(unpickled, name).flags.writeable
+
+    expected = (True, shared.travel_matrix.filename)
+    assert Parallel(n_jobs=2)(delayed(travel_matrix_file)(shared)
+                              for i in range(2)) == [expected, expected]
+
+
+def test_temporary_memmap_removed():
+    '''
+    Test that a temporary folder of memory-mapped inputs is removed when the
+    inputs are garbage collected
+    '''
+    shared = ModelInputs.load().to_memmap()
+    folder = os.path.dirname(shared.travel_matrix.filename)
+    assert os.path.isdir(folder)
+    del shared
+    gc.collect()
+    assert not os.path.exists(folder)
+
+
+def test_memmap_matches_memory():
+    '''
+    Test that a run with memory-mapped inputs gives the same audits as with
+    inputs held in memory
+    '''
+    inputs = ModelInputs.load()
+    scenario = Scenario(run_length=60, proportion_pos_requiring_inpatient=0.6)
+    audits = sim.single_run(scenario, 0, 2700, inputs)
+    shared_audits = sim.single_run(scenario, 0, 2700, inputs.to_memmap())
+    for audit, shared_audit in zip(audits, shared_audits):
+        pd.testing.assert_frame_equal(audit, shared_audit)
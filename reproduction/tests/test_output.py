@@ -0,0 +1,181 @@
+'''
+Output format testing
+
+This module contains tests to confirm that audits saved in binary formats
+load to the same tables, and give the same analysis, as audits saved as CSV,
+and that replications streamed to a store give the same results (saved one
+replication at a time).
+'''
+
+import gc
+import weakref
+
+import numpy as np
+import pytest
+import pandas as pd
+
+import sim.sim_replicate as sim
+from sim.aggregation import ReplicationSummary
+from sim.end_trial_analysis import EndTrialAnalysis
+from sim.output import (ReplicationStore, load_audits, replication_audits,
+                        save_store_audits)
+from sim.parameters import Scenario
+
+
+@pytest.fixture(scope='module')
+def output_folder(tmp_path_factory):
+    '''
+    Run replications and save audits as CSV and .npz
+    '''
+    folder = tmp_path_factory.mktemp('output')
+    scenarios = {'short': Scenario(run_length=40, proportion_pos_requiring_inpatient=0.6)}
+    sim.run_replications(scenarios, 3, 2700, str(folder), plot=False,
+                         output_format=['csv', 'npz'])
+    return folder
+
+
+def check_matches_csv(output_folder, output_format):
+    '''
+    Check audits and analysis from binary format match those from CSV
+    '''
+    path_stem = f'{output_folder}/short_reps_3'
+    for audit, csv_audit in zip(load_audits('short', path_stem, output_format),
+                                load_audits('short', path_stem, 'csv')):
+        pd.testing.assert_frame_equal(audit, csv_audit, check_dtype=False)
+
+    analysis = EndTrialAnalysis.from_files('short', path_stem, output_format)
+    csv_analysis = EndTrialAnalysis.from_files('short', path_stem, 'csv')
+    for pivot in ['d_audit_pivot', 'p_audit_pivot', 'u_audit_pivot', 'i_audit_pivot']:
+        pd.testing.assert_frame_equal(
+            getattr(analysis, pivot), getattr(csv_analysis, pivot))
+
+
+def test_npz_matches_csv(output_folder):
+    '''
+    Test that audits saved as .npz match audits saved as CSV
+    '''
+    check_matches_csv(output_folder, 'npz')
+
+
+def test_parquet_matches_csv(output_folder):
+    '''
+    Test that audits saved as Parquet match audits saved as CSV
+    '''
+    pytest.importorskip('pyarrow')
+    sim.run_replications(
+        {'short': Scenario(run_length=40, proportion_pos_requiring_inpatient=0.6)},
+        3, 2700, str(output_folder), plot=False, output_format='parquet')
+    check_matches_csv(output_folder, 'parquet')
+
+
+def test_unknown_output_format(tmp_path):
+    '''
+    Test that an unknown output format is rejected before running
+    '''
+    with pytest.raises(ValueError):
+        sim.run_replications({'short': Scenario(run_length=10)}, 1, 0, str(tmp_path),
+                             plot=False, output_format='xlsx')
+
+
+def check_matches_output_folder(output_folder, folder):
+    '''
+    Check CSV and .npz files in folder match those in output folder
+    '''
+    for audit_name in ['patient', 'unit', 'displaced', 'inpatient']:
+        file_name = f'short_reps_3_{audit_name}_audit.csv'
+        assert (folder / file_name).read_text() == (output_folder / file_name).read_text()
+    for audit, expected_audit in zip(load_audits('short', f'{folder}/short_reps_3', 'npz'),
+                                     load_audits('short', f'{output_folder}/short_reps_3',
+                                                 'npz')):
+        pd.testing.assert_frame_equal(audit, expected_audit)
+
+
+class ListStore:
+    '''
+    Store of replication audits held in a list (replication number is
+    position in list)
+    '''
+    def __init__(self, replications):
+        self.replications = replications
+
+    def iter_replications(self):
+        return enumerate(self.replications)
+
+
+@pytest.mark.parametrize('column_values', [
+    [[1.0, 2.0], [0.5, 1.5]],
+    [[0.5, 1.5], [1.0, 2.0], [3.0, np.nan]],
+    [[1, 2], [0.5, 1.0]],
+    [[1, 2], [3, 4]],
+    [[np.nan, np.nan], [1.0, 2.0]],
+    [[np.nan, 2.0], [0.25, np.nan]],
+    [['a', 'b'], ['c', np.nan]]])
+def test_store_csv_dtypes(column_values, tmp_path):
+    '''
+    Test that CSV columns saved from a store one replication at a time have
+    the same data types (and text) as saving all replications at once, where
+    replications have different data types (e.g. whole number and fractional
+    floats, integers, missing values)
+    '''
+    replications = [
+        tuple(pd.DataFrame({'day': range(len(values)), 'value': values})
+              for audit_name in range(4))
+        for values in column_values]
+    audits = [pd.concat([replication_audits(rep, rep_audits)[k]
+                         for rep, rep_audits in enumerate(replications)])
+              for k in range(4)]
+    sim.save_scenario_outputs('mix', audits, f'{tmp_path}/expected', ['csv'], plot=False)
+    save_store_audits('mix', ListStore(replications), f'{tmp_path}/store', ['csv'])
+
+    for audit_name in ['patient', 'unit', 'displaced', 'inpatient']:
+        file_name = f'{audit_name}_audit.csv'
+        assert ((tmp_path / f'store_{file_name}').read_text() ==
+                (tmp_path / f'expected_{file_name}').read_text())
+
+
+def test_store_matches_csv(output_folder, tmp_path):
+    '''
+    Test that streaming replications to a store gives the same CSV and .npz
+    files as returning replications from workers
+    '''
+    sim.run_replications(
+        {'short': Scenario(run_length=40, proportion_pos_requiring_inpatient=0.6)},
+        3, 2700, str(tmp_path), plot=False, output_format=['csv', 'npz'],
+        store_folder=str(tmp_path / 'store'))
+    check_matches_output_folder(output_folder, tmp_path)
+
+
+def test_store_outputs_one_replication_at_a_time(output_folder, tmp_path, monkeypatch):
+    '''
+    Test that outputs and summary analysis are made from a store holding only
+    one replication in memory at a time, and match outputs and analysis of
+    all replications
+    '''
+    store = ReplicationStore(str(tmp_path / 'store'))
+    sim.multiple_replications(Scenario(run_length=40, proportion_pos_requiring_inpatient=0.6),
+                              3, 1, 2700, store=store)
+
+    # Check no previously loaded replication is still held when loading another
+    loaded = []
+    load_replication = ReplicationStore.load_replication
+
+    def load_one_replication(self, rep):
+        gc.collect()
+        assert all(reference() is None for reference in loaded)
+        audits = load_replication(self, rep)
+        loaded.extend(weakref.ref(audit) for audit in audits)
+        return audits
+
+    monkeypatch.setattr(ReplicationStore, 'load_replication', load_one_replication)
+    monkeypatch.setattr(ReplicationStore, 'load', None)
+
+    summary = ReplicationSummary()
+    save_store_audits('short', store, f'{tmp_path}/short_reps_3', ['csv', 'npz'], summary)
+    assert len(loaded) == 2 * 3 * 4
+    check_matches_output_folder(output_folder, tmp_path)
+
+    analysis = EndTrialAnalysis.from_summary('short', summary)
+    expected = EndTrialAnalysis.from_files('short', f'{output_folder}/short_reps_3')
+    for pivot in ['d_audit_pivot', 'p_audit_pivot', 'u_audit_pivot', 'i_audit_pivot']:
+        pd.testing.assert_frame_equal(getattr(analysis, pivot), getattr(expected, pivot))
+    assert sorted(analysis.unit_names) == sorted(expected.unit_names)
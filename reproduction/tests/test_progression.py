@@ -0,0 +1,56 @@
+'''
+Progression engine testing
+
+This module contains tests to confirm that the event calendar progression
+engine gives the same results as one SimPy process per patient.
+'''
+
+import random
+
+import pytest
+import pandas as pd
+
+import sim.sim_replicate as sim
+from sim.inputs import ModelInputs
+from sim.parameters import Scenario
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    return ModelInputs.load()
+
+
+def run_with_engine(engine, random_number_set, inputs, **kwargs):
+    '''
+    Run model with given progression engine and return audits
+    '''
+    # Seed random positives at start (drawn from global random module)
+    random.seed(random_number_set)
+    scenario = Scenario(progression_engine=engine, **kwargs)
+    return sim.single_run(scenario, 0, random_number_set, inputs)
+
+
+@pytest.mark.parametrize('random_number_set, kwargs', [
+    (2700, dict(run_length=150, proportion_pos_requiring_inpatient=0.6)),
+    (2701, dict(run_length=120, random_positive_rate_at_start=0.05,
+                drop_to_two_sessions=True,
+                prop_patients_drop_to_two_sessions=0.9)),
+    (2702, dict(run_length=120, open_all_sessions=True, mortality=0.5))])
+def test_calendar_matches_process(random_number_set, kwargs, inputs):
+    '''
+    Test that event calendar progression gives the same audits as one SimPy
+    process per patient
+    '''
+    process_audits = run_with_engine('process', random_number_set, inputs, **kwargs)
+    calendar_audits = run_with_engine('calendar', random_number_set, inputs, **kwargs)
+
+    for process_audit, calendar_audit in zip(process_audits, calendar_audits):
+        pd.testing.assert_frame_equal(process_audit, calendar_audit)
+
+
+def test_unknown_engine(inputs):
+    '''
+    Test that an unknown progression engine is rejected
+    '''
+    with pytest.raises(ValueError):
+        run_with_engine('unknown', 2700, inputs, run_length=10)
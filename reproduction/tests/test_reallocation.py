@@ -0,0 +1,190 @@
+'''
+Reallocation testing
+
+This module contains tests to confirm that checking for unallocated and
+displaced patients only when they occur (event trigger) gives the same
+results as checking every day/week (periodic trigger), and that incremental
+weekly reallocation keeps every patient allocated or listed as unallocated,
+with results close to full reallocation.
+'''
+
+import numpy as np
+import pytest
+import pandas as pd
+
+import sim.sim_replicate as sim
+from sim.inputs import ModelInputs
+from sim.model import DialysisSim
+from sim.parameters import Scenario
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    return ModelInputs.load()
+
+
+def run_with_options(random_number_set, inputs, **kwargs):
+    '''
+    Run model with given scenario options and return audits
+    '''
+    scenario = Scenario(**kwargs)
+    return sim.single_run(scenario, 0, random_number_set, inputs)
+
+
+@pytest.mark.parametrize('random_number_set, kwargs', [
+    (2700, dict(run_length=150, proportion_pos_requiring_inpatient=0.6)),
+    (2701, dict(run_length=150, total_proportion_people_infected=1.0,
+                proportion_pos_requiring_inpatient=0.0,
+                random_positive_rate_at_start=0.5)),
+    (2702, dict(run_length=120, random_positive_rate_at_start=0.05,
+                drop_to_two_sessions=True,
+                prop_patients_drop_to_two_sessions=0.9)),
+    (2703, dict(run_length=120, open_all_sessions=True, mortality=0.5))])
+def test_event_trigger_matches_periodic(random_number_set, kwargs, inputs):
+    '''
+    Test that event triggered checks for unallocated and displaced patients
+    give the same audits as periodic checks (scenarios include unallocated
+    and displaced patients)
+    '''
+    periodic_audits = run_with_options(
+        random_number_set, inputs, reallocation_trigger='periodic', **kwargs)
+    event_audits = run_with_options(
+        random_number_set, inputs, reallocation_trigger='event', **kwargs)
+
+    for periodic_audit, event_audit in zip(periodic_audits, event_audits):
+        pd.testing.assert_frame_equal(periodic_audit, event_audit)
+
+
+# Tolerances for incremental reallocation compared with full reallocation: mean
+# displaced patients per day (relative), and mean unallocated patients per day
+# (as a proportion of all patients)
+DISPLACED_TOLERANCE = 0.1
+UNALLOCATED_TOLERANCE = 0.01
+
+
+def allocation_counts(allocate):
+    '''
+    Number of patients in each session (from session membership)
+    '''
+    return np.array([[len(patients) for patients in unit_sessions]
+                     for unit_sessions in allocate.session_patients])
+
+
+def check_no_patients_lost(model):
+    '''
+    Check every outpatient (COVID -ve, +ve or recovered) is in the session they
+    are allocated to, or in the list of unallocated patients
+    '''
+    allocate = model.allocate
+    for patient in model.pop.patients.values():
+        if patient.status not in ['negative', 'positive', 'recovered']:
+            continue
+        if patient.unallocated_to_session:
+            assert patient in model.pop.unallocated_patients
+        elif patient.current_unit != 'HOME':
+            unit_index, session_index = allocate.patient_session[patient]
+            assert patient in allocate.session_patients[unit_index][session_index]
+
+
+def run_model(mode, random_number_set, inputs, **kwargs):
+    '''
+    Run model with given reallocation mode, checking no patients are lost after
+    each weekly reallocation, and return model
+    '''
+    scenario = Scenario(reallocation_mode=mode, **kwargs)
+    scenario.set_random_no_set(random_number_set)
+    model = DialysisSim(scenario, inputs)
+    reallocate = {'full': model.rebuild_allocation,
+                  'incremental': model.reallocate_displaced_patients}[mode]
+
+    def reallocate_and_check():
+        '''Reallocate patients and check no patients lost'''
+        reallocate()
+        check_no_patients_lost(model)
+
+    setattr(model, reallocate.__name__, reallocate_and_check)
+    model.run()
+    return model
+
+
+@pytest.mark.parametrize('random_number_set, kwargs', [
+    (2700, dict(run_length=150, proportion_pos_requiring_inpatient=0.6)),
+    (2701, dict(run_length=150, total_proportion_people_infected=1.0,
+                proportion_pos_requiring_inpatient=0.0,
+                random_positive_rate_at_start=0.5)),
+    (2702, dict(run_length=150, proportion_pos_requiring_inpatient=0.6,
+                mortality=1.0))])
+def test_incremental_matches_full(random_number_set, kwargs, inputs):
+    '''
+    Test that in capacity-stressed runs (one with unallocated patients)
+    incremental reallocation loses no patients, gives the same patient COVID
+    status and inpatient audits as full reallocation, and mean displaced and
+    unallocated patients per day within tolerance of full reallocation.
+    Session counts are checked against session membership after the run when
+    no patients recover: opening a COVID +ve session clears only COVID -ve
+    patients from it (as the original model), so recovered patients may stay
+    in a session that no longer counts them.
+    '''
+    full = run_model('full', random_number_set, inputs, **kwargs).audit
+    model = run_model('incremental', random_number_set, inputs, **kwargs)
+    audit = model.audit
+
+    pd.testing.assert_frame_equal(full.patient_audit.drop('unallocated', axis=1),
+                                  audit.patient_audit.drop('unallocated', axis=1))
+    pd.testing.assert_frame_equal(full.inpatient_audit, audit.inpatient_audit)
+    assert 0 < audit.displaced_audit['number'].mean() <= (
+        full.displaced_audit['number'].mean() * (1 + DISPLACED_TOLERANCE))
+    assert audit.patient_audit['unallocated'].mean() <= (
+        full.patient_audit['unallocated'].mean() +
+        len(model.pop.patients) * UNALLOCATED_TOLERANCE)
+    if model._params.mortality == 1.0:
+        assert len(model.pop.recovered_patients) == 0
+        assert np.array_equal(model.allocate.session_count,
+                              allocation_counts(model.allocate))
+
+
+def test_incremental_removes_allocated_from_unallocated(inputs):
+    '''
+    Test that unallocated patients allocated to sessions by incremental
+    reallocation are removed from the list of unallocated patients (so they
+    are not allocated again, which would leave session counts too high)
+    '''
+    scenario = Scenario(reallocation_mode='incremental')
+    scenario.set_random_no_set(2700)
+    model = DialysisSim(scenario, inputs)
+
+    # Make patients unallocated (freeing their chairs)
+    patients = [patient for patient in model.pop.negative_patients
+                if patient.current_unit != 'HOME'][:5]
+    for patient in patients:
+        model.allocate.remove_patient(patient)
+        model.pop.negative_patients.append(patient)
+        patient.current_unit = 'none'
+        patient.session = 'none'
+        patient.unallocated_to_session = True
+        model.pop.unallocated_patients.append(patient)
+
+    model.reallocate_displaced_patients()
+    assert not any(patient.unallocated_to_session for patient in patients)
+    assert len(model.pop.unallocated_patients) == 0
+
+    # Daily check for unallocated patients (first day)
+    next(model.check_sessions_for_unallocated_patients())
+    check_no_patients_lost(model)
+    assert np.array_equal(model.allocate.session_count, allocation_counts(model.allocate))
+
+
+def test_unknown_mode(inputs):
+    '''
+    Test that an unknown reallocation mode is rejected
+    '''
+    with pytest.raises(ValueError):
+        run_with_options(2700, inputs, run_length=10, reallocation_mode='unknown')
+
+
+def test_unknown_trigger(inputs):
+    '''
+    Test that an unknown reallocation trigger is rejected
+    '''
+    with pytest.raises(ValueError):
+        run_with_options(2700, inputs, run_length=10, reallocation_trigger='unknown')
@@ -0,0 +1,58 @@
+'''
+Model reset testing
+
+This module contains tests to confirm that a model reset for a new random
+number set gives the same results as a new model.
+'''
+
+import random
+
+import pandas as pd
+
+from sim.inputs import ModelInputs
+from sim.model import DialysisSim
+from sim.parameters import Scenario
+
+
+def get_audits(model):
+    '''
+    Return audits from model run
+    '''
+    return (model.audit.patient_audit, model.audit.unit_audit,
+            model.audit.displaced_audit, model.audit.inpatient_audit)
+
+
+def test_reset_matches_new_model():
+    '''
+    Test that a model reset (after a run with another random number set) gives
+    the same audits as a new model, and that audits from the first run are kept
+    '''
+    inputs = ModelInputs.load()
+    kwargs = dict(run_length=120, proportion_pos_requiring_inpatient=0.6,
+                  random_positive_rate_at_start=0.05)
+
+    # Runs with new models
+    expected = []
+    for random_number_set in [2700, 2701]:
+        random.seed(random_number_set)
+        scenario = Scenario(**kwargs)
+        scenario.set_random_no_set(random_number_set)
+        model = DialysisSim(scenario, inputs)
+        model.run()
+        expected.append(get_audits(model))
+
+    # Runs with one model, reset between runs
+    random.seed(2700)
+    scenario = Scenario(**kwargs)
+    scenario.set_random_no_set(2700)
+    model = DialysisSim(scenario, inputs)
+    model.run()
+    first_run = get_audits(model)
+    random.seed(2701)
+    model.reset(2701)
+    model.run()
+    second_run = get_audits(model)
+
+    for audits, expected_audits in zip([first_run, second_run], expected):
+        for audit, expected_audit in zip(audits, expected_audits):
+            pd.testing.assert_frame_equal(audit, expected_audit)
@@ -0,0 +1,58 @@
+'''
+Order statistics testing
+
+This module contains tests to confirm that OrderStatistics gives the same
+minimum, maximum, total and quantiles as numpy as values are added and
+removed.
+'''
+
+import inspect
+
+import numpy as np
+import pytest
+
+from sim.statistics import OrderStatistics
+
+# numpy 1.22 renamed the quantile interpolation argument to method
+if 'method' in inspect.signature(np.quantile).parameters:
+    LINEAR = {'method': 'linear'}
+else:
+    LINEAR = {'interpolation': 'linear'}
+
+
+def test_matches_numpy():
+    '''
+    Test that order statistics match numpy (quantiles with linear
+    interpolation) after each value is added or removed
+    '''
+    rng = np.random.default_rng(1)
+    statistics = OrderStatistics()
+    held = []
+    for value in rng.integers(0, 30, size=300):
+        if held and rng.random() < 0.4:
+            value = held.pop(rng.integers(len(held)))
+            statistics.remove(value)
+        else:
+            held.append(value)
+            statistics.add(value)
+        assert len(statistics) == len(held)
+        if not held:
+            continue
+        assert statistics.total == sum(held)
+        assert statistics.min() == min(held)
+        assert statistics.max() == max(held)
+        for q in [0, 0.05, 0.25, 0.5, 0.95, 1]:
+            assert np.isclose(statistics.quantile(q), np.quantile(held, q, **LINEAR))
+
+
+def test_remove_missing_value():
+    '''
+    Test that removing a value not held raises ValueError
+    '''
+    statistics = OrderStatistics()
+    statistics.add(5)
+    statistics.remove(5)
+    with pytest.raises(ValueError):
+        statistics.remove(5)
+    with pytest.raises(ValueError):
+        statistics.remove(7)
@@ -0,0 +1,24 @@
+'''
+Unit ranking testing
+
+This module contains tests to confirm that ranking units by travel time for
+all patient locations at once gives the same ranking (including the order of
+tied travel times) as sorting travel times one patient location at a time.
+'''
+
+import pandas as pd
+
+from sim.units import Dialysis_units
+
+
+def test_ranking_matches_row_by_row_sort():
+    '''
+    Test unit preferences match ranking each patient location with
+    Series.sort_values (the original ranking method)
+    '''
+    units = Dialysis_units(None)
+    lookup = units.unit_info[['Location', 'subunit']].set_index('Location')
+
+    for location, travel_times in units.travel_times.iterrows():
+        subunits = lookup.loc[travel_times.sort_values().index, 'subunit']
+        assert list(subunits) == list(units.unit_preferences.loc[location])
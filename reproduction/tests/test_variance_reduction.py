@@ -0,0 +1,82 @@
+'''
+Variance reduction testing
+
+This module contains tests to confirm that common random numbers give each
+patient the same random numbers across scenarios, that all patient randomness
+(including random positives at start) comes from scenario random number
+streams, and that antithetic replication pairs are run consistently.
+'''
+
+import numpy as np
+import pandas as pd
+
+import sim.sim_replicate as sim
+from sim.inputs import ModelInputs
+from sim.model import DialysisSim
+from sim.parameters import Scenario, Uniform
+
+
+def set_up_patients(scenario, random_number_set, inputs):
+    '''
+    Set up model and return patients (in patient order)
+    '''
+    scenario.set_random_no_set(random_number_set)
+    return list(DialysisSim(scenario, inputs).pop.patients.values())
+
+
+def test_common_random_numbers():
+    '''
+    Test that with common random numbers, patients infected (or requiring
+    inpatient care) in two scenarios have the same samples in both
+    '''
+    inputs = ModelInputs.load()
+    low = Scenario(total_proportion_people_infected=0.5,
+                   proportion_pos_requiring_inpatient=0.3, common_random_numbers=True)
+    high = Scenario(total_proportion_people_infected=0.8,
+                    proportion_pos_requiring_inpatient=0.6, common_random_numbers=True)
+
+    for low_patient, high_patient in zip(set_up_patients(low, 2700, inputs),
+                                         set_up_patients(high, 2700, inputs)):
+        assert low_patient.mortality_random == high_patient.mortality_random
+        if low_patient.will_be_infected:
+            assert high_patient.will_be_infected
+            assert low_patient.time_to_infection == high_patient.time_to_infection
+        if low_patient.require_inpatient:
+            assert high_patient.require_inpatient
+            assert low_patient.time_positive == high_patient.time_positive
+            assert low_patient.inpatient_los == high_patient.inpatient_los
+
+
+def test_random_positives_use_streams():
+    '''
+    Test that random positives at start are reproduced by the random number
+    set (without seeding the global random module)
+    '''
+    inputs = ModelInputs.load()
+    scenario = Scenario(random_positive_rate_at_start=0.5)
+    statuses = [[patient.status for patient in set_up_patients(scenario, 2700, inputs)]
+                for run in range(2)]
+    assert statuses[0] == statuses[1]
+    assert 0 < statuses[0].count('positive')
+
+
+def test_antithetic_replications():
+    '''
+    Test antithetic samples are reflected, and antithetic replication pairs
+    give the same audits when run one per task or in chunks
+    '''
+    samples = Uniform(3, 7, random_seed=1).sample(100)
+    antithetic_samples = Uniform(3, 7, random_seed=1, antithetic=True).sample(100)
+    assert np.allclose(samples + antithetic_samples, 10)
+
+    inputs = ModelInputs.load()
+    scenario = Scenario(run_length=60, proportion_pos_requiring_inpatient=0.6)
+    audits = sim.multiple_replications(scenario, 4, 1, 2700, inputs, antithetic=True)
+    chunked_audits = sim.multiple_replications(
+        scenario, 4, 1, 2700, inputs, chunk_size=3, antithetic=True)
+    for audit, chunked_audit in zip(audits, chunked_audits):
+        pd.testing.assert_frame_equal(audit, chunked_audit)
+
+    # Replication 2 uses random number set 2701 (not antithetic)
+    single_audit = sim.single_run(scenario, 2, 2701, inputs)[0]
+    assert np.array_equal(audits[0].loc[2].values, single_audit.drop('day', axis=1).values)